@@ -9,16 +9,75 @@ Separated file to resolve circular imports.
 Tested in bq_operator_test.py
 """
 
-from typing import List, Sequence  # noqa: F401
+from typing import List, Optional, Sequence, Tuple, Union  # noqa: F401
+
+import pandas as pd
 
 from .bq_abstract_syntax_tree import (EvaluatableNode, EvaluatableNodeWithChildren,  # noqa: F401
                                       EvaluationContext)
-from .bq_binary_operators import BINARY_OPERATOR_INFO
-from .bq_types import TypedSeries, implicitly_coerce
+from .bq_binary_operators import BINARY_OPERATOR_INFO, _OperatorInfo  # noqa: F401
+from .bq_types import (BQType, TypedDataFrame, TypedScalar, TypedSeries,  # noqa: F401
+                       column_values, implicitly_coerce)
+from .fused_arithmetic import Program, evaluate_fused, is_fusible  # noqa: F401
+
+
+def _result_type(operator_info, left_type, right_type):
+    # type: (_OperatorInfo, BQType, BQType) -> BQType
+    """Returns the type of the result of applying an operator to operands of some types."""
+    # We need to know the type of the result of the operation.  Some operators specify their
+    # result type (e.g. comparators have a boolean output regardless of input types).  Some
+    # operators keep the type of their inputs (e.g. multiplication keeps the input numerical
+    # types); this is notated in the BINARY_OPERATOR_INFO table by specifying the result_type
+    # as None.  The right thing to do if the types of the inputs aren't the same is to apply
+    # specific logic depending on the input types: see here for the logic for arithmetic
+    # operators:
+    # https://cloud.google.com/bigquery/docs/reference/standard-sql/operators#arithmetic_operators
+    return operator_info.result_type or implicitly_coerce(left_type, right_type)
+
+
+def _apply(operator_info, left_value, right_value):
+    # type: (_OperatorInfo, Union[TypedSeries, TypedScalar], Union[TypedSeries, TypedScalar]) -> TypedSeries  # noqa: E501
+    """Applies an operator to two operands, at least one of them a column."""
+    result_type = _result_type(operator_info, left_value.type_, right_value.type_)
+    result = operator_info.function(column_values(left_value), column_values(right_value))
+    if isinstance(left_value, TypedScalar) or isinstance(right_value, TypedScalar):
+        # As when combining two columns, the result is an unnamed column.
+        result.name = None
+    return TypedSeries(result, result_type)
+
+
+def _evaluate_fused(program, values, index):
+    # type: (Program, List[Union[TypedSeries, TypedScalar]], pd.Index) -> Optional[TypedSeries]
+    """Evaluates a program at once (see fused_arithmetic), or returns None if it can't be fused.
+
+    Args:
+        program: The steps of a tree of operators.
+        values: The tree's operands, including at least one column.
+        index: The index of the operands' columns.
+    Returns:
+        The column the tree evaluates to, with the type and name _apply would give it.
+    """
+    types = [value.type_ for value in values]
+    names = [value.series.name if isinstance(value, TypedSeries) else None for value in values]
+    is_scalar = [isinstance(value, TypedScalar) for value in values]
+    for operator, left, right in program:
+        types.append(_result_type(BINARY_OPERATOR_INFO[operator], types[left], types[right]))
+        # As with pandas, two columns' result keeps their name if they have the same one.
+        names.append(names[left] if not is_scalar[left] and not is_scalar[right]
+                     and names[left] == names[right] else None)
+        is_scalar.append(False)
+    result = evaluate_fused(program, [
+        value.series.values if isinstance(value, TypedSeries) else value.value
+        for value in values])
+    if result is None:
+        return None
+    return TypedSeries(pd.Series(result, index=index, name=names[-1]), types[-1])
 
 
 class BinaryExpression(EvaluatableNodeWithChildren):
 
+    __slots__ = ('children', 'operator_info')
+
     def __init__(self, left, operator_str, right):
         # type: (EvaluatableNode, str, EvaluatableNode) -> None
         self.children = [left, right]
@@ -37,19 +96,78 @@ class BinaryExpression(EvaluatableNodeWithChildren):
                                    left.strexpr(),
                                    right.strexpr())
 
+    def accepts_scalars(self):
+        # type: () -> bool
+        """See parent, EvaluatableNodeWithChildren."""
+        return True
+
     def _evaluate_node(self, evaluated_children):
-        # type: (List[TypedSeries]) -> TypedSeries
+        # type: (List[Union[TypedSeries, TypedScalar]]) -> TypedSeries
         left_value, right_value = evaluated_children
-        # We need to know the type of the result of the operation.  Some operators specify their
-        # result type (e.g. comparators have a boolean output regardless of input types).  Some
-        # operators keep the type of their inputs (e.g. multiplication keeps the input numerical
-        # types); this is notated in the BINARY_OPERATOR_INFO table by specifying the result_type
-        # as None.  The right thing to do if the types of the inputs aren't the same is to apply
-        # specific logic depending on the input types: see here for the logic for arithmetic
-        # operators:
-        # https://cloud.google.com/bigquery/docs/reference/standard-sql/operators#arithmetic_operators
-        result_type = self.operator_info.result_type
-        if not result_type:
-            result_type = implicitly_coerce(left_value.type_, right_value.type_)
-        return TypedSeries(self.operator_info.function(left_value.series, right_value.series),
-                           result_type)
+        return _apply(self.operator_info, left_value, right_value)
+
+    def _is_fused(self):
+        # type: () -> bool
+        """Returns whether this expression is evaluated as part of a tree of fused operators."""
+        return is_fusible(self.operator_info.operator) and not self.is_constant()
+
+    def _add_steps(self, operands, steps):
+        # type: (List[EvaluatableNode], List[Tuple[str, int, int]]) -> int
+        """Adds the steps of the fused tree rooted here to a program.
+
+        Args:
+            operands: The tree's operands found so far; this subtree's are appended.
+            steps: The steps so far; this subtree's are appended.  Their operands are referred to
+                by position in operands, and earlier steps' results by -1 - their position in
+                steps.
+        Returns:
+            The reference to the result of this subtree's last step.
+        """
+        references = []  # type: List[int]
+        for child in self.children:
+            if isinstance(child, BinaryExpression) and child._is_fused():
+                references.append(child._add_steps(operands, steps))
+            else:
+                references.append(len(operands))
+                operands.append(child)
+        steps.append((self.operator_info.operator, references[0], references[1]))
+        return -len(steps)
+
+    def _evaluate_uncached(self, context):
+        # type: (EvaluationContext) -> Union[TypedDataFrame, TypedSeries]
+        """See parent, EvaluatableNodeWithChildren.
+
+        A tree of arithmetic, comparison and boolean operators is evaluated at once, over its
+        operands' arrays (see fused_arithmetic), if they are numeric columns of the same rows.
+        Otherwise, or for a single operator, each operator is applied in turn.
+        """
+        operands = []  # type: List[EvaluatableNode]
+        steps = []  # type: List[Tuple[str, int, int]]
+        if self._is_fused():
+            self._add_steps(operands, steps)
+        if len(steps) < 2:
+            return super(BinaryExpression, self)._evaluate_uncached(context)
+        # Number the steps' results after the operands, as fused_arithmetic expects.
+        program = tuple(
+                (operator, left if left >= 0 else len(operands) - 1 - left,
+                 right if right >= 0 else len(operands) - 1 - right)
+                for operator, left, right in steps)  # type: Program
+
+        scalars = [operand.constant_scalar() for operand in operands]
+        values = self._ensure_fully_evaluated(
+                [scalar if scalar is not None else operand.evaluate(context)
+                 for operand, scalar in zip(operands, scalars)])
+
+        columns = [value.series for value in values if isinstance(value, TypedSeries)]
+        if all(isinstance(column, pd.Series) and column.index.equals(columns[0].index)
+               for column in columns):
+            result = _evaluate_fused(program, values, columns[0].index)
+            if result is not None:
+                return result
+
+        # Apply the operators one at a time.
+        results = list(values)
+        for operator, left, right in program:
+            result = _apply(BINARY_OPERATOR_INFO[operator], results[left], results[right])
+            results.append(result)
+        return result
@@ -5,15 +5,17 @@
 
 '''Abstract Syntax Tree.  Each node is an operator or operand.'''
 import collections
+import copy
 import uuid
 from abc import ABCMeta, abstractmethod
 from typing import (Any, Callable, Dict, List, NamedTuple, Optional, Sequence, Set,  # noqa: F401
                     Tuple, Union, cast)
 
+import numpy as np  # noqa: F401
 import pandas as pd
 import six
 
-from .bq_types import BQScalarType, BQType, TypedDataFrame, TypedSeries  # noqa: F401
+from .bq_types import BQScalarType, BQType, TypedDataFrame, TypedScalar, TypedSeries  # noqa: F401
 from .storage import TableContext
 
 NoneType = type(None)
@@ -22,10 +24,34 @@ DatasetType = Dict[str, Dict[str, Dict[str, TypedDataFrame]]]
 # Table name for columns that come from evaluating selectors and intermediate expressions.
 _SELECTOR_TABLE = '__selector__'
 
+# The names of the attributes of each syntax tree node class declared in __slots__, in order.
+_SLOT_NAMES = {}  # type: Dict[type, List[str]]
+
 
 class AbstractSyntaxTreeNode(object):
     '''Base class for AST nodes.'''
 
+    __slots__ = ()  # type: Tuple[str, ...]
+
+    def attributes(self):
+        # type: () -> List[Tuple[str, Any]]
+        '''Returns the names and values of this node's attributes.
+
+        Nodes are either declared with __slots__, or keep their attributes in a __dict__.  Slots
+        whose names start with an underscore cache values computed from the other attributes, and
+        are not included.
+        '''
+        cls = type(self)
+        names = _SLOT_NAMES.get(cls)
+        if names is None:
+            names = [name for klass in reversed(cls.__mro__)
+                     for name in klass.__dict__.get('__slots__', ()) if not name.startswith('_')]
+            _SLOT_NAMES[cls] = names
+        items = [(name, getattr(self, name)) for name in names if hasattr(self, name)]
+        if hasattr(self, '__dict__'):
+            items.extend(six.iteritems(vars(self)))
+        return items
+
     def __repr__(self):
         # type: () -> str
         '''Returns a string representation of this object
@@ -40,7 +66,7 @@ class AbstractSyntaxTreeNode(object):
         return '{}({})'.format(
             self.__class__.__name__,
             ', '.join(sorted('{}={!r}'.format(key, value)
-                             for key, value in six.iteritems(vars(self))
+                             for key, value in self.attributes()
                              if value is not EMPTY_NODE)))
 
     def strexpr(self):
@@ -48,7 +74,7 @@ class AbstractSyntaxTreeNode(object):
         '''Return a prefix-expression serialization for testing purposes.'''
 
         return '({} {})'.format(self.__class__.__name__.upper(),
-                                ' '.join(a.strexpr() for a in six.itervalues(vars(self))))
+                                ' '.join(a.strexpr() for unused_name, a in self.attributes()))
 
     @classmethod
     def literal(cls):
@@ -76,6 +102,8 @@ class MarkerSyntaxTreeNode(AbstractSyntaxTreeNode):
     '''Parent class for abstract syntax tree nodes whose syntax starts with the class name.
     See AbstractSyntaxTreeNode.literal()'''
 
+    __slots__ = ()
+
     @classmethod
     def literal(cls):
         # type: () -> Optional[str]
@@ -83,10 +111,50 @@ class MarkerSyntaxTreeNode(AbstractSyntaxTreeNode):
 
 
 class EvaluatableNode(AbstractSyntaxTreeNode):
-    '''Abstract base class for syntax tree nodes that can be evaluated to return a column of data'''
+    '''Abstract base class for syntax tree nodes that can be evaluated to return a column of data
+
+    Expressions are immutable: each attribute is set once, by the constructor, and transforming an
+    expression (e.g. see copy and mark_grouped_by) builds a new one.  This lets an expression be
+    shared by several trees, or several times in one (see intern_expressions).  They are compared
+    and hashed by their structure (see structural_key).
+    '''
 
     __metaclass__ = ABCMeta
 
+    # The structural key and its hash, computed when first needed.
+    __slots__ = ('_key', '_hash')
+
+    def __setattr__(self, name, value):
+        # type: (str, Any) -> None
+        if hasattr(self, name):
+            raise AttributeError("Can't set attribute {} of {!r}; expressions are immutable"
+                                 .format(name, self))
+        super(EvaluatableNode, self).__setattr__(name, value)
+
+    def __eq__(self, other):
+        # type: (Any) -> bool
+        if self is other:
+            return True
+        if not isinstance(other, EvaluatableNode):
+            return NotImplemented
+        key = self.structural_key()
+        return key is not None and key == other.structural_key()
+
+    def __ne__(self, other):
+        # type: (Any) -> bool
+        equal = self.__eq__(other)
+        return equal if equal is NotImplemented else not equal
+
+    def __hash__(self):
+        # type: () -> int
+        try:
+            return self._hash
+        except AttributeError:
+            pass
+        key = self.structural_key()
+        self._hash = hash(key) if key is not None else id(self)  # type: int
+        return self._hash
+
     @abstractmethod
     def evaluate(self, context):
         # type: (EvaluationContext) -> Union[TypedDataFrame, TypedSeries]
@@ -148,15 +216,58 @@ class EvaluatableNode(AbstractSyntaxTreeNode):
         '''Returns true if this expression is the same when evaluated in any context.'''
         return True
 
+    def constant_scalar(self):
+        # type: () -> Optional[TypedScalar]
+        '''Returns the value of this expression if it is a non-NULL literal, else None.
+
+        See EvaluatableNodeWithChildren.accepts_scalars.
+        '''
+        return None
+
     def is_aggregated(self):
         # type: () -> bool
         '''Returns true if this expression contains any aggregation.'''
         return False
 
+    def structural_key(self):
+        # type: () -> Optional[Tuple[Any, ...]]
+        '''Returns a hashable key identifying this expression by its structure.
+
+        Expressions with equal keys are written the same way, up to the aliases of selectors, and
+        so evaluate to the same column in the same context.  None is returned if evaluating the
+        expression twice may not give the same result, e.g. if it calls CURRENT_TIMESTAMP, or if it
+        contains a subquery.
+        '''
+        try:
+            return self._key
+        except AttributeError:
+            pass
+        items = []  # type: Optional[List[Tuple[str, Any]]]
+        for attribute, value in self.attributes():
+            key = _structural_key(value)
+            if key is None:
+                items = None
+                break
+            items.append((attribute, key))
+        self._key = (  # type: Optional[Tuple[Any, ...]]
+            (type(self),) + tuple(items) if items is not None else None)
+        return self._key
+
+    def depends_on_other_rows(self):
+        # type: () -> bool
+        '''Returns true if this expression's value for a row may depend on the table's other rows.
+
+        This is the case for aggregations and analytic functions; other expressions are evaluated
+        row by row, so they can be evaluated on just some of a table's rows.
+        '''
+        return False
+
 
 class EvaluatableLeafNode(EvaluatableNode):
     '''Abstract Syntax Tree Node that can be evaluated and has no child nodes.'''
 
+    __slots__ = ()
+
     def evaluate(self, context):
         # type: (EvaluationContext) -> Union[TypedSeries, TypedDataFrame]
         '''See docstring in EvaluatableNode.evaluate'''
@@ -189,7 +300,13 @@ class EvaluatableLeafNode(EvaluatableNode):
 
 
 class EvaluatableNodeWithChildren(EvaluatableNode):
-    '''Abstract Syntax Tree node that can be evaluated, based on child nodes.'''
+    '''Abstract Syntax Tree node that can be evaluated, based on child nodes.
+
+    Subclasses declare the children attribute in their __slots__, along with their other
+    attributes.
+    '''
+
+    __slots__ = ()
 
     def __init__(self, children):
         # type: (Sequence[EvaluatableNode]) -> None
@@ -198,6 +315,10 @@ class EvaluatableNodeWithChildren(EvaluatableNode):
     def pre_group_by_partially_evaluate(self, context):
         # type: (EvaluationContext) -> Union[TypedSeries, EvaluatableNode]
         '''See docstring in EvaluatableNode.pre_group_by_partially_evaluate'''
+        if not self.is_aggregated():
+            # Nothing in this expression waits for the GROUP BY; it is evaluated in full, so that
+            # its value is shared with the same expression elsewhere in the query.
+            return cast(TypedSeries, self.evaluate(context))
         evaluated_children = [child.pre_group_by_partially_evaluate(context)
                               for child in self.children]
 
@@ -207,7 +328,7 @@ class EvaluatableNodeWithChildren(EvaluatableNode):
         # - a * 2
         # - concat(foo, "/", bar)
         if all(isinstance(child, TypedSeries) for child in evaluated_children):
-            return self._evaluate_node(cast(List[TypedSeries], evaluated_children))
+            return self._evaluate_node(evaluated_children)
 
         # Expressions whose children are not fully evaluated should not keep the caches of partial
         # evaluation; not being fully evaluated means that this expression is outside of
@@ -226,12 +347,24 @@ class EvaluatableNodeWithChildren(EvaluatableNode):
                 for child, evaluated_child in zip(self.children, evaluated_children)])
 
     def _ensure_fully_evaluated(self, evaluated_children):
-        # type: (List[Any]) -> List[TypedSeries]
+        # type: (List[Any]) -> List[Union[TypedSeries, TypedScalar]]
         '''Ensure evaluated_children are fully evaluated; raise ValueError if not.'''
-        if not all(isinstance(child, TypedSeries) for child in evaluated_children):
+        if not all(isinstance(child, (TypedSeries, TypedScalar)) for child in evaluated_children):
             raise ValueError(
                     "In order to evaluate {}, all children must be evaluated.".format(self))
-        return cast(List[TypedSeries], evaluated_children)
+        return evaluated_children
+
+    def accepts_scalars(self):
+        # type: () -> bool
+        '''Returns true if _evaluate_node can be given TypedScalars for literal children.
+
+        Evaluating a literal into a column means building a column of identical values as long as
+        the table.  Expressions that accept scalars are instead given a TypedScalar for each
+        literal child, and apply its value directly to their other children's columns, relying on
+        pandas to broadcast it.  They are always given at least one column, so that their result is
+        a column too; if all their children are literals, all of them are evaluated into columns.
+        '''
+        return False
 
     def evaluate(self, context):
         # type: (EvaluationContext) -> Union[TypedDataFrame, TypedSeries]
@@ -246,15 +379,28 @@ class EvaluatableNodeWithChildren(EvaluatableNode):
         Returns:
             A new table (TypedDataFrame) or column (TypedSeries)
         '''
-        evaluated_children = [child.evaluate(context) for child in self.children]
+        return context.evaluate_once(self, lambda: self._evaluate_uncached(context))
+
+    def _evaluate_uncached(self, context):
+        # type: (EvaluationContext) -> Union[TypedDataFrame, TypedSeries]
+        '''Evaluates this expression's children, then the expression itself from them.'''
+        scalars = ([child.constant_scalar() for child in self.children]
+                   if self.accepts_scalars() else [])
+        if not any(scalar is None for scalar in scalars):
+            # There is no column to broadcast literals to.
+            scalars = [None] * len(self.children)
+        evaluated_children = [scalar if scalar is not None else child.evaluate(context)
+                              for child, scalar in zip(self.children, scalars)]
         return self._evaluate_node(self._ensure_fully_evaluated(evaluated_children))
 
     @abstractmethod
     def _evaluate_node(self, evaluated_children):
-        # type: (List[TypedSeries]) -> TypedSeries
+        # type: (List[Any]) -> TypedSeries
         '''Computes a new column based on the evaluated arguments to this expression.
 
-        This method must be overriden by all subclasses.
+        This method must be overriden by all subclasses.  Subclasses declare the type of
+        evaluated_children: a list of TypedSeries, or of TypedSeries and TypedScalars if they accept
+        scalars.
 
         Args:
             evaluated_children: The already-evaluated children of this node.
@@ -302,6 +448,11 @@ class EvaluatableNodeWithChildren(EvaluatableNode):
         '''See parent class for docstring.'''
         return any(child.is_aggregated() for child in self.children)
 
+    def depends_on_other_rows(self):
+        # type: () -> bool
+        '''See parent class for docstring.'''
+        return any(child.depends_on_other_rows() for child in self.children)
+
 
 class EvaluatableNodeThatAggregatesOrGroups(EvaluatableNodeWithChildren):
     '''Abstract Syntax Tree node that can be evaluated that aggregates child nodes.
@@ -313,18 +464,21 @@ class EvaluatableNodeThatAggregatesOrGroups(EvaluatableNodeWithChildren):
     are not themselves aggregated.
     '''
 
+    __slots__ = ()
+
     def pre_group_by_partially_evaluate(self, context):
         # type: (EvaluationContext) -> Union[TypedSeries, EvaluatableNode]
         '''See docstring in EvaluatableNode.pre_group_by_partially_evaluate'''
         # aggregating and grouped by expressions must fully evaluate children, then we cache
         # those expressions into the context and return a new AST node that computes the aggregate
         # over lookups from the cache (which will be grouped in the second-pass evaluation).
-        evaluated_children = self._ensure_fully_evaluated(
-            [child.pre_group_by_partially_evaluate(context)
-             for child in self.children])
-        return self.copy(
-                [Field(context.maybe_add_column(evaluated_child))
-                 for evaluated_child in evaluated_children])
+        evaluated_children = [child.pre_group_by_partially_evaluate(context)
+                              for child in self.children]
+        columns = [child for child in evaluated_children if isinstance(child, TypedSeries)]
+        if len(columns) != len(evaluated_children):
+            raise ValueError(
+                    "In order to evaluate {}, all children must be evaluated.".format(self))
+        return self.copy([Field(context.maybe_add_column(column)) for column in columns])
 
     def mark_grouped_by(self, group_by_paths, context):
         # type: (Sequence[Tuple[str, ...]], EvaluationContext) -> EvaluatableNode
@@ -348,6 +502,11 @@ class EvaluatableNodeThatAggregatesOrGroups(EvaluatableNodeWithChildren):
         '''See parent class for docstring.'''
         return True
 
+    def depends_on_other_rows(self):
+        # type: () -> bool
+        '''See parent class for docstring.'''
+        return True
+
 
 class Result(object):
     '''Result of executing a query or statement.'''
@@ -386,6 +545,26 @@ class DataframeNode(AbstractSyntaxTreeNode):
             this table
         '''
 
+    def get_first_rows(self, table_context, num_rows, outer_context=None):
+        # type: (TableContext, int, Optional[EvaluationContext]) -> Tuple[TypedDataFrame, Optional[str]]  # noqa: E501
+        '''Returns only the first rows of the table that get_dataframe would return.
+
+        This is used to push a LIMIT down into a query.  By default, the whole table is computed
+        and then truncated; subclasses override this to avoid computing rows that would be thrown
+        away.
+
+        Args:
+            table_context: All the tables in the database
+            num_rows: The number of rows to return (fewer if the table has fewer)
+            outer_context: Context of a containing query (e.g. an EXISTS expression)
+
+        Returns:
+            Tuple of the first rows of the resulting table (TypedDataFrame) and a name for
+            this table
+        '''
+        table, name = self.get_dataframe(table_context, outer_context)
+        return TypedDataFrame(table.dataframe.iloc[:num_rows], table.types), name
+
     def execute(self, table_context):
         # type: (TableContext) -> Result
         '''Executes the query
@@ -412,6 +591,8 @@ class GroupedBy(EvaluatableNodeThatAggregatesOrGroups):
     containing those constant elements.
     '''
 
+    __slots__ = ('children',)
+
     def __init__(self, expression):
         self.children = [expression]
 
@@ -434,6 +615,9 @@ class Field(EvaluatableLeafNode):
     For example, in a table Table with columns A, B, and C,
     a valid Field path would be ('B',) or ('Table', 'A').
     '''
+
+    __slots__ = ('path',)
+
     def __init__(self, path):
         # type: (Tuple[str, ...]) -> None
         '''Set up Field node
@@ -442,7 +626,7 @@ class Field(EvaluatableLeafNode):
             path: A tuple of strings describing the path to this field
                 (just the column name, or table.column)
         '''
-        self.path = path
+        self.path = tuple(path)
 
     def strexpr(self):
         # type: () -> str
@@ -465,12 +649,6 @@ class Field(EvaluatableLeafNode):
         result.series.name = self.name()
         return result
 
-    def __eq__(self, other):
-        # type: (Any) -> bool
-        if isinstance(other, Field):
-            return self.path == other.path
-        return False
-
     def is_constant(self):
         # type: () -> bool
         return False
@@ -479,6 +657,8 @@ class Field(EvaluatableLeafNode):
 class _EmptyNode(AbstractSyntaxTreeNode):
     '''An Empty syntax tree node; represents an optional element not present.'''
 
+    __slots__ = ()
+
     def strexpr(self):
         # type: () -> str
         return 'null'
@@ -487,12 +667,99 @@ class _EmptyNode(AbstractSyntaxTreeNode):
 EMPTY_NODE = _EmptyNode()
 
 
-class EvaluationContext:
+def _structural_key(value):
+    # type: (Any) -> Any
+    '''Returns a hashable key for an attribute of an expression, or None if it has none.
+
+    See EvaluatableNode.structural_key.
+    '''
+    if isinstance(value, EvaluatableNode):
+        return value.structural_key()
+    if isinstance(value, _EmptyNode):
+        return _EmptyNode
+    if isinstance(value, AbstractSyntaxTreeNode):
+        # A subquery; it is not worth comparing.
+        return None
+    if isinstance(value, (list, tuple)):
+        keys = tuple(_structural_key(element) for element in value)
+        if any(key is None for key in keys):
+            return None
+        return (type(value),) + keys
+    try:
+        hash(value)
+    except TypeError:
+        return None
+    return (type(value), value)
+
+
+def _intern(value, interned):
+    # type: (Any, Dict[EvaluatableNode, EvaluatableNode]) -> Any
+    '''Interns the expressions in a syntax tree node, or a list or tuple of them.
+
+    See intern_expressions.
+    '''
+    if isinstance(value, EvaluatableNode):
+        if isinstance(value, EvaluatableNodeWithChildren):
+            children = [_intern(child, interned) for child in value.children]
+            if any(new is not old for new, old in zip(children, value.children)):
+                value = value.copy(children)
+        else:
+            # The subquery of an EXISTS.
+            for unused_name, attribute in value.attributes():
+                if isinstance(attribute, AbstractSyntaxTreeNode):
+                    _intern(attribute, interned)
+        if value.structural_key() is None:
+            return value
+        return interned.setdefault(value, value)
+    if isinstance(value, AbstractSyntaxTreeNode):
+        for name, attribute in value.attributes():
+            new_attribute = _intern(attribute, interned)
+            if new_attribute is not attribute:
+                setattr(value, name, new_attribute)
+        return value
+    if isinstance(value, list):
+        return [_intern(element, interned) for element in value]
+    if isinstance(value, tuple):
+        new_value = tuple(_intern(element, interned) for element in value)
+        # Only rebuild tuples that contained an expression, so that e.g. named tuples are kept.
+        if all(new is old for new, old in zip(new_value, value)):
+            return value
+        return new_value
+    return value
+
+
+def intern_expressions(node):
+    # type: (AbstractSyntaxTreeNode) -> AbstractSyntaxTreeNode
+    '''Makes the expressions of a syntax tree that are the same share one instance.
+
+    Large generated queries tend to repeat expressions many times; each is then only kept in memory
+    once, and compares equal to its other occurrences by identity.
+
+    Args:
+        node: The abstract syntax tree of a query or statement.  Its nodes that aren't expressions
+            are modified in place.
+    Returns:
+        The same tree, for convenience.
+    '''
+    return _intern(node, {})
+
+
+# Where a field's column is: in the table of an evaluation context (0 for the context itself, 1 for
+# its subcontext, 2 for the subcontext's subcontext, ...), under a key, with a type.
+FieldBinding = NamedTuple('FieldBinding', [('depth', int), ('key', str), ('type_', BQType)])
+
+
+class EvaluationContext(object):
     '''Context for resolving a name to a column (TypedSeries).
 
     An EvaluationContext is a representation of columns in all the tables that
     are in the query's scope.  Typically used in the context of SELECT, WHERE, etc.
 
+    The columns of intermediate expressions added to a context (see maybe_add_column) are kept
+    apart, by name, and only joined into its table when the table itself is needed.  Likewise,
+    filtering a context (see select_rows) only records the positions of the rows kept; each column
+    is gathered at those positions when it's looked up.
+
     Contrast with TableContext, whose purpose is to resolve a name to a table (TypedDataFrame),
     and contains all the tables (all the data) that is available in the database.
     '''
@@ -507,7 +774,20 @@ class EvaluationContext:
 
         # We don't want an actual empty dataframe because with no FROMed tables, we
         # still want to return a single row of results.
-        self.table = TypedDataFrame(pd.DataFrame([[1]]), [None])  # type: TypedDataFrame
+        self._table = TypedDataFrame(pd.DataFrame([[1]]), [None])  # type: TypedDataFrame
+
+        # The columns added to the table since it was set, by name; they have the table's index.
+        self._added_columns = collections.OrderedDict()  # type: Dict[str, TypedSeries]
+
+        # Identifies the rows of the table.  It is replaced whenever the table is set, but not when
+        # columns are added to it.
+        self._rows = object()
+
+        # The positions of the rows of the table that are in this context, if not all of them (see
+        # EvaluationContext.select_rows), and the columns of the table gathered at those positions
+        # so far, by name.
+        self._selection = None  # type: Optional[np.ndarray]
+        self._gathered_columns = {}  # type: Dict[str, pd.Series]
 
         # Mapping of column ID (prefixed by table ID) to its type
         self.canonical_column_to_type = {}  # type: Dict[str, BQType]
@@ -540,6 +820,100 @@ class EvaluationContext:
         # a path (_SELECTOR_TABLE, name)
         self.selector_names = []  # type: List[str]
 
+        # The bindings of the paths of fields looked up in this context (see
+        # EvaluationContext.bind).
+        self._field_bindings = {}  # type: Dict[Tuple[str, ...], FieldBinding]
+
+        # The columns that expressions evaluated to (see EvaluationContext.evaluate_once), and the
+        # rows they were evaluated on.
+        self._evaluated_columns = {}  # type: Dict[EvaluatableNode, TypedSeries]
+        self._evaluated_columns_rows = None  # type: Optional[object]
+
+    @property
+    def table(self):
+        # type: () -> TypedDataFrame
+        '''The rows in this context, with the columns of all its tables.'''
+        if self._selection is not None:
+            self._table = TypedDataFrame(self._table.dataframe.take(self._selection),
+                                         self._table.types)
+            self._selection = None
+            self._gathered_columns = {}
+        if self._added_columns:
+            added_columns = list(self._added_columns.values())
+            dataframe = pd.concat(
+                    [self._table.dataframe] + [column.series for column in added_columns], axis=1)
+            # The added columns may have been renamed since, by their consumers.
+            dataframe.columns = list(self._table.dataframe.columns) + list(self._added_columns)
+            self._table = TypedDataFrame(
+                    dataframe, self._table.types + [column.type_ for column in added_columns])
+            self._added_columns = collections.OrderedDict()
+        return self._table
+
+    @table.setter
+    def table(self, table):
+        # type: (TypedDataFrame) -> None
+        self._table = table
+        self._added_columns = collections.OrderedDict()
+        self._rows = object()
+        self._selection = None
+        self._gathered_columns = {}
+
+    @property
+    def index(self):
+        # type: () -> pd.Index
+        '''The index of the rows (or, if grouped, of the groups) in this context.'''
+        dataframe = self._table.dataframe
+        if isinstance(dataframe, pd.core.groupby.DataFrameGroupBy):
+            return dataframe.size().index
+        if self._selection is not None:
+            return dataframe.index[self._selection]
+        return dataframe.index
+
+    @property
+    def num_rows(self):
+        # type: () -> int
+        '''The number of rows in this context (before grouping, if grouped).'''
+        dataframe = self._table.dataframe
+        if isinstance(dataframe, pd.core.groupby.DataFrameGroupBy):
+            return len(dataframe.obj)
+        if self._selection is not None:
+            return len(self._selection)
+        return len(dataframe)
+
+    def select_rows(self, positions):
+        # type: (np.ndarray) -> None
+        '''Keeps only some of the rows in this context, e.g. those satisfying a WHERE condition.
+
+        No column is copied: the columns of the table are gathered at the positions of the rows
+        kept as they are looked up, so the columns that are never looked up afterwards are never
+        gathered.  Reading the context's table gathers all of them.
+
+        Args:
+            positions: The positions of the rows to keep, among the rows in the context, in order.
+        '''
+        if isinstance(self._table.dataframe, pd.core.groupby.DataFrameGroupBy):
+            raise ValueError("Can't select rows of a grouped context")
+        self._added_columns = collections.OrderedDict(
+                (key, TypedSeries(column.series.take(positions), column.type_))
+                for key, column in self._added_columns.items())
+        self._selection = positions if self._selection is None else self._selection[positions]
+        self._gathered_columns = {}
+        self._rows = object()
+
+    def with_selected_rows(self, positions):
+        # type: (np.ndarray) -> EvaluationContext
+        '''Returns a copy of this context with only some of its rows (see select_rows).
+
+        The copy shares this context's tables, subcontext and field bindings; this context keeps
+        all its rows.
+
+        Args:
+            positions: The positions of the rows to keep, among the rows in the context, in order.
+        '''
+        context = copy.copy(self)
+        context.select_rows(positions)
+        return context
+
     def add_subcontext(self, subcontext):
         # type: (EvaluationContext) -> None
         '''Adds another context to this one.
@@ -554,6 +928,7 @@ class EvaluationContext:
         if self.subcontext is not None:
             raise ValueError("Context already has subcontext {}!".format(self.subcontext))
         self.subcontext = subcontext
+        self._field_bindings = {}
 
     def maybe_add_column(self, column):
         # type: (TypedSeries) -> Tuple[str, ...]
@@ -585,13 +960,49 @@ class EvaluationContext:
             # We already know about this name; don't need to add to context.
             return canonical_paths[0]
         self.column_to_table_ids[name] = [canonical_path[0]]
+        # The name may have referred to a column of a subcontext until now.
+        self._field_bindings.pop((name,), None)
         column.series.name = '.'.join(canonical_path)
         self.canonical_column_to_type[column.series.name] = column.type_
-        self.table = TypedDataFrame(
-                pd.concat([self.table.dataframe, column.series], axis=1),
-                self.table.types + [column.type_])
+        # Rather than copying the whole table into a new one with this column, the column is kept
+        # apart until the table is needed.
+        self._added_columns[column.series.name] = column
         return canonical_path
 
+    def evaluate_once(self, expression, evaluate):
+        # type: (EvaluatableNode, Callable[[], Union[TypedDataFrame, TypedSeries]]) -> Union[TypedDataFrame, TypedSeries]  # noqa: E501
+        '''Evaluates an expression, unless the same expression was already evaluated on this table.
+
+        A query often repeats an expression, e.g. in its SELECT and WHERE clauses, or in two
+        aggregations.  Within a context, each distinct expression is evaluated only once, as long as
+        the context's table is not replaced, e.g. filtered by WHERE.
+
+        Args:
+            expression: The expression.  Expressions are the same if their structural keys are
+                equal (see EvaluatableNode.structural_key); one without a key is evaluated every
+                time.
+            evaluate: A function evaluating the expression.
+        Returns:
+            The table or column the expression evaluates to.
+        '''
+        # Contexts without tables, like EMPTY_CONTEXT, are a single row and may be shared between
+        # queries; they don't keep their evaluated columns.
+        if not self.table_ids or expression.structural_key() is None:
+            return evaluate()
+        if self._evaluated_columns_rows is not self._rows:
+            self._evaluated_columns = {}
+            self._evaluated_columns_rows = self._rows
+        column = self._evaluated_columns.get(expression)
+        if column is not None:
+            # Columns are renamed by their consumers (see Selector and maybe_add_column), so each
+            # is given its own copy; the data itself is shared.
+            return TypedSeries(column.series.copy(deep=False), column.type_)
+        result = evaluate()
+        if isinstance(result, TypedSeries) and isinstance(result.series, pd.Series):
+            self._evaluated_columns[expression] = TypedSeries(result.series.copy(deep=False),
+                                                              result.type_)
+        return result
+
     def _partially_evaluate(self, selector, group_by_paths):
         # type: (EvaluatableNode, Sequence[Tuple[str, ...]]) -> EvaluatableNode
         """Partially evaluates a selector in preparation for group by."""
@@ -682,12 +1093,13 @@ class EvaluationContext:
             self.table_to_column_ids[table_id].append(column_name)
 
         self.table_ids.add(table_id)
+        self._field_bindings = {}
 
-        # Rename columns in format "[new_table_id].[column_name]"
-        table = TypedDataFrame(
-            table.dataframe.rename(
-                columns=lambda column_name: '{}.{}'.format(table_id, column_name.split('.')[-1])),
-            table.types)
+        # Rename columns in format "[new_table_id].[column_name]"; the data isn't copied.
+        dataframe = table.dataframe.copy(deep=False)
+        dataframe.columns = ['{}.{}'.format(table_id, column.split('.')[-1])
+                             for column in table.dataframe.columns]
+        table = TypedDataFrame(dataframe, table.types)
 
         # Save mapping of column ID to type
         if len(table.dataframe.columns) != len(table.types):
@@ -723,6 +1135,8 @@ class EvaluationContext:
         new_context.group_by_paths = old_context.group_by_paths
         new_context.subcontext = old_context.subcontext
         new_context.exclude_aggregation = old_context.exclude_aggregation
+        # The columns are the same, so the bindings of fields to them are too.
+        new_context._field_bindings = old_context._field_bindings
         return new_context
 
     def get_all_canonical_paths(self, path):
@@ -776,6 +1190,66 @@ class EvaluationContext:
             raise ValueError("field {} is ambiguous: present in {!r}".format(field, all_paths))
         return all_paths[0]
 
+    def bind(self, path):
+        # type: (Tuple[str, ...]) -> FieldBinding
+        '''Resolves a path to the column it refers to.
+
+        The path is canonicalized, and the context holding its column (this one or a subcontext)
+        and the column's type are found.  The binding is kept, so that later lookups of the path
+        fetch the column directly.
+
+        Args:
+            path: Path to the column, as a tuple of strings
+        Returns:
+            Where to find the column.
+        Raises:
+            ValueError: if the path is ambiguous or not present in any table.
+            KeyError: if the path's column is missing from the table or its type.
+        '''
+        binding = self._field_bindings.get(path)
+        if binding is not None:
+            return binding
+        key = '.'.join(self.get_canonical_path(path))
+
+        # First, try looking up the path in the current context.  If the path is not found,
+        # it's not an error (yet), as we continue on and look in the subcontext, if one exists.
+        dataframe = self._table.dataframe
+        columns = (dataframe.obj.columns if isinstance(dataframe, pd.core.groupby.DataFrameGroupBy)
+                   else dataframe.columns)
+        if key in columns or key in self._added_columns:
+            try:
+                type_ = self.canonical_column_to_type[key]
+            except KeyError:
+                raise KeyError(("path {!r} (canonicalized to key {!r}) not present in type dict; "
+                                "columns available: {!r}").format(
+                                        path, key, list(self.canonical_column_to_type.keys())))
+            binding = FieldBinding(0, key, type_)
+        elif self.subcontext:
+            depth, key, type_ = self.subcontext.bind(path)
+            binding = FieldBinding(depth + 1, key, type_)
+        else:
+            raise KeyError(("path {!r} (canonicalized to key {!r}) not present in table; "
+                            "columns available: {!r}").format(path, key,
+                                                              list(self.table.dataframe)))
+        self._field_bindings[path] = binding
+        return binding
+
+    def bind_fields(self, expressions):
+        # type: (Sequence[EvaluatableNode]) -> None
+        '''Binds the fields that some expressions refer to, ahead of evaluating them.
+
+        This raises the errors of fields that can't be resolved (see bind) before any expression
+        is evaluated.  The fields of subqueries are bound in their own contexts.
+
+        Args:
+            expressions: Expressions that will be evaluated in this context.
+        '''
+        for expression in expressions:
+            if isinstance(expression, Field):
+                self.bind(expression.path)
+            elif isinstance(expression, EvaluatableNodeWithChildren):
+                self.bind_fields(expression.children)
+
     def lookup(self, path):
         # type: (Tuple[str, ...]) -> TypedSeries
         '''
@@ -786,26 +1260,35 @@ class EvaluationContext:
         Returns:
             A TypedSeries representing the requested column, or a KeyError if not found
         '''
-        key = '.'.join(self.get_canonical_path(path))
-
-        # First, try looking up the path in the current context.  If the path is not found,
-        # it's not an error (yet), as we continue on and look in the subcontext, if one exists.
-        try:
-            series = self.table.dataframe[key]
-        except KeyError:
-            if self.subcontext:
-                return self.subcontext.lookup(path)
-            else:
-                raise KeyError(("path {!r} (canonicalized to key {!r}) not present in table; "
-                                "columns available: {!r}").format(path, key,
-                                                                  list(self.table.dataframe)))
+        binding = self.bind(path)
         try:
-            type_ = self.canonical_column_to_type[key]
+            return TypedSeries(self._fetch(binding), binding.type_)
         except KeyError:
-            raise KeyError(("path {!r} (canonicalized to key {!r}) not present in type dict; "
-                            "columns available: {!r}").format(
-                                    path, key, list(self.canonical_column_to_type.keys())))
-        return TypedSeries(series, type_)
+            # A table was replaced by one without the column since the path was bound; bind it
+            # again.
+            context = self  # type: Optional[EvaluationContext]
+            while context is not None:
+                context._field_bindings.pop(path, None)
+                context = context.subcontext
+            binding = self.bind(path)
+            return TypedSeries(self._fetch(binding), binding.type_)
+
+    def _fetch(self, binding):
+        # type: (FieldBinding) -> pd.Series
+        '''Returns the column of a binding.'''
+        context = self
+        for unused_level in range(binding.depth):
+            context = cast(EvaluationContext, context.subcontext)
+        added_column = context._added_columns.get(binding.key)
+        if added_column is not None:
+            return added_column.series
+        if context._selection is None:
+            return context._table.dataframe[binding.key]
+        column = context._gathered_columns.get(binding.key)
+        if column is None:
+            column = context._table.dataframe[binding.key].take(context._selection)
+            context._gathered_columns[binding.key] = column
+        return column
 
 
 EMPTY_CONTEXT = EvaluationContext(TableContext())
@@ -6,13 +6,19 @@
 import unittest
 from typing import List, Tuple, Type, Union  # noqa: F401
 
+import numpy as np
 import pandas as pd
 from ddt import data, ddt, unpack
 
+from purplequery.binary_expression import BinaryExpression
 from purplequery.bq_abstract_syntax_tree import (EMPTY_NODE, AbstractSyntaxTreeNode,  # noqa: F401
-                                                 EvaluationContext, TableContext, _EmptyNode)
+                                                 EvaluatableNode, EvaluationContext, Field,
+                                                 FieldBinding, TableContext, _EmptyNode,
+                                                 intern_expressions)
 from purplequery.bq_types import BQScalarType, TypedDataFrame
-from purplequery.dataframe_node import TableReference
+from purplequery.dataframe_node import QueryExpression, Select, TableReference
+from purplequery.evaluatable_node import Selector, Value
+from purplequery.query import parse_query
 from purplequery.storage import DatasetTableContext
 
 
@@ -146,6 +152,96 @@ class BQAbstractSyntaxTreeTest(unittest.TestCase):
         self.assertEqual(list(result.series), expected_result)
         self.assertEqual(result.type_, BQScalarType.INTEGER)
 
+    @data(
+        (('b',), FieldBinding(0, 'my_table2.b', BQScalarType.INTEGER)),
+        (('my_table2', 'a'), FieldBinding(0, 'my_table2.a', BQScalarType.INTEGER)),
+        (('c',), FieldBinding(1, 'my_table3.c', BQScalarType.INTEGER)),
+    )
+    @unpack
+    def test_bind(self, path, expected_binding):
+        # type: (Tuple[str, ...], FieldBinding) -> None
+        ec = EvaluationContext(self.table_context)
+        ec.add_table_from_node(TableReference(('my_project', 'my_dataset', 'my_table2')),
+                               EMPTY_NODE)
+        subcontext = EvaluationContext(self.table_context)
+        subcontext.add_table_from_node(TableReference(('my_project', 'my_dataset', 'my_table3')),
+                                       EMPTY_NODE)
+        ec.add_subcontext(subcontext)
+
+        self.assertEqual(ec.bind(path), expected_binding)
+
+    def test_lookup_bound_path(self):
+        # type: () -> None
+        ec = EvaluationContext(self.table_context)
+        ec.add_table_from_node(TableReference(('my_project', 'my_dataset', 'my_table2')),
+                               EMPTY_NODE)
+        ec.bind_fields([BinaryExpression(Field(('a',)), '+', Field(('b',)))])
+
+        # The path is not canonicalized again.
+        ec.column_to_table_ids['a'].append('my_table')
+        with self.assertRaisesRegexp(ValueError, 'ambiguous'):
+            ec.get_canonical_path(('a',))
+        self.assertEqual(list(ec.lookup(('a',)).series), [1, 3])
+
+    def test_add_column(self):
+        # type: () -> None
+        ec = EvaluationContext(self.table_context)
+        ec.add_table_from_node(TableReference(('my_project', 'my_dataset', 'my_table2')),
+                               EMPTY_NODE)
+        dataframe = ec._table.dataframe
+        column = BinaryExpression(Field(('a',)), '+', Field(('b',))).evaluate(ec)
+        path = ec.maybe_add_column(column)
+
+        # The column is available without adding it to a copy of the table...
+        self.assertIs(ec._table.dataframe, dataframe)
+        self.assertEqual(list(ec.lookup(path).series), [3, 7])
+        self.assertIs(ec._table.dataframe, dataframe)
+
+        # ... until the whole table is needed.
+        self.assertEqual(list(ec.table.dataframe.columns),
+                         ['my_table2.a', 'my_table2.b', '.'.join(path)])
+        self.assertEqual(ec.table.types, [BQScalarType.INTEGER] * 3)
+        self.assertEqual(ec.table.to_list_of_lists(), [[1, 2, 3], [3, 4, 7]])
+        self.assertEqual(list(ec.lookup(path).series), [3, 7])
+
+    def test_select_rows(self):
+        # type: () -> None
+        ec = EvaluationContext(self.table_context)
+        ec.add_table_from_dataframe(
+                TypedDataFrame(pd.DataFrame([[1, 2], [3, 4], [5, 6]], columns=['a', 'b']),
+                               [BQScalarType.INTEGER, BQScalarType.INTEGER]),
+                'my_table', EMPTY_NODE)
+        path = ec.maybe_add_column(BinaryExpression(Field(('a',)), '+', Field(('b',))).evaluate(ec))
+        ec.select_rows(np.array([0, 2]))
+        ec.select_rows(np.array([1]))
+
+        # Only the columns looked up are gathered.
+        self.assertEqual(ec.num_rows, 1)
+        self.assertEqual(list(ec.index), [2])
+        self.assertEqual(list(ec.lookup(('a',)).series), [5])
+        self.assertEqual(list(ec.lookup(path).series), [11])
+        self.assertEqual(list(ec._gathered_columns), ['my_table.a'])
+
+        self.assertEqual(ec.table.to_list_of_lists(), [[5, 6, 11]])
+        self.assertEqual(list(ec.lookup(('b',)).series), [6])
+
+    @data(
+        (Field(('c',)), "field c is not present in any from'ed tables"),
+        (BinaryExpression(Value(1, BQScalarType.INTEGER), '+', Field(('a',))),
+         'field a is ambiguous'),
+    )
+    @unpack
+    def test_bind_fields_error(self, expression, error):
+        # type: (EvaluatableNode, str) -> None
+        ec = EvaluationContext(self.table_context)
+        ec.add_table_from_node(TableReference(('my_project', 'my_dataset', 'my_table')),
+                               EMPTY_NODE)
+        ec.add_table_from_node(TableReference(('my_project', 'my_dataset', 'my_table2')),
+                               EMPTY_NODE)
+
+        with self.assertRaisesRegexp(ValueError, error):
+            ec.bind_fields([expression])
+
     def test_subcontext_lookup_error_already_has_subcontext(self):
         # type: () -> None
         ec = EvaluationContext(self.table_context)
@@ -193,6 +289,54 @@ class BQAbstractSyntaxTreeTest(unittest.TestCase):
         with self.assertRaisesRegexp(KeyError, error):
             ec.lookup(path)
 
+    def test_expressions_are_immutable(self):
+        # type: () -> None
+        field = Field(('a',))
+        with self.assertRaisesRegexp(AttributeError, 'expressions are immutable'):
+            field.path = ('b',)
+        self.assertFalse(hasattr(field, '__dict__'))
+        self.assertEqual(field.attributes(), [('path', ('a',))])
+
+    def test_structural_equality(self):
+        # type: () -> None
+        expression = BinaryExpression(Field(('a',)), '+', Value(1, BQScalarType.INTEGER))
+        same_expression = BinaryExpression(Field(('a',)), '+', Value(1, BQScalarType.INTEGER))
+        other_expression = BinaryExpression(Field(('a',)), '-', Value(1, BQScalarType.INTEGER))
+
+        self.assertEqual(expression, same_expression)
+        self.assertEqual(hash(expression), hash(same_expression))
+        self.assertNotEqual(expression, other_expression)
+        self.assertEqual(len({expression, same_expression, other_expression}), 2)
+
+    def test_intern_expressions(self):
+        # type: () -> None
+        query = parse_query('SELECT a + 1 AS x, (a + 1) * 2 FROM my_table WHERE a + 1 > 2')
+        assert isinstance(query, QueryExpression)
+        select = query.base_query
+        assert isinstance(select, Select)
+        first_selector, second_selector = select.fields
+        assert isinstance(first_selector, Selector) and isinstance(second_selector, Selector)
+        assert isinstance(select.where, BinaryExpression)
+
+        sum_, = first_selector.children
+        product, = second_selector.children
+        assert isinstance(product, BinaryExpression)
+        self.assertIs(product.children[0], sum_)
+        self.assertIs(select.where.children[0], sum_)
+        # The selectors keep their names and positions.
+        self.assertEqual([first_selector.name(), second_selector.name()], ['x', '_f2'])
+
+    def test_intern_expressions_keeps_distinct_expressions(self):
+        # type: () -> None
+        selectors = [Selector(Field(('a',)), EMPTY_NODE, 1), Selector(Field(('b',)), EMPTY_NODE, 2),
+                     Selector(Field(('a',)), EMPTY_NODE, 3)]
+        interned = intern_expressions(
+            Select(EMPTY_NODE, selectors, EMPTY_NODE, EMPTY_NODE, EMPTY_NODE, EMPTY_NODE))
+        assert isinstance(interned, Select)
+        fields = [field.children[0] for field in interned.fields if isinstance(field, Selector)]
+        self.assertIs(fields[0], fields[2])
+        self.assertIsNot(fields[0], fields[1])
+
 
 if __name__ == '__main__':
     unittest.main()
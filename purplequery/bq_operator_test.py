@@ -7,12 +7,15 @@ import re
 import unittest
 from typing import List, Union  # noqa: F401
 
+import pandas as pd
 from ddt import data, ddt, unpack
 
-from purplequery.bq_abstract_syntax_tree import EvaluatableNode, EvaluationContext, TableContext
+from purplequery.binary_expression import BinaryExpression
+from purplequery.bq_abstract_syntax_tree import (EMPTY_NODE, EvaluatableNode, EvaluationContext,
+                                                 Field, TableContext)
 from purplequery.bq_operator import (BINARY_OPERATOR_PATTERN, _reparse_binary_expression,
                                      binary_operator_expression_rule)
-from purplequery.bq_types import BQScalarType, TypedSeries
+from purplequery.bq_types import BQScalarType, TypedDataFrame, TypedSeries
 from purplequery.evaluatable_node import Value  # noqa: F401
 from purplequery.terminals import literal
 
@@ -100,6 +103,31 @@ class BqOperatorTest(unittest.TestCase):
         assert isinstance(typed_series, TypedSeries)
         self.assertEqual(list(typed_series.series), [result])
 
+    @data(
+        dict(left=Field(('a',)), operator='*', right=Value(2, BQScalarType.INTEGER),
+             result=[2, 4, 6], result_type=BQScalarType.INTEGER),
+        dict(left=Value(10.0, BQScalarType.FLOAT), operator='-', right=Field(('a',)),
+             result=[9.0, 8.0, 7.0], result_type=BQScalarType.FLOAT),
+        dict(left=Field(('a',)), operator='<', right=Value(3, BQScalarType.INTEGER),
+             result=[True, True, False], result_type=BQScalarType.BOOLEAN),
+    )
+    @unpack
+    def test_binary_expression_with_literal_operand(self, left, operator, right, result,
+                                                    result_type):
+        # type: (EvaluatableNode, str, EvaluatableNode, List[Union[int, bool]], BQScalarType) -> None  # noqa: E501
+        context = EvaluationContext(TableContext())
+        context.add_table_from_dataframe(
+            TypedDataFrame(pd.DataFrame([[1], [2], [3]], columns=['a']), [BQScalarType.INTEGER]),
+            'my_table', EMPTY_NODE)
+
+        typed_series = BinaryExpression(left, operator, right).evaluate(context)
+
+        assert isinstance(typed_series, TypedSeries)
+        self.assertEqual(list(typed_series.series), result)
+        self.assertEqual(typed_series.type_, result_type)
+        # Like the combination of two columns, the result is not named after its operand.
+        self.assertIsNone(typed_series.series.name)
+
     def test_even_length_sequence_raises(self):
         with self.assertRaisesRegexp(ValueError, 'Sequence must be of odd length'):
             _reparse_binary_expression([Value(3, BQScalarType.INTEGER), '+'])
@@ -210,6 +210,20 @@ _BQ_SCALAR_TYPE_TO_NUMPY_TYPE = {
 }
 
 
+# The number of bytes BigQuery counts for a non-NULL value of each scalar type when computing the
+# bytes a query processes; a STRING counts this many bytes plus the length of its UTF-8 encoding.
+# NULL values count zero bytes.  See https://cloud.google.com/bigquery/pricing#data
+_BQ_SCALAR_TYPE_TO_SIZE = {
+    BQScalarType.BOOLEAN: 1,
+    BQScalarType.DATE: 8,
+    BQScalarType.DATETIME: 8,
+    BQScalarType.INTEGER: 8,
+    BQScalarType.FLOAT: 8,
+    BQScalarType.STRING: 2,
+    BQScalarType.TIMESTAMP: 8,
+}
+
+
 def _get_datetime(element):
     # type: (PandasType) -> datetime.datetime
     """Converts an element to a Python datetime.
@@ -450,6 +464,53 @@ class TypedSeries(object):
         return [self.type_.convert(element) for element in self.series]
 
 
+class TypedScalar(object):
+    """A typed value, standing for a column with the same value in every row.
+
+    Literal operands are passed as TypedScalars to the expressions that accept them (see
+    EvaluatableNodeWithChildren.accepts_scalars), which apply the value directly to their other
+    operands' columns, letting pandas broadcast it, rather than expanding it into a column first.
+    """
+    def __init__(self, value, type_):
+        # type: (Any, BQType) -> None
+        self._value = value
+        self._type = type_
+
+    @property
+    def value(self):
+        # type: () -> Any
+        """Returns just the value."""
+        return self._value
+
+    @property
+    def type_(self):
+        # type: () -> BQType
+        """Returns just the type of the value."""
+        return self._type
+
+    def __repr__(self):
+        return 'TypedScalar({!r}, {!r})'.format(self.value, self.type_)
+
+    def to_series(self, index):
+        # type: (pd.Index) -> TypedSeries
+        """Expands the value into a column.
+
+        Args:
+            index: The index of the rows of the column.
+        Returns:
+            A column with the value in every row.
+        """
+        return TypedSeries(pd.Series(self.value, index=index), self.type_)
+
+
+def column_values(column):
+    # type: (Union[TypedSeries, TypedScalar]) -> Any
+    """Returns the data of a column, or the value of a scalar, to apply an operator to."""
+    if isinstance(column, TypedScalar):
+        return column.value
+    return column.series
+
+
 class TypedDataFrame(object):
     def __init__(self, dataframe, types):
         # type: (Union[pd.DataFrame, pd.DataFrameGroupBy], Sequence[BQType]) -> None
@@ -496,6 +557,42 @@ class TypedDataFrame(object):
         return rows
 
 
+def _value_size(value, type_):
+    # type: (Any, BQType) -> int
+    """Returns the number of bytes BigQuery counts for one value of a type."""
+    if isinstance(type_, BQArray):
+        if not isinstance(value, tuple):
+            return 0
+        return sum(_value_size(element, type_.type_) for element in value)
+    if isinstance(type_, BQStructType):
+        if not isinstance(value, tuple):
+            return 0
+        return sum(_value_size(element, field_type)
+                   for element, field_type in zip(value, type_.types))
+    if pd.isnull(value):
+        return 0
+    size = _BQ_SCALAR_TYPE_TO_SIZE[cast(BQScalarType, type_)]
+    if type_ == BQScalarType.STRING:
+        size += len(_get_str(value).encode('utf-8'))
+    return size
+
+
+def column_size(column):
+    # type: (TypedSeries) -> int
+    """Returns the number of bytes BigQuery counts for reading a column of data.
+
+    Args:
+        column: A column of data.
+    Returns:
+        The size of the column's values, as BigQuery computes it to count the bytes processed by
+        queries: a fixed size per value of most types, a size depending on the length of STRINGs,
+        the sum of the sizes of the elements of ARRAYs and STRUCTs, and nothing for NULLs.
+    """
+    if column.type_ in _BQ_SCALAR_TYPE_TO_SIZE and column.type_ != BQScalarType.STRING:
+        return int(column.series.notnull().sum()) * _BQ_SCALAR_TYPE_TO_SIZE[column.type_]
+    return sum(_value_size(value, column.type_) for value in column.series)
+
+
 def _coerce_names(names):
     # type: (Sequence[str]) -> str
     '''Coerce a set of field names.  Names agree if equal or if one is None.
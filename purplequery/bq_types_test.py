@@ -5,7 +5,7 @@
 
 import datetime
 import unittest
-from typing import List, Optional, Sequence, Union  # noqa: F401
+from typing import Any, List, Optional, Sequence, Union  # noqa: F401
 
 import numpy as np
 import pandas as pd
@@ -13,8 +13,9 @@ from ddt import data, ddt, unpack
 from google.cloud.bigquery.schema import SchemaField
 
 from purplequery.bq_types import PythonType  # noqa: F401
-from purplequery.bq_types import (BQArray, BQScalarType, BQType, TypedDataFrame, TypedSeries,
-                                  _coerce_names, implicitly_coerce)
+from purplequery.bq_types import (BQArray, BQScalarType, BQStructType, BQType, TypedDataFrame,
+                                  TypedScalar, TypedSeries, _coerce_names, column_size,
+                                  column_values, implicitly_coerce)
 
 # The NumPy types that are used to read in data into Pandas.
 NumPyType = Union[np.bool_, np.datetime64, np.float64, np.string_]
@@ -230,6 +231,35 @@ class BqTypesTest(unittest.TestCase):
         with self.assertRaisesRegexp(ValueError, error):
             implicitly_coerce(*input_types)
 
+    @data(
+        dict(values=[1.0, 2.0, np.nan], type_=BQScalarType.INTEGER, expected_size=16),
+        dict(values=[True, False], type_=BQScalarType.BOOLEAN, expected_size=2),
+        # Two bytes plus the length of the UTF-8 encoding; u'\xe9' is two bytes long.
+        dict(values=['ab', u'\xe9', None], type_=BQScalarType.STRING, expected_size=4 + 4),
+        dict(values=[pd.Timestamp('2019-01-01'), pd.NaT], type_=BQScalarType.TIMESTAMP,
+             expected_size=8),
+        dict(values=[(1.0, 2.0), (), np.nan], type_=BQArray(BQScalarType.INTEGER),
+             expected_size=16),
+        dict(values=[(1.0, 'abc')],
+             type_=BQStructType([None, None], [BQScalarType.INTEGER, BQScalarType.STRING]),
+             expected_size=8 + 5),
+    )
+    @unpack
+    def test_column_size(self, values, type_, expected_size):
+        # type: (List[Any], BQType, int) -> None
+        self.assertEqual(column_size(TypedSeries(pd.Series(values), type_)), expected_size)
+
+    def test_typed_scalar(self):
+        # type: () -> None
+        scalar = TypedScalar(3, BQScalarType.INTEGER)
+        column = scalar.to_series(pd.Index([5, 7]))
+        self.assertEqual(list(column.series.index), [5, 7])
+        self.assertEqual(list(column.series), [3, 3])
+        self.assertEqual(column.type_, BQScalarType.INTEGER)
+
+        self.assertEqual(column_values(scalar), 3)
+        self.assertIs(column_values(column), column.series)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -6,8 +6,9 @@
 """Fake implementation of Google BigQuery client."""
 
 import collections
+import json
 import uuid
-from typing import Any, Callable, Dict, List, Optional, Tuple, cast  # noqa: F401
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, cast  # noqa: F401
 from typing.io import TextIO  # noqa: F401
 
 import numpy as np
@@ -18,13 +19,25 @@ from google.api_core.retry import Retry  # noqa: F401
 from google.cloud.bigquery import Dataset, DatasetReference, Table, TableReference  # noqa: F401
 from google.cloud.bigquery.dataset import DatasetListItem  # noqa: F401
 from google.cloud.bigquery.job import LoadJobConfig, QueryJobConfig  # noqa: F401
+from google.cloud.bigquery.job import QueryPlanEntry
 from google.cloud.bigquery.schema import SchemaField  # noqa: F401
 from google.cloud.bigquery.table import TableListItem  # noqa: F401
 
-from .bq_abstract_syntax_tree import Result  # noqa: F401
+from .bq_abstract_syntax_tree import Result
 from .bq_types import BQScalarType  # noqa: F401
 from .bq_types import BQArray, BQType, TypedDataFrame
-from .query import execute_query
+from .dataframe_node import QueryExpression, table_references
+from .dry_run import estimate_bytes
+from .evaluatable_node import is_deterministic
+from .join import JoinLimits  # noqa: F401
+from .query import dry_run_query, execute_query, parse_query
+from .query_plan import QueryPlan
+from .statements import Statement
+from .storage import DatasetTableContext, View
+from .tokenizer import tokenize
+
+# The number of query results kept in a client's query cache.
+_QUERY_CACHE_SIZE = 100
 
 
 class Client:
@@ -35,20 +48,30 @@ class Client:
     all parameters are used by this fake implementation.
     """
 
-    def __init__(self, project):
-        # type: (str) -> None
+    def __init__(self, project, join_limits=None):
+        # type: (str, Optional[JoinLimits]) -> None
         """Constructs an instance of the fake client.
 
         Args:
             project: default project to use when no explicit project is specified.
+            join_limits: The limits on the size of the result of any one join in a query;
+                join.DEFAULT_JOIN_LIMITS if None.  A query with a join estimated to exceed them
+                fails before the join runs.
         """
 
         self.project = project
+        self.join_limits = join_limits
         # This field holds all the data stored in the BigQuery fake.
         # It is a triply nested dictionary, mapping project id -> dataset id ->
         # table id -> a pair of a pandas DataFrame and the corresponding
         # BigQuery schema.
         self._datasets = {project: {}}  # type: Dict[str, Dict[str, Dict[str, TypedDataFrame]]]
+        # This field maps (project id, dataset id, table id) to a version number that increases
+        # every time the table is created, modified or deleted.
+        self._table_versions = {}  # type: Dict[Tuple[str, str, str], int]
+        # This field maps a query (normalized, with its parameters) to the versions of the tables
+        # it depended on and its result; the most recently used query is last.
+        self._query_cache = collections.OrderedDict()  # type: collections.OrderedDict
 
     def _safe_lookup(self, project, dataset_id=None, table_id=None):
         # type: (str, Optional[str], Optional[str]) -> Any
@@ -89,6 +112,79 @@ class Client:
             raise NotFound("Table {} not found".format(table_id))
         return table_map[table_id]
 
+    def _bump_version(self, project, dataset_id, table_id):
+        # type: (str, str, str) -> None
+        """Records that a table was created, modified or deleted.
+
+        Args:
+            project: Project ID of the table
+            dataset_id: Dataset ID of the table
+            table_id: Table ID
+        """
+        key = (project, dataset_id, table_id)
+        self._table_versions[key] = self._table_versions.get(key, 0) + 1
+
+    def _dependency_versions(self, paths):
+        # type: (Sequence[Sequence[str]]) -> List[Any]
+        """Returns the current versions of the tables and views that some paths depend on.
+
+        Args:
+            paths: Paths to tables or views, as written in a query.
+        Returns:
+            The fully qualified path and version of each table or view the paths refer to,
+            including those that views depend on, or None for paths that can't be resolved.
+        """
+        return [None if path is None else (path, self._table_versions.get(path, 0))
+                for path in DatasetTableContext(self._datasets).dependencies(paths)]
+
+    def _is_deterministic(self, node):
+        # type: (QueryExpression) -> bool
+        """Returns whether a query, and the views it reads through any number of views, are
+        deterministic, so that its result can be cached.
+
+        Args:
+            node: The syntax tree of the query.
+        """
+        if not is_deterministic(node):
+            return False
+        for path in DatasetTableContext(self._datasets).dependencies(table_references(node)):
+            table = (None if path is None
+                     else self._datasets.get(path[0], {}).get(path[1], {}).get(path[2]))
+            if isinstance(table, View) and not is_deterministic(table.query):
+                return False
+        return True
+
+    def _lookup_cached_result(self, cache_key):
+        # type: (Tuple[Any, ...]) -> Optional[Result]
+        """Looks up the result of a query in the query cache.
+
+        Args:
+            cache_key: The normalized query and its parameters.
+        Returns:
+            The cached result, or None if the query isn't cached or a table it depends on has
+            changed since.
+        """
+        if cache_key not in self._query_cache:
+            return None
+        paths, versions, result = self._query_cache.pop(cache_key)
+        if versions != self._dependency_versions(paths):
+            return None
+        self._query_cache[cache_key] = (paths, versions, result)
+        return result
+
+    def _cache_result(self, cache_key, paths, result):
+        # type: (Tuple[Any, ...], Sequence[Sequence[str]], Result) -> None
+        """Adds the result of a query to the query cache, evicting the least recently used.
+
+        Args:
+            cache_key: The normalized query and its parameters.
+            paths: The paths of the tables the query refers to.
+            result: The result of the query.
+        """
+        self._query_cache[cache_key] = (paths, self._dependency_versions(paths), result)
+        while len(self._query_cache) > _QUERY_CACHE_SIZE:
+            self._query_cache.popitem(last=False)
+
     def dataset(self, dataset_id, project=None):
         # type: (str, Optional[str]) -> DatasetReference
         """Constructs a reference to a dataset.
@@ -194,6 +290,9 @@ class Client:
         del retry  # Unused in this implementation.
         typed_dataframe = self._safe_lookup(
                 table_ref.project, table_ref.dataset_id, table_ref.table_id)
+        if isinstance(typed_dataframe, View):
+            typed_dataframe, _ = DatasetTableContext(self._datasets).lookup(
+                (table_ref.project, table_ref.dataset_id, table_ref.table_id))
         return Table(table_ref, typed_dataframe.to_bq_schema())
 
     def create_table(self, table):
@@ -212,6 +311,7 @@ class Client:
                 data=collections.OrderedDict([(field.name, pd.Series([], dtype=bq_type.to_dtype()))
                                               for field, bq_type in zip(table.schema, bq_types)])),
             bq_types)
+        self._bump_version(table.project, table.dataset_id, table.table_id)
 
     def get_table_dataframe(self, project, dataset_id, table_id):
         # type: (str, str, str) -> pd.DataFrame
@@ -244,6 +344,7 @@ class Client:
         old_typed_dataframe = self._safe_lookup(project, dataset_id, table_id)
         self._datasets[project][dataset_id][table_id] = TypedDataFrame(dataframe,
                                                                        old_typed_dataframe.schema)
+        self._bump_version(project, dataset_id, table_id)
 
     def load_table_from_file(self, fileobj, table_ref, job_config, rewind):
         # type: (TextIO, TableReference, LoadJobConfig, bool) -> _FakeJob
@@ -302,6 +403,7 @@ class Client:
                     parse_dates=date_fields,
                     converters=converters),
                 typed_dataframe.types))
+        self._bump_version(table_ref.project, table_ref.dataset_id, table_ref.table_id)
         return _FakeJob(None, self.project)
 
     def delete_dataset(self, dataset_ref, retry=None, delete_contents=False):
@@ -317,6 +419,8 @@ class Client:
         del retry  # Unused in this implementation.
         if self._safe_lookup(dataset_ref.project, dataset_ref.dataset_id) and not delete_contents:
             raise BadRequest("Can't delete dataset {}; dataset is not empty".format(dataset_ref))
+        for table_id in self._datasets[dataset_ref.project][dataset_ref.dataset_id]:
+            self._bump_version(dataset_ref.project, dataset_ref.dataset_id, table_id)
         del self._datasets[dataset_ref.project][dataset_ref.dataset_id]
 
     def delete_table(self, table_ref, retry=None):
@@ -331,6 +435,7 @@ class Client:
         # Make sure table exists before deleting
         self._safe_lookup(table_ref.project, table_ref.dataset_id, table_ref.table_id)
         del self._datasets[table_ref.project][table_ref.dataset_id][table_ref.table_id]
+        self._bump_version(table_ref.project, table_ref.dataset_id, table_ref.table_id)
 
     def insert_rows(self, table, rows, retry=None):
         # type: (Table, List[Dict[str, Any]], Optional[Retry]) -> List[str]
@@ -355,6 +460,7 @@ class Client:
             _rename_and_append_dataframe(
                 old_typed_dataframe.dataframe, new_dataframe),
             old_typed_dataframe.types)
+        self._bump_version(table.project, table.dataset_id, table.table_id)
         return []  # no errors
 
     def query(self, query, job_config, retry=None):
@@ -370,12 +476,53 @@ class Client:
         Returns:
             A Job object that can be waited on.  When complete, the result is a
             List of Row objects, containing a list of Python datatypes corresponding to the query.
+            Its cache_hit is true if the result was found in the query cache: the same query
+            was run before with the same parameters, and the tables it reads haven't changed.
+            Otherwise, its query_plan has statistics on each stage of executing the query (see
+            query_plan.py; query_plan.format_query_plan renders them as text).
+            The job's total_bytes_processed and total_bytes_billed are computed as BigQuery
+            does, from the columns the query reads (see dry_run.py).  If they would exceed
+            job_config.maximum_bytes_billed, the query fails with BadRequest before it runs.
+            If job_config.dry_run is set, the query is validated but not run: the job has no
+            rows, and its schema and total_bytes_processed are those the query would result in
+            and process.
         """
         del retry  # Unused in this implementation.
         if job_config.use_legacy_sql:
             raise NotImplementedError("Legacy SQL syntax is not implemented.")
-
-        result = execute_query(query, self._datasets)
+        if job_config.dry_run:
+            estimate = dry_run_query(query, self._datasets)
+            return _FakeJob(Result('SELECT', table=estimate.table), self.project,
+                            schema=estimate.table.to_bq_schema(),
+                            total_bytes_processed=estimate.total_bytes_processed)
+
+        # As in BigQuery, results written to a destination table are not cached.
+        use_cache = job_config.use_query_cache is not False and not job_config.destination
+        cache_key = (tuple(tokenize(query)),
+                     json.dumps([parameter.to_api_repr()
+                                 for parameter in job_config.query_parameters], sort_keys=True))
+        result = self._lookup_cached_result(cache_key) if use_cache else None
+        cache_hit = result is not None
+        plan = QueryPlan()
+        # A result found in the cache processes no bytes.
+        total_bytes_processed = total_bytes_billed = 0  # type: Optional[int]
+        if result is None:
+            node = parse_query(query)
+            if isinstance(node, QueryExpression):
+                total_bytes_processed, total_bytes_billed = estimate_bytes(node, self._datasets)
+                if (job_config.maximum_bytes_billed is not None and
+                        total_bytes_billed > int(job_config.maximum_bytes_billed)):
+                    raise BadRequest("Query exceeded limit for bytes billed: {}. {} or higher "
+                                     "required.".format(job_config.maximum_bytes_billed,
+                                                        total_bytes_billed))
+            else:
+                total_bytes_processed = total_bytes_billed = None
+            result = execute_query(query, self._datasets, node, plan, self.join_limits)
+            if isinstance(node, Statement):
+                project, dataset_id, table_id = result.path
+                self._bump_version(project, dataset_id, table_id)
+            elif isinstance(node, QueryExpression) and use_cache and self._is_deterministic(node):
+                self._cache_result(cache_key, table_references(node), result)
         if job_config.destination:
             table_ref = job_config.destination
             table_map = self._safe_lookup(table_ref.project, table_ref.dataset_id)
@@ -405,7 +552,11 @@ class Client:
                         typed_dataframe.types))
             else:  # Either write_truncate, or (write_empty or write_append) to an empty table
                 table_map[table_ref.table_id] = result.table
-        return _FakeJob(result, self.project)
+            self._bump_version(table_ref.project, table_ref.dataset_id, table_ref.table_id)
+        return _FakeJob(result, self.project, cache_hit,
+                        [QueryPlanEntry.from_api_repr(stage) for stage in plan.to_api_repr()],
+                        total_bytes_processed=total_bytes_processed,
+                        total_bytes_billed=total_bytes_billed)
 
 
 def _rename_and_append_dataframe(old_dataframe, new_dataframe):
@@ -447,8 +598,9 @@ def _make_array_reader(bq_type):
 
 class _FakeJob:
     """A minimal fake implementation of google.cloud.bigquery.*Job."""
-    def __init__(self, result, project):
-        # type: (Result, str) -> None
+    def __init__(self, result, project, cache_hit=False, query_plan=None, schema=None,
+                 total_bytes_processed=None, total_bytes_billed=None):
+        # type: (Result, str, bool, Optional[List[QueryPlanEntry]], Optional[List[SchemaField]], Optional[int], Optional[int]) -> None  # noqa: E501
         self.error_result = None
         self.errors = ()
         self._result = None
@@ -457,6 +609,11 @@ class _FakeJob:
                 self._result = [_FakeRow(row) for row in result.table.to_list_of_lists()]
             self.statement_type = result.statement_type
         self.project = project
+        self.cache_hit = cache_hit
+        self.query_plan = query_plan or []
+        self.schema = schema
+        self.total_bytes_processed = total_bytes_processed
+        self.total_bytes_billed = total_bytes_billed
         self.location = 'YourDesktop'
         self.job_id = uuid.uuid4()
 
@@ -350,5 +350,167 @@ class ClientWriteFromQueryTest(ClientTestBase):
                 [[1, 2.5], [3, 4.25]])
 
 
+@ddt
+class ClientQueryCacheTest(ClientTestBase):
+
+    def setUp(self):
+        super(ClientQueryCacheTest, self).setUp()
+        dataset_ref = DatasetReference(self.bq_client.project, 'my_dataset')
+        self.table = Table(TableReference(dataset_ref, 'table1'),
+                           [SchemaField(name="a", field_type='INT64')])
+        self.bq_client.create_dataset(Dataset(dataset_ref))
+        self.bq_client.create_table(self.table)
+        self.assertFalse(self.bq_client.insert_rows(self.table, [{'a': 1}, {'a': 2}]))
+
+    def test_repeated_query_hits_cache(self):
+        # type: () -> None
+        query_job = self.bq_client.query('SELECT SUM(a) FROM my_dataset.table1', QueryJobConfig())
+        self.assertFalse(query_job.cache_hit)
+        self.assertRowsExpected(query_job, [[3]])
+
+        # Whitespace and comments don't matter.
+        query_job = self.bq_client.query('SELECT SUM(a)\n  FROM my_dataset.table1  -- comment',
+                                         QueryJobConfig())
+        self.assertTrue(query_job.cache_hit)
+        self.assertRowsExpected(query_job, [[3]])
+
+    @data(
+        dict(change='insert_rows'),
+        dict(change='load_table_from_file'),
+        dict(change='create_or_replace'),
+        dict(change='destination'),
+    )
+    @unpack
+    def test_table_change_invalidates_cache(self, change):
+        # type: (str) -> None
+        query = 'SELECT SUM(a) FROM my_dataset.table1'
+        self.assertRowsExpected(self.bq_client.query(query, QueryJobConfig()), [[3]])
+        if change == 'insert_rows':
+            self.assertFalse(self.bq_client.insert_rows(self.table, [{'a': 4}]))
+        elif change == 'load_table_from_file':
+            self.bq_client.load_table_from_file(cStringIO('5\n6\n'), self.table.reference,
+                                                job_config=None, rewind=True)
+        elif change == 'create_or_replace':
+            self.bq_client.query('CREATE OR REPLACE TABLE my_project.my_dataset.table1 AS '
+                                 '(SELECT 7 AS a)', QueryJobConfig())
+        else:
+            job_config = QueryJobConfig()
+            job_config.destination = self.table.reference
+            job_config.write_disposition = 'WRITE_APPEND'
+            self.bq_client.query('SELECT 4 AS a', job_config)
+
+        query_job = self.bq_client.query(query, QueryJobConfig())
+        self.assertFalse(query_job.cache_hit)
+        self.assertRowsExpected(query_job, [[{'insert_rows': 7, 'load_table_from_file': 11,
+                                              'create_or_replace': 7, 'destination': 7}[change]]])
+
+    def test_view_base_table_change_invalidates_cache(self):
+        # type: () -> None
+        self.bq_client.query('CREATE VIEW my_project.my_dataset.view1 AS '
+                             '(SELECT a * 10 AS b FROM my_dataset.table1)', QueryJobConfig())
+        query = 'SELECT SUM(b) FROM my_dataset.view1'
+        self.assertRowsExpected(self.bq_client.query(query, QueryJobConfig()), [[30]])
+        self.assertTrue(self.bq_client.query(query, QueryJobConfig()).cache_hit)
+        self.assertFalse(self.bq_client.insert_rows(self.table, [{'a': 4}]))
+        query_job = self.bq_client.query(query, QueryJobConfig())
+        self.assertFalse(query_job.cache_hit)
+        self.assertRowsExpected(query_job, [[70]])
+
+    def test_query_plan(self):
+        # type: () -> None
+        query = 'SELECT SUM(a) FROM my_dataset.table1 WHERE a > 1'
+        query_job = self.bq_client.query(query, QueryJobConfig())
+        self.assertEqual([(entry.name, entry.records_read, entry.records_written)
+                          for entry in query_job.query_plan],
+                         [('S00: Scan', 2, 2), ('S01: Filter', 2, 1), ('S02: Aggregate', 1, 1)])
+        # A result from the cache wasn't computed by any stages.
+        self.assertEqual(self.bq_client.query(query, QueryJobConfig()).query_plan, [])
+
+    def test_use_query_cache_false(self):
+        # type: () -> None
+        job_config = QueryJobConfig()
+        job_config.use_query_cache = False
+        query = 'SELECT SUM(a) FROM my_dataset.table1'
+        self.bq_client.query(query, QueryJobConfig())
+        self.assertFalse(self.bq_client.query(query, job_config).cache_hit)
+
+    def test_nondeterministic_query_not_cached(self):
+        # type: () -> None
+        query = 'SELECT CURRENT_TIMESTAMP() AS now'
+        self.bq_client.query(query, QueryJobConfig())
+        self.assertFalse(self.bq_client.query(query, QueryJobConfig()).cache_hit)
+
+    def test_query_of_nondeterministic_view_not_cached(self):
+        # type: () -> None
+        self.bq_client.query('CREATE VIEW my_project.my_dataset.view1 AS '
+                             '(SELECT CURRENT_TIMESTAMP() AS now)', QueryJobConfig())
+        self.bq_client.query('CREATE VIEW my_project.my_dataset.view2 AS '
+                             '(SELECT now FROM my_dataset.view1)', QueryJobConfig())
+        query = 'SELECT now FROM my_dataset.view2'
+        self.bq_client.query(query, QueryJobConfig())
+        self.assertFalse(self.bq_client.query(query, QueryJobConfig()).cache_hit)
+
+
+class ClientDryRunTest(ClientTestBase):
+
+    def setUp(self):
+        super(ClientDryRunTest, self).setUp()
+        dataset_ref = DatasetReference(self.bq_client.project, 'my_dataset')
+        self.table = Table(TableReference(dataset_ref, 'table1'),
+                           [SchemaField(name="a", field_type='INT64'),
+                            SchemaField(name="b", field_type='STRING')])
+        self.bq_client.create_dataset(Dataset(dataset_ref))
+        self.bq_client.create_table(self.table)
+        self.assertFalse(self.bq_client.insert_rows(self.table, [{'a': 1, 'b': 'xyz'},
+                                                                 {'a': 2, 'b': None}]))
+
+    def test_dry_run(self):
+        # type: () -> None
+        job_config = QueryJobConfig()
+        job_config.dry_run = True
+        query_job = self.bq_client.query(
+            'SELECT a * 1.5 AS x, CONCAT(b, "!") AS y FROM my_dataset.table1', job_config)
+
+        self.assertEqual(query_job.schema, [SchemaField(name='x', field_type='FLOAT'),
+                                            SchemaField(name='y', field_type='STRING')])
+        # Two INT64s, and one STRING of three characters.
+        self.assertEqual(query_job.total_bytes_processed, 2 * 8 + (2 + 3))
+        self.assertEqual(query_job.result(), [])
+
+    def test_bytes_processed(self):
+        # type: () -> None
+        query = 'SELECT b FROM my_dataset.table1'
+        query_job = self.bq_client.query(query, QueryJobConfig())
+        self.assertEqual(query_job.total_bytes_processed, 2 + 3)
+        self.assertEqual(query_job.total_bytes_billed, 10 << 20)
+        # A result from the cache is free.
+        query_job = self.bq_client.query(query, QueryJobConfig())
+        self.assertTrue(query_job.cache_hit)
+        self.assertEqual(query_job.total_bytes_processed, 0)
+        self.assertEqual(query_job.total_bytes_billed, 0)
+
+    def test_maximum_bytes_billed(self):
+        # type: () -> None
+        job_config = QueryJobConfig()
+        job_config.maximum_bytes_billed = 10 << 20
+        self.assertRowsExpected(
+            self.bq_client.query('SELECT a FROM my_dataset.table1', job_config), [[1], [2]])
+
+        job_config.maximum_bytes_billed = 1000
+        with self.assertRaisesRegexp(BadRequest, 'exceeded limit for bytes billed: 1000'):
+            self.bq_client.query('SELECT a + 1 FROM my_dataset.table1', job_config)
+
+    def test_dry_run_does_not_run_statements(self):
+        # type: () -> None
+        job_config = QueryJobConfig()
+        job_config.dry_run = True
+        with self.assertRaisesRegexp(NotImplementedError, 'Dry run of statements'):
+            self.bq_client.query('CREATE TABLE my_project.my_dataset.table2 AS (SELECT 1 AS a)',
+                                 job_config)
+        with self.assertRaises(NotFound):
+            self.bq_client.get_table(TableReference(
+                DatasetReference(self.bq_client.project, 'my_dataset'), 'table2'))
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,113 @@
+# Copyright 2019 Verily Life Sciences LLC
+#
+# Use of this source code is governed by a BSD-style
+# license that can be found in the LICENSE file.
+
+'''Folds constant subexpressions of a query into literal values before it is executed.
+
+An expression like x * (60 * 60 * 24) or CAST('2019-01-01' AS TIMESTAMP) would otherwise evaluate
+its constant part into a whole column, in every context it is evaluated in.  Folding evaluates it
+once, on a single row, and replaces it with a Value node; operators then broadcast the literal to
+the other operands' rows rather than expanding it (see EvaluatableNodeWithChildren.accepts_scalars).
+'''
+
+from typing import Any  # noqa: F401
+
+import numpy as np
+import pandas as pd
+
+from .bq_abstract_syntax_tree import (EMPTY_CONTEXT, AbstractSyntaxTreeNode, EvaluatableNode,
+                                      EvaluatableNodeWithChildren)
+from .bq_types import BQScalarType, TypedSeries
+from .dataframe_node import QueryExpression
+from .evaluatable_node import Selector, Value, is_deterministic
+
+
+def _is_foldable(node):
+    # type: (EvaluatableNode) -> bool
+    '''Returns whether an expression is computed from literals alone, the same for every row.'''
+    if isinstance(node, Value):
+        return True
+    # Other leaves, e.g. Field or Exists, depend on the rows they are evaluated on, and a Selector
+    # carries the name of a column of the result.
+    return (isinstance(node, EvaluatableNodeWithChildren) and not isinstance(node, Selector)
+            and node.is_constant() and not node.depends_on_other_rows()
+            and is_deterministic(node)
+            and all(_is_foldable(child) for child in node.children))
+
+
+def _fold_expression(node):
+    # type: (EvaluatableNode) -> EvaluatableNode
+    '''Returns an expression equivalent to node, with its constant subexpressions folded.'''
+    if isinstance(node, Value):
+        return node
+    if _is_foldable(node):
+        try:
+            result = node.evaluate(EMPTY_CONTEXT)
+        except Exception:
+            # Leave the error to be raised when (and if) the expression is evaluated on some rows.
+            result = None
+        # Only non-NULL scalars can be literals; Value(None, None) is an untyped NULL.
+        if isinstance(result, TypedSeries) and isinstance(result.type_, BQScalarType):
+            value = result.series.iloc[0]
+            if not pd.isnull(value):
+                if isinstance(value, np.generic):
+                    value = value.item()
+                return Value(value, result.type_)
+    if isinstance(node, EvaluatableNodeWithChildren):
+        children = [_fold_expression(child) for child in node.children]
+        if any(new is not old for new, old in zip(children, node.children)):
+            # Expressions are immutable.
+            return node.copy(children)
+    else:
+        _fold_attributes(node)
+    return node
+
+
+def _fold(value):
+    # type: (Any) -> Any
+    '''Folds the expressions in a syntax tree node, or a list or tuple of them.'''
+    if isinstance(value, EvaluatableNode):
+        return _fold_expression(value)
+    if isinstance(value, AbstractSyntaxTreeNode):
+        _fold_attributes(value)
+        return value
+    if isinstance(value, list):
+        return [_fold(element) for element in value]
+    if isinstance(value, tuple):
+        folded = tuple(_fold(element) for element in value)
+        # Only rebuild tuples that contained an expression, so that e.g. named tuples are kept.
+        if all(new is old for new, old in zip(folded, value)):
+            return value
+        return folded
+    return value
+
+
+def _fold_attributes(node):
+    # type: (AbstractSyntaxTreeNode) -> None
+    '''Folds the expressions in the attributes of a syntax tree node, in place.
+
+    The attributes of an expression, e.g. the subquery of an EXISTS, are themselves folded in
+    place, as the expression is immutable.
+    '''
+    for attribute, value in node.attributes():
+        if isinstance(node, QueryExpression) and attribute == 'order_by':
+            # ORDER BY 2 refers to the second column, but ORDER BY 1 + 1 does not.
+            continue
+        folded = _fold(value)
+        if folded is not value:
+            setattr(node, attribute, folded)
+
+
+def fold_constants(node):
+    # type: (AbstractSyntaxTreeNode) -> AbstractSyntaxTreeNode
+    '''Folds the constant subexpressions of a query or statement into literal values.
+
+    Args:
+        node: The abstract syntax tree of a query or statement.  Its nodes that aren't expressions
+            are modified in place.
+    Returns:
+        The same tree, for convenience.
+    '''
+    _fold_attributes(node)
+    return node
@@ -0,0 +1,117 @@
+# Copyright 2019 Verily Life Sciences LLC
+#
+# Use of this source code is governed by a BSD-style
+# license that can be found in the LICENSE file.
+
+import unittest
+from typing import Any, List  # noqa: F401
+
+import pandas as pd
+from ddt import data, ddt, unpack
+
+from purplequery.bq_types import BQScalarType, TypedDataFrame
+from purplequery.constant_folding import fold_constants
+from purplequery.dataframe_node import QueryExpression, Select
+from purplequery.evaluatable_node import Selector, Value
+from purplequery.query import execute_query, parse_query
+from purplequery.storage import DatasetTableContext
+
+
+@ddt
+class ConstantFoldingTest(unittest.TestCase):
+
+    def setUp(self):
+        # type: () -> None
+        self.datasets = {
+            'my_project': {
+                'my_dataset': {
+                    'table1': TypedDataFrame(
+                        pd.DataFrame([[1, 'x'], [2, 'y']], columns=['a', 'b']),
+                        [BQScalarType.INTEGER, BQScalarType.STRING]),
+                }
+            }
+        }
+
+    def _folded_selectors(self, query):
+        # type: (str) -> List[Any]
+        node = parse_query(query)
+        assert isinstance(node, QueryExpression)
+        fold_constants(node)
+        select = node.base_query
+        assert isinstance(select, Select)
+        return [selector.children[0] for selector in select.fields
+                if isinstance(selector, Selector)]
+
+    @data(
+        dict(expression='60 * 60 * 24', value=86400, type_=BQScalarType.INTEGER),
+        dict(expression="CONCAT('a', 'b')", value='ab', type_=BQScalarType.STRING),
+        dict(expression="CAST('2019-01-01' AS TIMESTAMP)", value=pd.Timestamp('2019-01-01'),
+             type_=BQScalarType.TIMESTAMP),
+        dict(expression='IF(1 < 2, 1.5, 2.5)', value=1.5, type_=BQScalarType.FLOAT),
+        dict(expression='NOT TRUE', value=False, type_=BQScalarType.BOOLEAN),
+    )
+    @unpack
+    def test_fold(self, expression, value, type_):
+        # type: (str, Any, BQScalarType) -> None
+        folded, = self._folded_selectors('SELECT {}'.format(expression))
+        self.assertEqual(folded, Value(value, type_))
+        self.assertEqual(type(folded.value), type(value))
+
+    def test_fold_subexpression(self):
+        # type: () -> None
+        folded, = self._folded_selectors('SELECT a * (60 * 60 * 24) FROM table1')
+        self.assertEqual(folded.strexpr(), '(* a 86400)')
+
+    @data(
+        # Depends on the rows.
+        'a + 1',
+        # Aggregates over the rows.
+        'SUM(1 + 1)',
+        # Each row is numbered.
+        'ROW_NUMBER() OVER ()',
+        # Not deterministic.
+        'CURRENT_TIMESTAMP()',
+        # A typed NULL can't be a literal.
+        'CAST(NULL AS INT64)',
+        # An ARRAY can't be a literal.
+        '[1, 2]',
+    )
+    def test_not_folded(self, expression):
+        # type: (str) -> None
+        folded, = self._folded_selectors('SELECT {} FROM table1'.format(expression))
+        self.assertNotIsInstance(folded, Value)
+
+    @data(
+        'SELECT a * (2 + 3) AS x, CONCAT(b, CONCAT("-", "z")) FROM table1',
+        'SELECT a FROM table1 WHERE a > 1 - 1 AND 2 = 2',
+        'SELECT b, 2 * 3 FROM table1 GROUP BY b',
+        'SELECT SUM(a * (1 + 1)) FROM table1',
+        'SELECT a FROM table1 ORDER BY 1',
+        'SELECT t1.a FROM table1 AS t1 JOIN table1 AS t2 ON t1.a = t2.a + (1 - 1)',
+    )
+    def test_results_unchanged(self, query):
+        # type: (str) -> None
+        node = parse_query(query)
+        unfolded_result = node.execute(DatasetTableContext(self.datasets))
+        fold_constants(node)
+        folded_result = node.execute(DatasetTableContext(self.datasets))
+        assert unfolded_result.table is not None and folded_result.table is not None
+        self.assertEqual(folded_result.table.to_list_of_lists(),
+                         unfolded_result.table.to_list_of_lists())
+        self.assertEqual(folded_result.table.types, unfolded_result.table.types)
+
+    def test_order_by_expression_not_folded(self):
+        # type: () -> None
+        # ORDER BY 2 would be the second column; ORDER BY 1 + 1 is not.
+        with self.assertRaisesRegexp(ValueError, 'Invalid field specification'):
+            execute_query('SELECT a, b FROM table1 ORDER BY 1 + 1', self.datasets)
+
+    def test_error_left_to_evaluation(self):
+        # type: () -> None
+        # The invalid cast is not evaluated, as there are no rows.
+        result = execute_query("SELECT CAST('x' AS INT64) FROM table1 WHERE FALSE", self.datasets)
+        self.assertEqual(result.table.to_list_of_lists(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
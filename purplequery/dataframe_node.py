@@ -9,18 +9,22 @@ import itertools
 import operator
 from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, Union  # noqa: F401
 
+import numpy as np
 import pandas as pd
 
 from six.moves import reduce
 
 from .bq_abstract_syntax_tree import (EMPTY_CONTEXT, EMPTY_NODE,  # noqa: F401
                                       AbstractSyntaxTreeNode, DataframeNode, DatasetType,
-                                      EvaluatableNode, EvaluationContext, Field,
-                                      MarkerSyntaxTreeNode, TableContext, _EmptyNode)
+                                      EvaluatableNode, EvaluatableNodeWithChildren,
+                                      EvaluationContext, Field, MarkerSyntaxTreeNode,
+                                      TableContext, _EmptyNode)
 from .bq_types import (BQArray, BQStructType, BQType, TypedDataFrame, TypedSeries,  # noqa: F401
                        implicitly_coerce)
 from .evaluatable_node import Array, Selector, StarSelector, Value  # noqa: F401
+from .filter_evaluation import filter_positions, true_positions
 from .join import DataSource  # noqa: F401
+from .query_plan import plan_scope, plan_stage
 
 DEFAULT_TABLE_NAME = None
 
@@ -28,24 +32,150 @@ _OrderByType = List[Tuple[Field, str]]
 _LimitType = Tuple[EvaluatableNode, EvaluatableNode]
 
 
+# The ORDER BY of a query with a LIMIT only selects the rows that might be among the first LIMIT
+# rows before sorting if there are at least this many times as many rows in total; otherwise the
+# selection isn't worth it.
+_TOP_ROWS_MIN_SELECTIVITY = 4
+
+
+def _top_rows_candidates(dataframe, column, ascending, num_rows):
+    # type: (pd.DataFrame, str, bool, int) -> pd.DataFrame
+    '''Returns the rows that could be among the first rows of a table once it's sorted.
+
+    Rather than sort the whole table to find its first num_rows rows by some ORDER BY, we use a
+    partial selection (nsmallest or nlargest, which don't sort) on the first ORDER BY column to find
+    the value that the last of those rows has in that column, and keep only the rows whose value
+    is as good or better.  All rows tied with that value are kept, so that they can be ordered by
+    the other ORDER BY columns, or by their original order.
+
+    Args:
+        dataframe: The table.
+        column: The first column that the table is ordered by.
+        ascending: Whether it's in ascending order.
+        num_rows: How many of the first rows are needed.
+    Returns:
+        Some rows of the table, in their original order, that include the first num_rows rows once
+        sorted.  The whole table is returned if selecting rows wouldn't be worthwhile, or isn't
+        supported for the column's type.
+    '''
+    values = dataframe[column]
+    if (num_rows * _TOP_ROWS_MIN_SELECTIVITY > len(values)
+            or pd.api.types.is_bool_dtype(values.dtype)
+            or not (pd.api.types.is_numeric_dtype(values.dtype)
+                    or pd.api.types.is_datetime64_any_dtype(values.dtype))):
+        return dataframe
+    if num_rows <= 0:
+        return dataframe.iloc[:0]
+    # NULLs are sorted last in either order; if any of them are needed, everything is.
+    if values.count() < num_rows:
+        return dataframe
+    if ascending:
+        last_value = values.nsmallest(num_rows).iloc[-1]
+        return dataframe[(values <= last_value).values]
+    last_value = values.nlargest(num_rows).iloc[-1]
+    return dataframe[(values >= last_value).values]
+
+
+def table_references(node):
+    # type: (Any) -> List[Tuple[str, ...]]
+    '''Finds the paths of the tables a syntax tree refers to, including in subqueries.
+
+    Names defined by WITH clauses are included too, as the paths are found syntactically.
+
+    Args:
+        node: A syntax tree node, or a list or tuple of them.
+    Returns:
+        The path of each TableReference in the tree.
+    '''
+    if isinstance(node, TableReference):
+        return [node.path]
+    if isinstance(node, AbstractSyntaxTreeNode):
+        children = [value for unused_name, value in node.attributes()]  # type: Sequence[Any]
+    elif isinstance(node, (list, tuple)):
+        children = node
+    else:
+        return []
+    return [path for child in children for path in table_references(child)]
+
+
+def _count_table_references(node, name):
+    # type: (Any, str) -> int
+    '''Counts the references to a table name in a syntax tree, including in subqueries.
+
+    References to other tables of the same name (e.g. one defined by a WITH clause of a subquery)
+    are counted too, so the count is an upper bound.
+
+    Args:
+        node: A syntax tree node, or a list or tuple of them.
+        name: The name of the table.
+    Returns:
+        The number of TableReferences to the name.
+    '''
+    return sum(1 for path in table_references(node) if '.'.join(path) == name)
+
+
 class _WithTableContext(TableContext):
-    '''A TableContext augmented by a WITH clause.'''
+    '''A TableContext augmented by a WITH clause.
+
+    The query defining the WITH clause's table is only evaluated when the table is first looked
+    up, and the result is reused by later lookups.  If the table is only referenced once, the
+    query is inlined: a reference needing only some of its first rows (see
+    DataframeNode.get_first_rows) evaluates the query for just those rows.
+    '''
+
+    def __init__(self, name, query, parent_context, inline=False):
+        # type: (str, DataframeNode, TableContext, bool) -> None
+        '''Sets up the context.
 
-    def __init__(self, name, table, parent_context):
-        # type: (str, TypedDataFrame, TableContext) -> None
+        Args:
+            name: The name of the table the WITH clause defines.
+            query: The query defining it.
+            parent_context: The context to evaluate the query in, and to look up other names in.
+            inline: Whether the table is only referenced once.
+        '''
         self.name = name
-        self.table = table
+        self.query = query
         self.parent_context = parent_context
+        self.inline = inline
+        self.table = None  # type: Optional[TypedDataFrame]
+        # The first rows of the table an inlined query was evaluated for, by number of rows; a
+        # correlated subquery looks them up again for every row of the outer query.
+        self.first_rows = {}  # type: Dict[int, TypedDataFrame]
+        self.plan = parent_context.plan
+        self.join_limits = parent_context.join_limits
+        self.filter_statistics = parent_context.filter_statistics
+
+    def _get_name(self, path):
+        # type: (Sequence[str]) -> Optional[str]
+        '''Returns the name a path refers to the WITH clause's table by, or None if it doesn't.'''
+        if len(path) == 1 and path[0] == self.name:
+            return self.name
+        if '.'.join(path) == self.name:
+            return path[-1]
+        return None
 
     def lookup(self, path):
         # type: (Sequence[str]) -> Tuple[TypedDataFrame, Optional[str]]
         '''Look up a path to a table in this context.'''
-
-        if len(path) == 1 and path[0] == self.name:
-            return self.table, self.name
-        if '.'.join(path) == self.name:
-            return self.table, path[-1]
-        return self.parent_context.lookup(path)
+        name = self._get_name(path)
+        if name is None:
+            return self.parent_context.lookup(path)
+        if self.table is None:
+            self.table, _ = self.query.get_dataframe(self.parent_context)
+        return self.table, name
+
+    def lookup_first_rows(self, path, num_rows):
+        # type: (Sequence[str], int) -> Tuple[TypedDataFrame, Optional[str]]
+        '''See TableContext.lookup_first_rows for docstring.'''
+        name = self._get_name(path)
+        if name is None:
+            return self.parent_context.lookup_first_rows(path, num_rows)
+        if self.inline and self.table is None:
+            if num_rows not in self.first_rows:
+                self.first_rows[num_rows], _ = self.query.get_first_rows(self.parent_context,
+                                                                         num_rows)
+            return self.first_rows[num_rows], name
+        return super(_WithTableContext, self).lookup_first_rows(path, num_rows)
 
 
 class QueryExpression(DataframeNode):
@@ -76,8 +206,14 @@ class QueryExpression(DataframeNode):
         self.order_by = order_by
         self.limit = limit
 
-    def _order_by(self, order_by, typed_dataframe, table_name, table_context):
-        # type: (_OrderByType, TypedDataFrame, Optional[str], TableContext) -> TypedDataFrame
+    def _order_by(self,
+                  order_by,  # type: _OrderByType
+                  typed_dataframe,  # type: TypedDataFrame
+                  table_name,  # type: Optional[str]
+                  table_context,  # type: TableContext
+                  num_rows=None,  # type: Optional[int]
+                  ):
+        # type: (...) -> TypedDataFrame
         '''If ORDER BY is specified, sort the data by the given column(s)
         in the given direction(s).
 
@@ -85,6 +221,8 @@ class QueryExpression(DataframeNode):
             typed_dataframe: The currently resolved query as a TypedDataFrame
             table_name: Resolved name of current typed_dataframe
             table_context: A representation of the state of available tables
+            num_rows: If not None, only the first num_rows rows of the result will be used (because
+                of a LIMIT), and the rest may be omitted.
         Returns:
             A new TypedDataFrame that is ordered by the given criteria
         '''
@@ -112,19 +250,23 @@ class QueryExpression(DataframeNode):
             else:
                 # Default sort order in Standard SQL is ASC
                 directions.append(True)
+        dataframe = context.table.dataframe
+        if num_rows is not None:
+            dataframe = _top_rows_candidates(dataframe, fields[0], directions[0], num_rows)
+        # A stable sort, so that sorting only the candidate rows gives the same first rows as
+        # sorting the whole table.
         return TypedDataFrame(
-            context.table.dataframe.sort_values(fields, ascending=directions),
+            dataframe.sort_values(fields, ascending=directions, kind='mergesort'),
             context.table.types)
 
-    def _limit(self, limit, typed_dataframe):
-        # type: (_LimitType, TypedDataFrame) -> TypedDataFrame
-        '''If limit is specified, only return that many rows.
-        If offset is specified, start at that row number, not the first row.
+    def _evaluate_limit(self, limit):
+        # type: (_LimitType) -> Tuple[int, int]
+        '''Evaluates the number of rows to return, and the offset of the first one.
 
         Args:
-            typed_dataframe: The currently resolved query as a TypedDataFrame
+            limit: The LIMIT expression, and the OFFSET expression or EMPTY_NODE.
         Returns:
-            A new TypedDataFrame that conforms to the given limit and offset
+            The limit and the offset (0 if not specified).
         '''
         limit_expression, offset_expression = limit
 
@@ -132,7 +274,7 @@ class QueryExpression(DataframeNode):
         limit_value = limit_expression.evaluate(EMPTY_CONTEXT)
         if not isinstance(limit_value, TypedSeries):
             raise ValueError("invalid limit expression {}".format(limit_expression))
-        limit, = limit_value.series
+        limit_count, = limit_value.series
         if offset_expression is not EMPTY_NODE:
             # Use empty context because the offset is also a constant
             offset_value = offset_expression.evaluate(EMPTY_CONTEXT)
@@ -141,69 +283,242 @@ class QueryExpression(DataframeNode):
             offset, = offset_value.series
         else:
             offset = 0
-        return TypedDataFrame(
-            typed_dataframe.dataframe[offset:limit + offset],
-            typed_dataframe.types)
+        return limit_count, offset
 
     def get_dataframe(self, table_context, outer_context=None):
         # type: (TableContext, Optional[EvaluationContext]) -> Tuple[TypedDataFrame, Optional[str]]
         '''See parent, DataframeNode'''
+        return self._get_dataframe(table_context, outer_context, None)
+
+    def get_first_rows(self, table_context, num_rows, outer_context=None):
+        # type: (TableContext, int, Optional[EvaluationContext]) -> Tuple[TypedDataFrame, Optional[str]]  # noqa: E501
+        '''See parent, DataframeNode'''
+        return self._get_dataframe(table_context, outer_context, num_rows)
+
+    def _get_dataframe(self, table_context, outer_context, num_rows):
+        # type: (TableContext, Optional[EvaluationContext], Optional[int]) -> Tuple[TypedDataFrame, Optional[str]]  # noqa: E501
+        '''Computes the result of the query, or only its first num_rows rows if not None.
+
+        A LIMIT (from this query or a containing one) is pushed down into the base query: without
+        ORDER BY, only the first OFFSET + LIMIT rows of the base query are computed, and with ORDER
+        BY, only those rows are selected before sorting (see _order_by).
+        '''
+        with plan_scope(table_context):
+            return self._get_dataframe_in_scope(table_context, outer_context, num_rows)
+
+    def _get_dataframe_in_scope(self, table_context, outer_context, num_rows):
+        # type: (TableContext, Optional[EvaluationContext], Optional[int]) -> Tuple[TypedDataFrame, Optional[str]]  # noqa: E501
+        '''See _get_dataframe; the stages of executing the query are recorded in their own scope.'''
         if not isinstance(self.with_clauses, _EmptyNode):
             name_list = [name for name, _ in self.with_clauses]
             if len(name_list) > len(set(name_list)):
                 raise ValueError("Duplicate names in WITH clauses are not allowed: {}"
                                  .format(name_list))
-            for name, dataframe_node in self.with_clauses:
-                table_context = _WithTableContext(name,
-                                                  dataframe_node.get_dataframe(table_context)[0],
-                                                  table_context)
-
-        typed_dataframe, table_name = self.base_query.get_dataframe(table_context, outer_context)
+            for i, (name, dataframe_node) in enumerate(self.with_clauses):
+                # Later WITH clauses and the query itself may refer to this WITH clause's table.
+                num_references = _count_table_references(
+                    [query for _, query in self.with_clauses[i + 1:]]
+                    + [self.base_query, self.order_by],
+                    name)
+                table_context = _WithTableContext(name, dataframe_node, table_context,
+                                                  inline=num_references == 1)
+
+        offset = 0
+        if not isinstance(self.limit, _EmptyNode):
+            limit_count, offset = self._evaluate_limit(self.limit)
+            num_rows = limit_count if num_rows is None else min(num_rows, limit_count)
+        # The number of rows of the (sorted) base query that are needed, if not all of them.
+        num_base_rows = None if num_rows is None else offset + num_rows
+
+        if num_base_rows is not None and isinstance(self.order_by, _EmptyNode):
+            typed_dataframe, table_name = self.base_query.get_first_rows(
+                table_context, num_base_rows, outer_context)
+        else:
+            typed_dataframe, table_name = self.base_query.get_dataframe(table_context,
+                                                                        outer_context)
 
         if not isinstance(self.order_by, _EmptyNode):
-            typed_dataframe = self._order_by(
-                self.order_by, typed_dataframe, table_name, table_context)
-
-        if not isinstance(self.limit, _EmptyNode):
-            typed_dataframe = self._limit(self.limit, typed_dataframe)
+            with plan_stage(table_context, 'Sort', 'SORT', ['ORDER BY']) as stage:
+                typed_dataframe = self._order_by(
+                    self.order_by, typed_dataframe, table_name, table_context, num_base_rows)
+                stage.set_output(typed_dataframe)
+
+        if num_base_rows is not None:
+            with plan_stage(table_context, 'Limit', 'LIMIT',
+                            ['LIMIT {} OFFSET {}'.format(num_base_rows - offset, offset)]) as stage:
+                typed_dataframe = TypedDataFrame(
+                    typed_dataframe.dataframe.iloc[offset:num_base_rows], typed_dataframe.types)
+                stage.set_output(typed_dataframe)
 
         return typed_dataframe, DEFAULT_TABLE_NAME
 
 
+def _hashable(value):
+    # type: (Any) -> Any
+    '''Returns a hashable equivalent of an ARRAY or STRUCT value, with NULL elements as None.
+
+    Arrays and structs are represented as tuples, which are hashable, but NULL elements may be
+    NaNs, which are never equal to one another.
+    '''
+    if isinstance(value, (tuple, list)):
+        return tuple(_hashable(element) for element in value)
+    if isinstance(value, float) and np.isnan(value):
+        return None
+    return value
+
+
+def _factorize_rows(dataframes, types):
+    # type: (List[TypedDataFrame], List[BQType]) -> List[np.ndarray]
+    '''Encodes each row of some tables with the same columns as a single int64 code.
+
+    Each column is factorized over all the tables together, and the column codes are combined
+    into one code per row, so two rows (of the same or different tables) get the same code exactly
+    when all their values are equal.  Unlike in comparisons, NULL is considered equal to NULL, as
+    in set operations and SELECT DISTINCT.
+
+    Args:
+        dataframes: The tables.
+        types: The types of their columns, coerced to a common type.
+    Returns:
+        The row codes of each table.
+    '''
+    num_rows = [len(dataframe.dataframe) for dataframe in dataframes]
+    codes = np.zeros(sum(num_rows), dtype=np.int64)
+    num_codes = 1
+    for i, type_ in enumerate(types):
+        columns = [dataframe.dataframe.iloc[:, i] for dataframe in dataframes]
+        if all(pd.api.types.is_numeric_dtype(column.dtype) for column in columns):
+            columns = [column.astype(np.float64) for column in columns]
+        elif isinstance(type_, (BQArray, BQStructType)):
+            columns = [column.map(_hashable) for column in columns]
+        column_codes, uniques = pd.factorize(pd.concat(columns, ignore_index=True).values)
+        # NULLs are coded -1; shift them to be their own value, 0.
+        column_codes = column_codes.astype(np.int64) + 1
+        num_uniques = len(uniques) + 1
+        if num_codes * num_uniques >= np.iinfo(np.int64).max:
+            # Renumber the combined codes densely so that they can't overflow.
+            codes, combined_uniques = pd.factorize(codes)
+            num_codes = len(combined_uniques)
+        codes = codes * num_uniques + column_codes
+        num_codes *= num_uniques
+    offsets = np.cumsum([0] + num_rows)
+    return [codes[start:stop] for start, stop in zip(offsets[:-1], offsets[1:])]
+
+
 class SetOperation(DataframeNode):
     '''Represents a set operation between two other query expressions - UNION, INTERSECT, etc.'''
 
+    # Set operators for which (q1 op q2) op q3 is the same as q1 op (q2 op q3).
+    _ASSOCIATIVE_OPERATORS = ('UNION_ALL', 'UNION_DISTINCT', 'INTERSECT_DISTINCT')
+
     def __init__(self, left_query, set_operator, right_query):
         # type: (DataframeNode, str, DataframeNode) -> None
         self.left_query = left_query
         self.set_operator = set_operator
         self.right_query = right_query
 
+    def _flatten(self, query, is_first):
+        # type: (DataframeNode, bool) -> List[DataframeNode]
+        '''Returns the queries combined by a chain of this set operator, in order.
+
+        Args:
+            query: Part of the chain.
+            is_first: Whether query starts the chain.
+        Returns:
+            The queries that query combines with this set operator, or just [query].
+        '''
+        if ((is_first or self.set_operator in self._ASSOCIATIVE_OPERATORS)
+                and isinstance(query, QueryExpression)
+                and isinstance(query.with_clauses, _EmptyNode)
+                and isinstance(query.order_by, _EmptyNode)
+                and isinstance(query.limit, _EmptyNode)):
+            query = query.base_query
+        if isinstance(query, SetOperation) and query.set_operator == self.set_operator:
+            return self._flatten(query.left_query, is_first) + self._flatten(query.right_query,
+                                                                             False)
+        return [query]
+
+    def _operands(self):
+        # type: () -> List[DataframeNode]
+        '''Returns all the queries combined by the chain of set operators this node starts.
+
+        The grammar parses q1 UNION ALL q2 UNION ALL q3 as nested SetOperations,
+        q1 UNION ALL (q2 UNION ALL q3).  A chain of the same operator is flattened into a single
+        list of queries, so that it can be executed as one n-ary operation; set operators are left
+        associative, so q1 EXCEPT DISTINCT q2 EXCEPT DISTINCT q3 removes both q2's and q3's rows
+        from q1's.  Parenthesized chains without their own WITH, ORDER BY or LIMIT clauses are
+        flattened as well, unless that would change the result (as for q1 EXCEPT DISTINCT (q2
+        EXCEPT DISTINCT q3)).
+        '''
+        return self._flatten(self.left_query, True) + self._flatten(self.right_query, False)
+
+    def _stage_name(self):
+        # type: () -> str
+        '''Returns the name of this set operation's stage in a query plan, e.g. 'Union'.'''
+        return self.set_operator.split('_')[0].capitalize()
+
+    def _combine(self, dataframes):
+        # type: (List[TypedDataFrame]) -> TypedDataFrame
+        '''Combines the results of all the queries of the chain with this set operator.'''
+        num_columns = len(dataframes[0].types)
+        for dataframe in dataframes[1:]:
+            if len(dataframe.types) != num_columns:
+                raise ValueError("Queries in {} have mismatched column count: {} vs {}"
+                                 .format(self.set_operator, num_columns, len(dataframe.types)))
+        combined_types = [implicitly_coerce(*column_types)
+                          for column_types in zip(*[dataframe.types for dataframe in dataframes])]
+        # All queries' results take the first query's column names.
+        columns = dataframes[0].dataframe.columns
+        if self.set_operator in ('UNION_ALL', 'UNION_DISTINCT'):
+            renamed = []
+            for dataframe in dataframes:
+                renamed_dataframe = dataframe.dataframe.copy(deep=False)
+                renamed_dataframe.columns = columns
+                renamed.append(renamed_dataframe)
+            result = pd.concat(renamed, ignore_index=True)
+            if self.set_operator == 'UNION_DISTINCT':
+                codes = np.concatenate(_factorize_rows(dataframes, combined_types))
+                result = result[~pd.Series(codes).duplicated().values]
+            return TypedDataFrame(result, combined_types)
+        elif self.set_operator in ('INTERSECT_DISTINCT', 'EXCEPT_DISTINCT'):
+            codes = _factorize_rows(dataframes, combined_types)
+            first_codes = codes[0]
+            rows_to_keep = ~pd.Series(first_codes).duplicated().values
+            for other_codes in codes[1:]:
+                in_other = np.isin(first_codes, other_codes)
+                rows_to_keep &= in_other if self.set_operator == 'INTERSECT_DISTINCT' else ~in_other
+            return TypedDataFrame(dataframes[0].dataframe[rows_to_keep], combined_types)
+        else:
+            raise NotImplementedError("set operation {} not implemented".format(self.set_operator))
+
     def get_dataframe(self, table_context, outer_context=None):
         # type: (TableContext, Optional[EvaluationContext]) -> Tuple[TypedDataFrame, Optional[str]]
         '''See parent, DataframeNode'''
-        left_dataframe, unused_left_name = self.left_query.get_dataframe(
-            table_context, outer_context)
-        right_dataframe, unused_right_name = self.right_query.get_dataframe(
-            table_context, outer_context)
-        num_left_columns = len(left_dataframe.types)
-        num_right_columns = len(right_dataframe.types)
-        if num_left_columns != num_right_columns:
-            raise ValueError("Queries in {} ALL have mismatched column count: {} vs {}"
-                             .format(self.set_operator, num_left_columns, num_right_columns))
-        combined_types = [implicitly_coerce(left_type, right_type)
-                          for left_type, right_type in zip(left_dataframe.types,
-                                                           right_dataframe.types)]
-        if self.set_operator == 'UNION_ALL':
-            return TypedDataFrame(
-                pd.concat([left_dataframe.dataframe,
-                           # Rename second table to use first table's column names
-                           right_dataframe.dataframe.rename(
-                               columns=dict(zip(right_dataframe.dataframe.columns,
-                                                left_dataframe.dataframe.columns)))]),
-                combined_types), DEFAULT_TABLE_NAME
-        else:
-            raise NotImplementedError("set operation {} not implemented".format(self.set_operator))
+        with plan_stage(table_context, self._stage_name(), 'COMPUTE',
+                        [self.set_operator.replace('_', ' ')]) as stage:
+            dataframes = [query.get_dataframe(table_context, outer_context)[0]
+                          for query in self._operands()]
+            result = self._combine(dataframes)
+            stage.set_output(result)
+        return result, DEFAULT_TABLE_NAME
+
+    def get_first_rows(self, table_context, num_rows, outer_context=None):
+        # type: (TableContext, int, Optional[EvaluationContext]) -> Tuple[TypedDataFrame, Optional[str]]  # noqa: E501
+        '''See parent, DataframeNode'''
+        if self.set_operator != 'UNION_ALL':
+            return super(SetOperation, self).get_first_rows(table_context, num_rows, outer_context)
+        # The first rows of a UNION ALL come from its first queries.  Once they have produced
+        # enough rows, the remaining queries are only asked for zero rows, to learn their types.
+        with plan_stage(table_context, self._stage_name(), 'COMPUTE', ['UNION ALL']) as stage:
+            dataframes = []
+            for query in self._operands():
+                dataframe, unused_name = query.get_first_rows(table_context, num_rows,
+                                                              outer_context)
+                num_rows -= len(dataframe.dataframe)
+                dataframes.append(dataframe)
+            result = self._combine(dataframes)
+            stage.set_output(result)
+        return result, DEFAULT_TABLE_NAME
 
 
 def _evaluate_fields_as_dataframe(fields, context):
@@ -230,6 +545,58 @@ def _evaluate_fields_as_dataframe(fields, context):
     return TypedDataFrame(combined_evaluated_data, types)
 
 
+def _replace_selected_expressions(expression, selected_names):
+    # type: (EvaluatableNode, Dict[EvaluatableNode, str]) -> EvaluatableNode
+    '''Replaces the subexpressions of an expression that were selected with their columns.
+
+    Args:
+        expression: An expression evaluated on a query's result, i.e. its HAVING condition.
+        selected_names: The names of the result's columns, by the expressions they were selected
+            as.
+    Returns:
+        An equivalent expression, looking up the result's columns rather than evaluating them
+        again.
+    '''
+    name = selected_names.get(expression) if expression.structural_key() is not None else None
+    if name is not None:
+        return Field((name,))
+    if isinstance(expression, EvaluatableNodeWithChildren):
+        children = [_replace_selected_expressions(child, selected_names)
+                    for child in expression.children]
+        if any(new is not old for new, old in zip(children, expression.children)):
+            return expression.copy(children)
+    return expression
+
+
+def _reuse_selected_columns(expression, selectors):
+    # type: (EvaluatableNode, Sequence[EvaluatableNode]) -> EvaluatableNode
+    '''Rewrites a HAVING condition to look up the expressions it shares with the SELECT list.
+
+    For example, SELECT key, SUM(value) AS total ... HAVING SUM(value) > 10 computes the sum once,
+    and compares the total column of the result to 10.
+
+    Args:
+        expression: The HAVING condition.
+        selectors: The expanded SELECT list.
+    Returns:
+        An equivalent condition.
+    '''
+    selector_names = [selector.name() for selector in selectors if isinstance(selector, Selector)]
+    selected_names = {}  # type: Dict[EvaluatableNode, str]
+    for selector in selectors:
+        if not isinstance(selector, Selector) or selector_names.count(selector.name()) > 1:
+            continue
+        selected, = selector.children
+        # Looking up a column in the result is no cheaper than looking up a field.
+        if not isinstance(selected, EvaluatableNodeWithChildren):
+            continue
+        if selected.structural_key() is not None:
+            selected_names.setdefault(selected, selector.name())
+    if not selected_names:
+        return expression
+    return _replace_selected_expressions(expression, selected_names)
+
+
 class Select(MarkerSyntaxTreeNode, DataframeNode):
     '''SELECT query to retrieve rows from a table(s).
 
@@ -255,9 +622,14 @@ class Select(MarkerSyntaxTreeNode, DataframeNode):
             having: HAVING filter condition, if any
         '''
         self.modifier = modifier
-        self.fields = fields
-        for i, field in enumerate(self.fields):
-            field.position = i + 1  # position is 1-up, i.e the first selector is position #1.
+        self.fields = []  # type: List[Union[Selector, StarSelector]]
+        for i, field in enumerate(fields):
+            # position is 1-up, i.e the first selector is position #1.
+            if isinstance(field, Selector):
+                field = field.with_position(i + 1)
+            else:
+                field.position = i + 1
+            self.fields.append(field)
         self.from_ = from_
         self.where = where
         if isinstance(group_by, _EmptyNode):
@@ -282,6 +654,24 @@ class Select(MarkerSyntaxTreeNode, DataframeNode):
                     self.group_by.append(grouper)
         self.having = having
 
+    def _is_row_wise(self):
+        # type: () -> bool
+        '''Returns true if each row of the result is computed from one row of the FROM clause.
+
+        In that case, the first rows of the result can be computed from just the first rows of the
+        FROM clause (or of the rows satisfying the WHERE condition).
+        '''
+        if (not isinstance(self.group_by, _EmptyNode) or not isinstance(self.having, _EmptyNode)
+                or self.modifier == 'DISTINCT'):
+            return False
+        expressions = []  # type: List[EvaluatableNode]
+        for selector in self.fields:
+            if isinstance(selector, Selector):
+                expressions.append(selector)
+            elif not isinstance(selector.replacement, _EmptyNode):
+                expressions.extend(expression for expression, _, _ in selector.replacement)
+        return not any(expression.depends_on_other_rows() for expression in expressions)
+
     def get_dataframe(self, table_context, outer_context=None):
         # type: (TableContext, Optional[EvaluationContext]) -> Tuple[TypedDataFrame, Optional[str]]
         '''Scope the given datasets by the criteria specified in the
@@ -295,9 +685,28 @@ class Select(MarkerSyntaxTreeNode, DataframeNode):
             Tuple of the resulting table (TypedDataFrame) and a name for
             this table
         '''
+        return self._get_dataframe(table_context, outer_context, None)
+
+    def get_first_rows(self, table_context, num_rows, outer_context=None):
+        # type: (TableContext, int, Optional[EvaluationContext]) -> Tuple[TypedDataFrame, Optional[str]]  # noqa: E501
+        '''See parent, DataframeNode'''
+        return self._get_dataframe(table_context, outer_context, num_rows)
+
+    def _get_dataframe(self, table_context, outer_context, num_rows):
+        # type: (TableContext, Optional[EvaluationContext], Optional[int]) -> Tuple[TypedDataFrame, Optional[str]]  # noqa: E501
+        '''Computes the result of the query, or only its first num_rows rows if not None.'''
+        with plan_scope(table_context):
+            return self._get_dataframe_in_scope(table_context, outer_context, num_rows)
+
+    def _get_dataframe_in_scope(self, table_context, outer_context, num_rows):
+        # type: (TableContext, Optional[EvaluationContext], Optional[int]) -> Tuple[TypedDataFrame, Optional[str]]  # noqa: E501
+        '''See _get_dataframe; the stages of executing the query are recorded in their own scope.'''
+        row_wise = num_rows is not None and self._is_row_wise()
 
         if isinstance(self.from_, _EmptyNode):
             context = EvaluationContext(table_context)
+        elif row_wise and isinstance(self.where, _EmptyNode):
+            context = self.from_.create_context(table_context, num_rows)
         else:
             context = self.from_.create_context(table_context)
 
@@ -313,37 +722,64 @@ class Select(MarkerSyntaxTreeNode, DataframeNode):
         context.selector_names = [
                 selector.name() for selector in self.fields if isinstance(selector, Selector)]
 
+        # Resolve the fields the query refers to once, before evaluating any of them.
+        context.bind_fields(
+                expanded_fields + ([] if isinstance(self.where, _EmptyNode) else [self.where]))
+
         if not isinstance(self.where, _EmptyNode):
-            # Filter table by WHERE condition
-            rows_to_keep = self.where.evaluate(context)
-            if not isinstance(rows_to_keep, TypedSeries):
-                raise ValueError("Invalid WHERE expression {}".format(rows_to_keep))
-            context.table = TypedDataFrame(
-                context.table.dataframe.loc[rows_to_keep.series],
-                context.table.types)
-
-        if not isinstance(self.group_by, _EmptyNode):
-            fields_for_evaluation = context.do_group_by(
-                expanded_fields, self.group_by)  # type: Sequence[EvaluatableNode]
-        elif any(field.is_aggregated() for field in expanded_fields):
-            fields_for_evaluation = context.do_group_by(expanded_fields, [])
+            with plan_stage(table_context, 'Filter', 'FILTER', ['WHERE']) as stage:
+                # Filter table by WHERE condition.  The columns are only gathered at the
+                # positions kept as they are looked up.
+                positions = filter_positions(self.where, context)
+                context.select_rows(positions)
+                stage.set_output_rows(len(positions), positions.nbytes)
+
+        if row_wise and context.num_rows > num_rows:
+            # Only the rows that will be returned need to be evaluated.
+            context.select_rows(np.arange(min(num_rows, context.num_rows)))
+
+        aggregated = (not isinstance(self.group_by, _EmptyNode) or
+                      any(field.is_aggregated() for field in expanded_fields))
+        if aggregated:
+            stage_name, step_kind, substep = 'Aggregate', 'AGGREGATE', 'GROUP BY'
+        elif any(field.depends_on_other_rows() for field in expanded_fields):
+            stage_name, step_kind, substep = 'Window', 'ANALYTIC_FUNCTION', 'OVER'
         else:
-            fields_for_evaluation = expanded_fields
-        result = _evaluate_fields_as_dataframe(fields_for_evaluation, context)
+            stage_name, step_kind, substep = 'Project', 'COMPUTE', 'SELECT'
+        with plan_stage(table_context, stage_name, step_kind, [substep]) as stage:
+            if not isinstance(self.group_by, _EmptyNode):
+                fields_for_evaluation = context.do_group_by(
+                    expanded_fields, self.group_by)  # type: Sequence[EvaluatableNode]
+            elif aggregated:
+                fields_for_evaluation = context.do_group_by(expanded_fields, [])
+            else:
+                fields_for_evaluation = expanded_fields
+            result = _evaluate_fields_as_dataframe(fields_for_evaluation, context)
+            stage.set_output(result)
 
         if not isinstance(self.having, _EmptyNode):
-            having_context = EvaluationContext(table_context)
-            having_context.add_table_from_dataframe(result, None, EMPTY_NODE)
-            having_context.add_subcontext(context)
-            having_context.group_by_paths = context.group_by_paths
-            having = self.having.mark_grouped_by(context.group_by_paths, having_context)
-            rows_to_keep = having.evaluate(having_context)
-            if not isinstance(rows_to_keep, TypedSeries):
-                raise ValueError("Invalid HAVING expression {}".format(rows_to_keep))
-            result = TypedDataFrame(result.dataframe.loc[rows_to_keep.series], result.types)
+            with plan_stage(table_context, 'Filter', 'FILTER', ['HAVING']) as stage:
+                having_context = EvaluationContext(table_context)
+                having_context.add_table_from_dataframe(result, None, EMPTY_NODE)
+                having_context.add_subcontext(context)
+                having_context.group_by_paths = context.group_by_paths
+                having = _reuse_selected_columns(self.having, expanded_fields)
+                having = having.mark_grouped_by(context.group_by_paths, having_context)
+                having_context.bind_fields([having])
+                rows_to_keep = having.evaluate(having_context)
+                if not isinstance(rows_to_keep, TypedSeries):
+                    raise ValueError("Invalid HAVING expression {}".format(rows_to_keep))
+                result = TypedDataFrame(result.dataframe.take(true_positions(rows_to_keep)),
+                                        result.types)
+                stage.set_output(result)
 
         if self.modifier == 'DISTINCT':
-            result = TypedDataFrame(result.dataframe.drop_duplicates(), result.types)
+            with plan_stage(table_context, 'Aggregate', 'AGGREGATE', ['DISTINCT']) as stage:
+                result = TypedDataFrame(result.dataframe.drop_duplicates(), result.types)
+                stage.set_output(result)
+
+        if num_rows is not None:
+            result = TypedDataFrame(result.dataframe.iloc[:num_rows], result.types)
 
         return result, DEFAULT_TABLE_NAME
 
@@ -367,7 +803,23 @@ class TableReference(DataframeNode):
         # type: (TableContext, Optional[EvaluationContext]) -> Tuple[TypedDataFrame, Optional[str]]
         '''See parent, DataframeNode'''
         del outer_context  # Unused
-        return table_context.lookup(self.path)
+        with plan_stage(table_context, 'Scan', 'READ', ['FROM ' + '.'.join(self.path)],
+                        consumes_input=False) as stage:
+            table, name = table_context.lookup(self.path)
+            stage.set_input_rows(len(table.dataframe))
+            stage.set_output(table)
+        return table, name
+
+    def get_first_rows(self, table_context, num_rows, outer_context=None):
+        # type: (TableContext, int, Optional[EvaluationContext]) -> Tuple[TypedDataFrame, Optional[str]]  # noqa: E501
+        '''See parent, DataframeNode'''
+        del outer_context  # Unused
+        with plan_stage(table_context, 'Scan', 'READ', ['FROM ' + '.'.join(self.path)],
+                        consumes_input=False) as stage:
+            table, name = table_context.lookup_first_rows(self.path, num_rows)
+            stage.set_input_rows(len(table.dataframe))
+            stage.set_output(table)
+        return table, name
 
 
 class Unnest(DataframeNode, MarkerSyntaxTreeNode):
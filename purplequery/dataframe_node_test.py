@@ -9,11 +9,13 @@ from typing import Any, List, Tuple  # noqa: F401
 import pandas as pd
 from ddt import data, ddt, unpack
 
+from purplequery import dataframe_node
 from purplequery.binary_expression import BinaryExpression
 from purplequery.bq_abstract_syntax_tree import (EMPTY_NODE, EvaluatableNode, Field,  # noqa: F401
                                                  TableContext)
-from purplequery.bq_types import BQScalarType, TypedDataFrame
-from purplequery.dataframe_node import QueryExpression, Select, TableReference
+from purplequery.bq_types import BQArray, BQScalarType, TypedDataFrame
+from purplequery.dataframe_node import (QueryExpression, Select, SetOperation, TableReference,
+                                        _top_rows_candidates)
 from purplequery.evaluatable_node import Selector, StarSelector, Value
 from purplequery.grammar import query_expression as query_expression_rule
 from purplequery.grammar import select as select_rule
@@ -70,6 +72,10 @@ class DataframeNodeTest(unittest.TestCase):
              expected_result=[[1, 2, 3], [4, 5, 6]]),
         dict(query_expression='select 1 union all select 2.0',
              expected_result=[[1.0], [2.0]]),
+        dict(query_expression='select 1 union all select 2 union all select 3.5',
+             expected_result=[[1.0], [2.0], [3.5]]),
+        dict(query_expression='(select a from my_table union all select 2) union all select 3',
+             expected_result=[[1], [2], [3]]),
     )
     @unpack
     def test_query_expression_set_operation(self, query_expression, expected_result):
@@ -87,9 +93,84 @@ class DataframeNodeTest(unittest.TestCase):
         self.assertFalse(leftover)
         self.assertEqual(dataframe.to_list_of_lists(), expected_result)
 
+    @data(
+        dict(query_expression='select 1 union distinct select 2 union distinct select 1.0',
+             expected_result=[[1.0], [2.0]]),
+        dict(query_expression='select a from my_table union distinct select a from my_table',
+             expected_result=[[1], [None], [2]]),
+        dict(query_expression='select a, s from my_table intersect distinct select 1, "x"',
+             expected_result=[[1, 'x']]),
+        dict(query_expression=('select a from my_table intersect distinct '
+                               '(select null union all select 2)'),
+             expected_result=[[None], [2]]),
+        dict(query_expression='select a from my_table except distinct select 2',
+             expected_result=[[1], [None]]),
+        dict(query_expression=('select a from my_table except distinct select 2 '
+                               'except distinct select null'),
+             expected_result=[[1]]),
+        # Set operators are left associative.
+        dict(query_expression=('select a from my_table except distinct '
+                               '(select a from my_table except distinct select 1)'),
+             expected_result=[[1]]),
+        dict(query_expression=('select arr from my_table union distinct '
+                               'select arr from my_table'),
+             expected_result=[[(1, 2)], [None], [(3,)]]),
+        dict(query_expression='select arr from my_table except distinct select [1, 2]',
+             expected_result=[[None], [(3,)]]),
+    )
+    @unpack
+    def test_query_expression_distinct_set_operation(self, query_expression, expected_result):
+        # type: (str, List[List[Any]]) -> None
+        table_context = DatasetTableContext(
+            {'my_project':
+             {'my_dataset':
+              {'my_table':
+               TypedDataFrame(pd.DataFrame([[1, 'x', (1, 2)],
+                                            [None, 'y', None],
+                                            [1, 'x', (1, 2)],
+                                            [2, 'z', (3,)]],
+                                           columns=['a', 's', 'arr']),
+                              [BQScalarType.INTEGER,
+                               BQScalarType.STRING,
+                               BQArray(BQScalarType.INTEGER)])}}})
+        query_expression_node, leftover = query_expression_rule(tokenize(query_expression))
+        self.assertFalse(leftover)
+        dataframe, unused_table_name = query_expression_node.get_dataframe(table_context)
+        self.assertEqual(dataframe.to_list_of_lists(), expected_result)
+
+    def test_set_operation_chain_is_flattened(self):
+        # type: () -> None
+        query_expression_node, leftover = query_expression_rule(tokenize(
+            'select 1 union all (select 2 union all select 3) union all select 4'))
+        self.assertFalse(leftover)
+        assert isinstance(query_expression_node, SetOperation)
+
+        self.assertEqual(len(query_expression_node._operands()), 4)
+        dataframe, unused_table_name = query_expression_node.get_dataframe(self.table_context)
+        self.assertEqual(dataframe.to_list_of_lists(), [[1], [2], [3], [4]])
+
+    @data(
+        dict(set_operator='UNION ALL', expected_result=[[1, 1], [1, 2], [2, 3], [2, 4], [3, 5]]),
+        dict(set_operator='UNION DISTINCT', expected_result=[[1, 1], [2, 2], [3, 3]]),
+    )
+    @unpack
+    def test_analytic_function_over_union(self, set_operator, expected_result):
+        # type: (str, List[List[int]]) -> None
+        # Each query's rows are numbered from zero, so the union must renumber them for the
+        # analytic function's window to line up.
+        query_expression_node, leftover = query_expression_rule(tokenize(
+            'select a, row_number() over (order by a) as r from '
+            '(select a from my_table {} select a from my_table where a < 3)'.format(
+                set_operator)))
+        self.assertFalse(leftover)
+        dataframe, unused_table_name = query_expression_node.get_dataframe(self.table_context)
+        self.assertEqual(sorted(dataframe.to_list_of_lists()), expected_result)
+
     @data(
         dict(query_expression='select 1 union all select 2, 3',
              error='mismatched column count: 1 vs 2'),
+        dict(query_expression='select 1 union all select 2 union all select 3, 4',
+             error='mismatched column count: 1 vs 2'),
         dict(query_expression='select 1 union all select "foo"',
              error='Cannot implicitly coerce the given types'),
     )
@@ -137,6 +218,79 @@ class DataframeNodeTest(unittest.TestCase):
         dataframe, _ = query_expression_node.get_dataframe(self.table_context)
         self.assertEqual(dataframe.to_list_of_lists(), expected_result)
 
+    # CAST('x' AS INT64) is an error, so these queries only succeed if the WITH clause containing
+    # it isn't evaluated, or is only evaluated on the rows that are needed.
+    @data(
+        dict(query_expression=('WITH unused AS (SELECT CAST("x" AS INT64) AS c) '
+                               'SELECT * FROM my_table'),
+             expected_result=[[1], [2], [3]]),
+        dict(query_expression=('WITH q1 AS (SELECT CAST(s AS INT64) AS c FROM t) '
+                               'SELECT * FROM q1 LIMIT 2'),
+             expected_result=[[1], [2]]),
+        dict(query_expression=('WITH q1 AS (SELECT CAST(s AS INT64) AS c FROM t),'
+                               '     q2 AS (SELECT c + 1 AS d FROM q1) '
+                               'SELECT * FROM q2 LIMIT 1'),
+             expected_result=[[2]]),
+    )
+    @unpack
+    def test_with_clause_lazy(self, query_expression, expected_result):
+        # type: (str, List[List[int]]) -> None
+        table_context = DatasetTableContext(
+            {'my_project':
+             {'my_dataset':
+              {'my_table': TypedDataFrame(pd.DataFrame([[1], [2], [3]], columns=['a']),
+                                          [BQScalarType.INTEGER]),
+               't': TypedDataFrame(pd.DataFrame([['1'], ['2'], ['x']], columns=['s']),
+                                   [BQScalarType.STRING])}}})
+        query_expression_node, leftover = query_expression_rule(tokenize(query_expression))
+        self.assertFalse(leftover)
+        dataframe, _ = query_expression_node.get_dataframe(table_context)
+        self.assertEqual(dataframe.to_list_of_lists(), expected_result)
+
+    def test_with_clause_evaluated_once(self):
+        # type: () -> None
+        query_expression_node, leftover = query_expression_rule(tokenize(
+            'WITH q1 AS (SELECT a FROM my_table) '
+            'SELECT * FROM q1 JOIN q1 AS q2 USING (a) LIMIT 2'))
+        self.assertFalse(leftover)
+        assert isinstance(query_expression_node, QueryExpression)
+        with_query = query_expression_node.with_clauses[0][1]
+        evaluations = []
+
+        def get_dataframe(table_context, outer_context=None):
+            # type: (TableContext, Any) -> Tuple[TypedDataFrame, Any]
+            evaluations.append(table_context)
+            return type(with_query).get_dataframe(with_query, table_context, outer_context)
+        with_query.get_dataframe = get_dataframe
+
+        dataframe, _ = query_expression_node.get_dataframe(self.table_context)
+
+        self.assertEqual(dataframe.to_list_of_lists(), [[1, 1], [2, 2]])
+        self.assertEqual(len(evaluations), 1)
+
+    def test_inlined_with_clause_evaluated_once(self):
+        # type: () -> None
+        query_expression_node, leftover = query_expression_rule(tokenize(
+            'WITH q1 AS (SELECT a FROM my_table WHERE a > 1) '
+            'SELECT a FROM my_table WHERE EXISTS (SELECT 1 FROM q1 LIMIT 1)'))
+        self.assertFalse(leftover)
+        assert isinstance(query_expression_node, QueryExpression)
+        with_query = query_expression_node.with_clauses[0][1]
+        evaluations = []
+
+        def get_first_rows(table_context, num_rows, outer_context=None):
+            # type: (TableContext, int, Any) -> Tuple[TypedDataFrame, Any]
+            evaluations.append(num_rows)
+            return type(with_query).get_first_rows(with_query, table_context, num_rows,
+                                                   outer_context)
+        with_query.get_first_rows = get_first_rows
+
+        dataframe, _ = query_expression_node.get_dataframe(self.table_context)
+
+        self.assertEqual(dataframe.to_list_of_lists(), [[1], [2], [3]])
+        # The subquery is evaluated for each row of my_table, but the WITH clause only once.
+        self.assertEqual(evaluations, [1])
+
     @data(
         dict(
             query_expression=(
@@ -214,6 +368,119 @@ class DataframeNodeTest(unittest.TestCase):
         self.assertFalse(leftover)
         self.assertEqual(dataframe.to_list_of_lists(), expected_result)
 
+    @data(
+        dict(order_by='a DESC', limit='LIMIT 2'),
+        dict(order_by='a', limit='LIMIT 3'),
+        dict(order_by='a', limit='LIMIT 2 OFFSET 3'),
+        dict(order_by='a DESC, b', limit='LIMIT 4'),
+        dict(order_by='a, b DESC', limit='LIMIT 3 OFFSET 1'),
+        # NULLs are sorted last, and are needed for this many rows.
+        dict(order_by='a', limit='LIMIT 7'),
+        dict(order_by='s', limit='LIMIT 2'),
+        dict(order_by='a', limit='LIMIT 0'),
+    )
+    @unpack
+    def test_query_expression_order_by_limit(self, order_by, limit):
+        # type: (str, str) -> None
+        table_context = DatasetTableContext(
+            {'my_project':
+             {'my_dataset':
+              {'my_table':
+               TypedDataFrame(pd.DataFrame([[3, 1, 'c'], [1, 2, 'a'], [None, 3, 'b'],
+                                            [3, 4, 'e'], [2, 5, 'd'], [1, 6, 'f'],
+                                            [3, 7, 'g'], [None, 8, 'h']],
+                                           columns=['a', 'b', 's']),
+                              [BQScalarType.INTEGER, BQScalarType.INTEGER,
+                               BQScalarType.STRING])}}})
+        query_expression_node, leftover = query_expression_rule(tokenize(
+            'select * from my_table order by {} {}'.format(order_by, limit)))
+        self.assertFalse(leftover)
+        assert isinstance(query_expression_node, QueryExpression)
+        unsorted_query = QueryExpression(query_expression_node.with_clauses,
+                                         query_expression_node.base_query,
+                                         query_expression_node.order_by, EMPTY_NODE)
+        old_min_selectivity = dataframe_node._TOP_ROWS_MIN_SELECTIVITY
+        dataframe_node._TOP_ROWS_MIN_SELECTIVITY = 1
+        try:
+            dataframe, unused_table_name = query_expression_node.get_dataframe(table_context)
+        finally:
+            dataframe_node._TOP_ROWS_MIN_SELECTIVITY = old_min_selectivity
+
+        # Selecting the first rows gives the same rows as fully sorting, then slicing.
+        sorted_dataframe, unused_table_name = unsorted_query.get_dataframe(table_context)
+        limit_count, offset = query_expression_node._evaluate_limit(query_expression_node.limit)
+        self.assertEqual(dataframe.to_list_of_lists(),
+                         sorted_dataframe.to_list_of_lists()[offset:offset + limit_count])
+
+    # CAST('x' AS INT64) is an error, so these queries only succeed if the LIMIT keeps the last row
+    # of my_table from being evaluated.
+    @data(
+        dict(query_expression='select cast(s as int64) from my_table limit 2',
+             expected_result=[[1], [2]]),
+        dict(query_expression='select * from (select cast(s as int64) from my_table) limit 1',
+             expected_result=[[1]]),
+        dict(query_expression='select cast(s as int64) from my_table where a < 3 limit 1',
+             expected_result=[[1]]),
+        dict(query_expression=('(select a from my_table union all '
+                               'select cast(s as int64) from my_table) limit 2 offset 2'),
+             expected_result=[[3], [1]]),
+        # Once the first query has produced enough rows, the others produce none, but their
+        # types are still taken into account.
+        dict(query_expression=('(select 1 union all '
+                               'select cast(s as float64) from my_table) limit 1'),
+             expected_result=[[1.0]]),
+        # Aggregation needs all rows.
+        dict(query_expression='select count(*) from my_table where a > 1 limit 1',
+             expected_result=[[2]]),
+        # Rows are limited by position, not by the labels of the groups' (numeric) index.
+        dict(query_expression='select a, count(*) from my_table where a > 1 group by a limit 1',
+             expected_result=[[2, 1]]),
+        dict(query_expression=('select a, count(*) from my_table group by a '
+                               'order by a desc limit 1 offset 1'),
+             expected_result=[[2, 1]]),
+    )
+    @unpack
+    def test_query_expression_limit_pushdown(self, query_expression, expected_result):
+        # type: (str, List[List[int]]) -> None
+        table_context = DatasetTableContext(
+            {'my_project':
+             {'my_dataset':
+              {'my_table':
+               TypedDataFrame(pd.DataFrame([['1', 1], ['2', 2], ['x', 3]], columns=['s', 'a']),
+                              [BQScalarType.STRING, BQScalarType.INTEGER])}}})
+        query_expression_node, leftover = query_expression_rule(tokenize(query_expression))
+        self.assertFalse(leftover)
+        dataframe, unused_table_name = query_expression_node.get_dataframe(table_context)
+        self.assertEqual(dataframe.to_list_of_lists(), expected_result)
+
+    # These queries need every row, so the CAST error is raised despite the LIMIT.
+    @data(
+        dict(query_expression='select distinct cast(s as int64) from my_table limit 1'),
+        dict(query_expression='select cast(s as int64) from my_table order by a limit 1'),
+    )
+    @unpack
+    def test_query_expression_limit_not_pushed_down(self, query_expression):
+        # type: (str) -> None
+        table_context = DatasetTableContext(
+            {'my_project':
+             {'my_dataset':
+              {'my_table':
+               TypedDataFrame(pd.DataFrame([['1', 1], ['x', 3]], columns=['s', 'a']),
+                              [BQScalarType.STRING, BQScalarType.INTEGER])}}})
+        query_expression_node, leftover = query_expression_rule(tokenize(
+            'select * from ({}) limit 1'.format(query_expression)))
+        self.assertFalse(leftover)
+        with self.assertRaisesRegexp(ValueError, 'could not convert'):
+            query_expression_node.get_dataframe(table_context)
+
+    def test_top_rows_candidates_keeps_ties(self):
+        # type: () -> None
+        dataframe = pd.DataFrame({'a': [5, 1, 5, 2, 5, 0, 3, 4]})
+
+        candidates = _top_rows_candidates(dataframe, 'a', False, 2)
+
+        self.assertEqual(list(candidates['a']), [5, 5, 5])
+
     def test_select(self):
         # type: () -> None
         from_ = DataSource((TableReference(('my_project', 'my_dataset', 'my_table')),
@@ -344,6 +611,14 @@ class DataframeNodeTest(unittest.TestCase):
              expected_result=[[4]]),
         dict(select='SELECT sum(a) as c FROM my_table GROUP BY b HAVING b=1 AND c<0 AND MIN(a)<0',
              expected_result=[[-98]]),
+        dict(select='SELECT b, sum(a) as c FROM my_table GROUP BY b HAVING sum(a) > 4',
+             expected_result=[[3, 7]]),
+        dict(select='SELECT b, sum(a) as c, sum(a) as d FROM my_table GROUP BY b '
+                    'HAVING sum(a) + 1 > 5',
+             expected_result=[[3, 7, 7]]),
+        dict(select='SELECT b, max(a) - min(a) as c FROM my_table GROUP BY b '
+                    'HAVING max(a) - min(a) > 2 AND max(a) > 5',
+             expected_result=[[3, 5]]),
     )
     @unpack
     def test_select_having(self, select, expected_result):
@@ -362,6 +637,29 @@ class DataframeNodeTest(unittest.TestCase):
         self.assertFalse(leftover)
         self.assertEqual(dataframe.to_list_of_lists(), expected_result)
 
+    @data(
+        dict(select='SELECT b, sum(a) as c FROM my_table GROUP BY b HAVING sum(a) > 4',
+             having='(> c 4)'),
+        dict(select='SELECT b, sum(a) + 1 FROM my_table GROUP BY b HAVING sum(a) + 1 > 4',
+             having='(> _f2 4)'),
+        # The columns are ambiguous.
+        dict(select='SELECT b + 1 as c, b - 1 as c FROM my_table GROUP BY b HAVING b + 1 > 4',
+             having='(> (+ b 1) 4)'),
+        # Looking up b in the result is no cheaper than looking it up in the table.
+        dict(select='SELECT b AS c FROM my_table GROUP BY b HAVING b > 4',
+             having='(> b 4)'),
+    )
+    @unpack
+    def test_having_reuses_selected_columns(self, select, having):
+        # type: (str, str) -> None
+        select_node, leftover = select_rule(tokenize(select))
+        assert isinstance(select_node, Select)
+        self.assertFalse(leftover)
+        self.assertEqual(
+            dataframe_node._reuse_selected_columns(select_node.having,
+                                                   select_node.fields).strexpr(),
+            having)
+
     @data(
         dict(select='SELECT * EXCEPT (a) FROM table1',
              expected_result=[[8, 4], [3, 0], [10, 1]]),
@@ -0,0 +1,223 @@
+# Copyright 2019 Verily Life Sciences LLC
+#
+# Use of this source code is governed by a BSD-style
+# license that can be found in the LICENSE file.
+
+'''Validates a query and infers its result schema and the bytes it processes, without running it.
+
+The schema is inferred by evaluating the query with every table replaced by an empty table of the
+same columns and types.  All the typing rules of query execution apply (name resolution,
+implicitly_coerce, each function's compute_result_type, ...), so the inferred schema is exactly
+the one executing the query would result in, and the same errors are raised, while no rows of
+data are touched.
+
+The bytes processed are computed as BigQuery bills them: the size of every column the query
+references, in every table it reads (see bq_types.column_size), however few of their rows are
+actually needed.  A column is taken to be referenced if its name appears in the query, or if the
+query selects * from its table.  The bytes billed are rounded up from the bytes processed, to a
+whole number of megabytes and to at least 10 megabytes per table read.
+
+estimate_bytes computes the same from the query's syntax tree alone, without evaluating it at
+all, for queries that are about to be run anyway.  It finds the tables read syntactically, so it
+also counts those of WITH clauses that executing the query would not evaluate.
+'''
+
+import collections
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence, Set, Tuple  # noqa: F401
+
+from .bq_abstract_syntax_tree import DatasetType  # noqa: F401
+from .bq_abstract_syntax_tree import AbstractSyntaxTreeNode, Field
+from .bq_types import TypedDataFrame, TypedSeries, column_size
+from .dataframe_node import QueryExpression, Select, TableReference, table_references
+from .evaluatable_node import StarSelector
+from .join import Join
+from .storage import DatasetTableContext, View
+
+# BigQuery bills the bytes processed by a query in whole megabytes, and at least this many bytes
+# for each table read.
+_BYTES_BILLED_UNIT = 1 << 20
+_MINIMUM_BYTES_BILLED_PER_TABLE = 10 << 20
+
+DryRunResult = NamedTuple('DryRunResult', [('table', TypedDataFrame),
+                                           ('total_bytes_processed', int),
+                                           ('total_bytes_billed', int)])
+
+
+class _DryRunTableContext(DatasetTableContext):
+    '''A DatasetTableContext in which every table is empty.
+
+    Records the tables read, and the views expanded to read them.
+    '''
+
+    def __init__(self, datasets):
+        # type: (DatasetType) -> None
+        super(_DryRunTableContext, self).__init__(datasets)
+        # The tables read, by fully qualified path.
+        self.tables = collections.OrderedDict()  # type: Dict[Tuple[str, str, str], TypedDataFrame]
+        self.views = []  # type: List[View]
+
+    def lookup(self, path):
+        # type: (Sequence[str]) -> Tuple[TypedDataFrame, Optional[str]]
+        '''See TableContext.lookup for docstring.'''
+        project_id, dataset_id, table_id = self._resolve(path)
+        table = self.datasets[project_id][dataset_id][table_id]
+        if isinstance(table, View):
+            # A query reading a view reads the tables the view's query reads.
+            self.views.append(table)
+            view_table, _ = table.query.get_dataframe(self)
+            return view_table, table_id
+        self.tables[(project_id, dataset_id, table_id)] = table
+        return TypedDataFrame(table.dataframe.iloc[:0], table.types), table_id
+
+    def lookup_first_rows(self, path, num_rows):
+        # type: (Sequence[str], int) -> Tuple[TypedDataFrame, Optional[str]]
+        '''See TableContext.lookup_first_rows for docstring.'''
+        return self.lookup(path)
+
+
+def _from_table_paths(node):
+    # type: (Any) -> List[Tuple[str, ...]]
+    '''Finds the paths of the tables a FROM clause reads directly, i.e. not through a subquery.'''
+    if isinstance(node, TableReference):
+        return [node.path]
+    if isinstance(node, QueryExpression):
+        return []
+    if isinstance(node, AbstractSyntaxTreeNode):
+        children = [value for unused_name, value in node.attributes()]  # type: Sequence[Any]
+    elif isinstance(node, (list, tuple)):
+        children = node
+    else:
+        return []
+    return [path for child in children for path in _from_table_paths(child)]
+
+
+def _find_references(node, column_names, star_table_paths):
+    # type: (Any, Set[str], List[Tuple[str, ...]]) -> None
+    '''Finds the column names a syntax tree refers to, and the tables it selects * from.
+
+    Args:
+        node: A syntax tree node, or a list or tuple of them.
+        column_names: The names of the columns referenced are added to this set.
+        star_table_paths: The paths of the tables read directly by the FROM clause of a
+            SELECT * (or SELECT table.*) are added to this list.
+    '''
+    if isinstance(node, Field):
+        column_names.add(node.path[-1])
+    elif isinstance(node, Join) and isinstance(node.join_conditions, tuple):
+        # The names of the columns of a JOIN USING.
+        column_names.update(node.join_conditions)
+    elif isinstance(node, Select) and any(isinstance(field, StarSelector)
+                                          for field in node.fields):
+        star_table_paths.extend(_from_table_paths(node.from_))
+    if isinstance(node, AbstractSyntaxTreeNode):
+        children = [value for unused_name, value in node.attributes()]  # type: Sequence[Any]
+    elif isinstance(node, (list, tuple)):
+        children = node
+    else:
+        return
+    for child in children:
+        _find_references(child, column_names, star_table_paths)
+
+
+def _with_clause_names(node):
+    # type: (Any) -> Set[str]
+    '''Finds the names of the tables defined by the WITH clauses of a syntax tree.'''
+    names = set()  # type: Set[str]
+    if isinstance(node, QueryExpression) and isinstance(node.with_clauses, list):
+        names.update(name for name, unused_query in node.with_clauses)
+    if isinstance(node, AbstractSyntaxTreeNode):
+        children = [value for unused_name, value in node.attributes()]  # type: Sequence[Any]
+    elif isinstance(node, (list, tuple)):
+        children = node
+    else:
+        return names
+    for child in children:
+        names.update(_with_clause_names(child))
+    return names
+
+
+def _bytes_billed(total_bytes_processed, num_tables):
+    # type: (int, int) -> int
+    '''Returns the bytes BigQuery bills for a query processing some bytes from some tables.'''
+    if not total_bytes_processed:
+        return 0
+    rounded_up = -(-total_bytes_processed // _BYTES_BILLED_UNIT) * _BYTES_BILLED_UNIT
+    return max(rounded_up, _MINIMUM_BYTES_BILLED_PER_TABLE * num_tables)
+
+
+def _count_bytes(node,  # type: QueryExpression
+                 tables,  # type: Dict[Tuple[str, str, str], TypedDataFrame]
+                 views,  # type: Sequence[View]
+                 table_context  # type: DatasetTableContext
+                 ):
+    # type: (...) -> Tuple[int, int]
+    '''Computes the bytes a query processes and is billed for, given the tables it reads.
+
+    Args:
+        node: The query's abstract syntax tree.
+        tables: The tables the query reads, by fully qualified path.
+        views: The views the query reads them through.
+        table_context: The context the query is run in.
+    Returns:
+        The number of bytes processed, and of bytes billed.
+    '''
+    column_names = set()  # type: Set[str]
+    star_table_paths = []  # type: List[Tuple[str, ...]]
+    for query in [node] + [view.query for view in views]:
+        _find_references(query, column_names, star_table_paths)
+    star_tables = set(path for path in table_context.dependencies(star_table_paths)
+                      if path is not None)
+
+    total_bytes = 0
+    for path, stored_table in tables.items():
+        for column, type_ in zip(stored_table.dataframe.columns, stored_table.types):
+            if path in star_tables or column in column_names:
+                total_bytes += column_size(TypedSeries(stored_table.dataframe[column], type_))
+    return total_bytes, _bytes_billed(total_bytes, len(tables))
+
+
+def dry_run(node, datasets):
+    # type: (QueryExpression, DatasetType) -> DryRunResult
+    '''Infers the result schema of a query and the bytes it would process, without running it.
+
+    Args:
+        node: The query's abstract syntax tree.
+        datasets: The tables the query can read (see storage.DatasetTableContext).
+    Returns:
+        An empty table with the columns and types of the query's result, the number of bytes
+        running the query would process (an upper bound of what BigQuery would compute) and the
+        number of bytes it would be billed for.
+    '''
+    table_context = _DryRunTableContext(datasets)
+    table, unused_name = node.get_dataframe(table_context)
+    total_bytes_processed, total_bytes_billed = _count_bytes(
+            node, table_context.tables, table_context.views, table_context)
+    return DryRunResult(table, total_bytes_processed, total_bytes_billed)
+
+
+def estimate_bytes(node, datasets):
+    # type: (QueryExpression, DatasetType) -> Tuple[int, int]
+    '''Computes the bytes a query would process and be billed for, without evaluating it.
+
+    Args:
+        node: The query's abstract syntax tree.
+        datasets: The tables the query can read (see storage.DatasetTableContext).
+    Returns:
+        The number of bytes running the query would process (an upper bound of what BigQuery
+        would compute), and the number of bytes it would be billed for.
+    '''
+    table_context = DatasetTableContext(datasets)
+    with_clause_names = _with_clause_names(node)
+    paths = [path for path in table_references(node) if '.'.join(path) not in with_clause_names]
+    tables = collections.OrderedDict()  # type: Dict[Tuple[str, str, str], TypedDataFrame]
+    views = []  # type: List[View]
+    for path in table_context.dependencies(paths):
+        if path is None:
+            continue
+        project_id, dataset_id, table_id = path
+        table = datasets.get(project_id, {}).get(dataset_id, {}).get(table_id)
+        if isinstance(table, View):
+            views.append(table)
+        elif table is not None:
+            tables[path] = table
+    return _count_bytes(node, tables, views, table_context)
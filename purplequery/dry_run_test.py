@@ -0,0 +1,127 @@
+# Copyright 2019 Verily Life Sciences LLC
+#
+# Use of this source code is governed by a BSD-style
+# license that can be found in the LICENSE file.
+
+import unittest
+from typing import List  # noqa: F401
+
+import pandas as pd
+from ddt import data, ddt, unpack
+
+from purplequery.bq_types import BQScalarType, TypedDataFrame
+from purplequery.dataframe_node import QueryExpression  # noqa: F401
+from purplequery.dry_run import estimate_bytes
+from purplequery.query import dry_run_query, execute_query, parse_query
+from purplequery.storage import DatasetTableContext, View
+
+
+@ddt
+class DryRunTest(unittest.TestCase):
+
+    def setUp(self):
+        # type: () -> None
+        self.datasets = {
+            'my_project': {
+                'my_dataset': {
+                    'table1': TypedDataFrame(
+                        pd.DataFrame([[1, 'ab', 2.0, True], [2, None, 3.5, False]],
+                                     columns=['a', 'b', 'c', 'd']),
+                        [BQScalarType.INTEGER, BQScalarType.STRING, BQScalarType.FLOAT,
+                         BQScalarType.BOOLEAN]),
+                    'table2': TypedDataFrame(
+                        pd.DataFrame([[1, 'x'], [3, 'y']], columns=['a', 'e']),
+                        [BQScalarType.INTEGER, BQScalarType.STRING]),
+                }
+            }
+        }
+
+    @data(
+        'SELECT a + c AS s, CONCAT(b, "x") FROM table1',
+        'SELECT b, COUNT(*), SUM(a), MAX(c) FROM table1 GROUP BY b',
+        'SELECT table1.a, e FROM table1 JOIN table2 ON table1.a = table2.a',
+        'SELECT a, ROW_NUMBER() OVER (ORDER BY a) FROM table1',
+        'SELECT IF(d, a, c), CASE WHEN a > 1 THEN "x" ELSE b END FROM table1',
+        'SELECT ARRAY_AGG(a) FROM table1',
+        'SELECT * FROM (SELECT a FROM table1 UNION ALL SELECT a FROM table2)',
+        'SELECT a, SUM(c) FROM table1 GROUP BY a HAVING SUM(c) > 1',
+    )
+    def test_schema_matches_execution(self, query):
+        # type: (str) -> None
+        schema_table = dry_run_query(query, self.datasets).table
+        table = execute_query(query, self.datasets).table
+
+        self.assertEqual(len(schema_table.dataframe), 0)
+        self.assertEqual(list(schema_table.dataframe.columns), list(table.dataframe.columns))
+        self.assertEqual(schema_table.types, table.types)
+
+    @data(
+        # INTEGERs and FLOATs are eight bytes, BOOLEANs one, STRINGs two plus their length; NULLs
+        # count nothing.
+        dict(query='SELECT a FROM table1', expected_bytes=16),
+        dict(query='SELECT * FROM table1', expected_bytes=16 + 4 + 16 + 2),
+        dict(query='SELECT b FROM table1 WHERE d', expected_bytes=4 + 2),
+        dict(query='SELECT COUNT(*) FROM table1', expected_bytes=0),
+        dict(query='SELECT e FROM table1 JOIN table2 USING (a)', expected_bytes=16 + 16 + 6),
+        # Only the columns the subqueries read are counted, not all the columns of their tables.
+        dict(query='SELECT * FROM (SELECT a FROM table1 UNION ALL SELECT a FROM table2)',
+             expected_bytes=16 + 16),
+        dict(query='WITH t AS (SELECT c FROM table1) SELECT * FROM t', expected_bytes=16),
+        dict(query='SELECT 1', expected_bytes=0),
+    )
+    @unpack
+    def test_bytes_processed(self, query, expected_bytes):
+        # type: (str, int) -> None
+        self.assertEqual(dry_run_query(query, self.datasets).total_bytes_processed,
+                         expected_bytes)
+        # The bytes are the same computed from the syntax tree alone.
+        node = parse_query(query)
+        assert isinstance(node, QueryExpression)
+        self.assertEqual(estimate_bytes(node, self.datasets)[0], expected_bytes)
+
+    def test_view_reads_its_tables(self):
+        # type: () -> None
+        view_query = parse_query('SELECT a, e FROM table2')
+        assert isinstance(view_query, QueryExpression)
+        DatasetTableContext(self.datasets).set(('my_project', 'my_dataset', 'view1'),
+                                               View(view_query, [('table2',)]))
+
+        result = dry_run_query('SELECT e FROM view1', self.datasets)
+        self.assertEqual(result.table.types, [BQScalarType.STRING])
+        self.assertEqual(result.total_bytes_processed, 16 + 6)
+        node = parse_query('SELECT e FROM view1')
+        assert isinstance(node, QueryExpression)
+        self.assertEqual(estimate_bytes(node, self.datasets), (16 + 6, 10 << 20))
+
+    @data(
+        dict(query='SELECT 1', expected_bytes_billed=0),
+        dict(query='SELECT a FROM table1', expected_bytes_billed=10 << 20),
+        dict(query='SELECT table1.a FROM table1 JOIN table2 USING (a)',
+             expected_bytes_billed=20 << 20),
+    )
+    @unpack
+    def test_bytes_billed(self, query, expected_bytes_billed):
+        # type: (str, int) -> None
+        # At least 10MB is billed for each table read.
+        self.assertEqual(dry_run_query(query, self.datasets).total_bytes_billed,
+                         expected_bytes_billed)
+        node = parse_query(query)
+        assert isinstance(node, QueryExpression)
+        self.assertEqual(estimate_bytes(node, self.datasets)[1], expected_bytes_billed)
+
+    def test_bytes_billed_rounded_up_to_megabytes(self):
+        # type: () -> None
+        self.datasets['my_project']['my_dataset']['big'] = TypedDataFrame(
+            pd.DataFrame([['x' * (1 << 20)]] * 11, columns=['s']), [BQScalarType.STRING])
+        result = dry_run_query('SELECT s FROM big', self.datasets)
+        self.assertEqual(result.total_bytes_processed, 11 * ((1 << 20) + 2))
+        self.assertEqual(result.total_bytes_billed, 12 << 20)
+
+    def test_errors_are_raised(self):
+        # type: () -> None
+        with self.assertRaisesRegexp(KeyError, 'not present in table'):
+            dry_run_query('SELECT f FROM table1', self.datasets)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -21,7 +21,8 @@ from .bq_abstract_syntax_tree import (EMPTY_NODE, AbstractSyntaxTreeNode,  # noq
                                       EvaluatableNodeWithChildren, EvaluationContext, Field,
                                       GroupedBy, MarkerSyntaxTreeNode, TableContext, _EmptyNode)
 from .bq_types import (BQArray, BQScalarType, BQStructType, BQType, TypedDataFrame,  # noqa: F401
-                       TypedSeries, implicitly_coerce)
+                       TypedScalar, TypedSeries, column_values, implicitly_coerce)
+from .query_plan import plan_stage
 
 NoneType = type(None)
 LiteralType = Union[NoneType, bool, int, float, str, Tuple]
@@ -30,6 +31,8 @@ LiteralType = Union[NoneType, bool, int, float, str, Tuple]
 class Array(EvaluatableNodeWithChildren):
     '''An ARRAY expression, grouping several columns into a column of ARRAYs.'''
 
+    __slots__ = ('array_type', 'children', 'empty')
+
     def __init__(self, maybe_type, maybe_values):
         # type: (Union[BQArray, _EmptyNode], Union[Sequence[EvaluatableNode], _EmptyNode]) -> None
         '''Creates an array from a literal in the grammar.
@@ -82,6 +85,9 @@ class Case(MarkerSyntaxTreeNode, EvaluatableNodeWithChildren):
     CASE WHEN a > 0 THEN "positive" WHEN a < 0 THEN "negative" ELSE "zero" END
     CASE a WHEN 1 THEN "one" WHEN 2 THEN "two" END
     '''
+
+    __slots__ = ('children',)
+
     def __init__(self, comparand,  # type: AbstractSyntaxTreeNode
                  whens,  # type: List[Tuple[AbstractSyntaxTreeNode, EvaluatableNode]]
                  else_  # type: Union[EvaluatableNode, _EmptyNode]
@@ -126,11 +132,16 @@ class Case(MarkerSyntaxTreeNode, EvaluatableNodeWithChildren):
         new_else_ = new_children.pop()
         return Case(
             comparand=EMPTY_NODE,
-            whens=zip(new_children[::2], new_children[1::-2]),
+            whens=list(zip(new_children[::2], new_children[1::2])),
             else_=new_else_)
 
+    def accepts_scalars(self):
+        # type: () -> bool
+        '''See parent, EvaluatableNodeWithChildren.'''
+        return True
+
     def _evaluate_node(self, evaluated_children):
-        # type: (List[TypedSeries]) -> TypedSeries
+        # type: (List[Union[TypedSeries, TypedScalar]]) -> TypedSeries
 
         # Evaluated_children has the following structure:
         # when0, then0, when1, then1, ... else
@@ -141,14 +152,18 @@ class Case(MarkerSyntaxTreeNode, EvaluatableNodeWithChildren):
         #
         # First pop off the else column off the end.
 
+        # The index of the result, in case only literals are selected; see accepts_scalars.
+        index = next(child.series.index for child in evaluated_children
+                     if isinstance(child, TypedSeries))
         result = evaluated_children.pop()
 
         # Next, evaluate each nested IF/ELSE by walking backward through the whens
         for condition, then in zip(evaluated_children[-2::-2], evaluated_children[-1::-2]):
             if condition.type_ != BQScalarType.BOOLEAN:
                 raise ValueError("CASE condition isn't boolean! Found: {!r}".format(condition))
-            result = TypedSeries(then.series.where(condition.series, result.series),
-                                 implicitly_coerce(then.type_, result.type_))
+            result = _where(condition, then, result)
+        if isinstance(result, TypedScalar):
+            return result.to_series(index)
         return result
 
 
@@ -156,6 +171,9 @@ class Cast(MarkerSyntaxTreeNode, EvaluatableNodeWithChildren):
     '''An expression that converts an expression of one type to another type.  For example:
     CAST(1 AS STRING)
     '''
+
+    __slots__ = ('children', 'type_')
+
     def __init__(self, expression, type_):
         # type: (EvaluatableNode, str) -> None
         '''Set up Cast node
@@ -182,6 +200,9 @@ class Exists(MarkerSyntaxTreeNode, EvaluatableLeafNode):
     '''An expression that returns TRUE if the subquery produces one or more rows.  For example:
     EXISTS(SELECT a FROM table WHERE a=1)
     '''
+
+    __slots__ = ('subquery',)
+
     def __init__(self, subquery):
         # type: (DataframeNode) -> None
         '''An EXISTS node
@@ -206,17 +227,24 @@ class Exists(MarkerSyntaxTreeNode, EvaluatableLeafNode):
         # This returns a row with: `a` and whether there exists a `b` that
         # equals it.  The inner Select query needs to know about table_a in
         # order to compare `a` to `b`.
-        results = []  # type: List[bool]
-        for index, row in context.table.dataframe.iterrows():
-            # Create a new context just for this one row
-            single_row_df = TypedDataFrame(
-                pd.DataFrame([row], index=context.table.dataframe.index), context.table.types)
-            row_context = EvaluationContext.clone_context_new_table(single_row_df, context)
-            typed_df, df_name = self.subquery.get_dataframe(context.table_context, row_context)
-            results.append(len(typed_df.dataframe) > 0)
-        # Construct a Series that contains each of the individual result rows
-        return TypedSeries(pd.Series(results, index=_get_index(context.table.dataframe)),
-                           BQScalarType.BOOLEAN)
+        # The subquery's own stages, run once per row, are counted as this one stage.
+        with plan_stage(context.table_context, 'Subquery', 'COMPUTE', ['EXISTS'],
+                        consumes_input=False, collapse=True) as stage:
+            stage.set_input_rows(len(context.table.dataframe))
+            results = []  # type: List[bool]
+            for index, row in context.table.dataframe.iterrows():
+                # Create a new context just for this one row
+                single_row_df = TypedDataFrame(
+                    pd.DataFrame([row], index=context.table.dataframe.index), context.table.types)
+                row_context = EvaluationContext.clone_context_new_table(single_row_df, context)
+                typed_df, df_name = self.subquery.get_dataframe(context.table_context,
+                                                                row_context)
+                results.append(len(typed_df.dataframe) > 0)
+            # Construct a Series that contains each of the individual result rows
+            result = TypedSeries(pd.Series(results, index=_get_index(context.table.dataframe)),
+                                 BQScalarType.BOOLEAN)
+            stage.set_output(result)
+        return result
 
 
 class Extract(MarkerSyntaxTreeNode, EvaluatableNodeWithChildren):
@@ -227,6 +255,9 @@ class Extract(MarkerSyntaxTreeNode, EvaluatableNodeWithChildren):
     Reference:
     https://cloud.google.com/bigquery/docs/reference/standard-sql/date_functions#extract
     '''
+
+    __slots__ = ('part', 'children')
+
     def __init__(self, part, date_expression):
         # type: (str, EvaluatableNode) -> None
         '''An EXTRACT node
@@ -279,6 +310,9 @@ class If(MarkerSyntaxTreeNode, EvaluatableNodeWithChildren):
         else_: 0
     Will return a if a is greater than zero, otherwise it will return zero.
     '''
+
+    __slots__ = ('children',)
+
     def __init__(self, condition, then, else_):
         # type: (EvaluatableNode, EvaluatableNode, EvaluatableNode) -> None
         '''Set up an If node
@@ -294,17 +328,27 @@ class If(MarkerSyntaxTreeNode, EvaluatableNodeWithChildren):
         # type: (Sequence[EvaluatableNode]) -> EvaluatableNode
         return If(*new_arguments)
 
+    def accepts_scalars(self):
+        # type: () -> bool
+        '''See parent, EvaluatableNodeWithChildren.'''
+        return True
+
     def _evaluate_node(self, evaluated_children):
-        # type: (List[TypedSeries]) -> TypedSeries
+        # type: (List[Union[TypedSeries, TypedScalar]]) -> TypedSeries
         condition, then, else_ = evaluated_children
         if condition.type_ != BQScalarType.BOOLEAN:
             raise ValueError("IF condition isn't boolean! Found: {!r}".format(condition))
-        result_type = implicitly_coerce(then.type_, else_.type_)
-        return TypedSeries(then.series.where(condition.series, else_.series), result_type)
+        result = _where(condition, then, else_)
+        # Since there is a column among the children, a literal condition selects a column.
+        assert isinstance(result, TypedSeries)
+        return result
 
 
 class InCheck(EvaluatableNodeWithChildren):
     '''Expression that checks whether element is in or not in a particular selection'''
+
+    __slots__ = ('children', 'direction')
+
     def __init__(self, expression, direction, elements):
         # type: (EvaluatableNode, str, Tuple[EvaluatableNode, ...]) -> None
         '''Set up InCheck node
@@ -330,14 +374,21 @@ class InCheck(EvaluatableNodeWithChildren):
                        'IN' if self.direction else 'NOT_IN',
                        tuple(new_children[1:]))
 
+    def accepts_scalars(self):
+        # type: () -> bool
+        '''See parent, EvaluatableNodeWithChildren.'''
+        return True
+
     def _evaluate_node(self, evaluated_children):
-        # type: (List[TypedSeries]) -> TypedSeries
+        # type: (List[Union[TypedSeries, TypedScalar]]) -> TypedSeries
         expression_value = evaluated_children[0]
         element_values = evaluated_children[1:]
-        contained = pd.Series([False] * len(expression_value.series),
-                              index=expression_value.series.index)
+        index = next(child.series.index for child in evaluated_children
+                     if isinstance(child, TypedSeries))
+        contained = pd.Series(False, index=index)
         for element_value in element_values:
-            contained = contained | (expression_value.series == element_value.series)
+            contained = contained | (column_values(expression_value) ==
+                                     column_values(element_value))
         if self.direction:
             return TypedSeries(contained, BQScalarType.BOOLEAN)
         else:
@@ -347,6 +398,9 @@ class InCheck(EvaluatableNodeWithChildren):
 
 class Not(MarkerSyntaxTreeNode, EvaluatableNodeWithChildren):
     '''Expression that negates the boolean series, such as turning [True] into [False]'''
+
+    __slots__ = ('children',)
+
     def __init__(self, expression):
         # type: (EvaluatableNode) -> None
         '''Set up NOT node
@@ -368,12 +422,20 @@ class Not(MarkerSyntaxTreeNode, EvaluatableNodeWithChildren):
         if evaluated.type_ != BQScalarType.BOOLEAN:
             raise ValueError("NOT accepts only booleans but was given type: {}".format(
                 evaluated.type_))
+        if evaluated.series.dtype == object:
+            # A column with NULLs holds Python booleans, which ~ would negate as integers; the
+            # negation of NULL is NULL.
+            return TypedSeries(
+                    evaluated.series.map(lambda value: value if pd.isnull(value) else not value),
+                    BQScalarType.BOOLEAN)
         return TypedSeries(~evaluated.series, BQScalarType.BOOLEAN)
 
 
 class NullCheck(EvaluatableNodeWithChildren):
     '''Expression that checks whether element is null or not'''
 
+    __slots__ = ('children', 'direction')
+
     def __init__(self, expression, direction):
         # type: (EvaluatableNode, str) -> None
         '''Set up NullCheck node
@@ -474,9 +536,12 @@ class Selector(EvaluatableNodeWithChildren):
     Also includes the alias for this field, if specified.
     '''
 
+    __slots__ = ('children', 'alias', 'position')
+
     def __init__(self,
                  selector,  # type: EvaluatableNode
-                 alias  # type: Union[_EmptyNode, str]
+                 alias,  # type: Union[_EmptyNode, str]
+                 position=None  # type: Optional[int]
                  ):
         # type: (...) -> None
         '''Set up Selector node
@@ -485,17 +550,22 @@ class Selector(EvaluatableNodeWithChildren):
             selector: Column/expression to select from table.  Must be a tuple of
                 an evaluatable expression.
             alias: Name to assign to this column/expression, if any.
+            position: The position in the select list; 1-up (i.e. the first selector will have
+                position=1).  The Select object this Selector is passed to creates a copy with its
+                position populated.
         '''
         self.children = [selector]
         self.alias = alias
-
-        # The position in the select list; 1-up (i.e. the first selector will have position=1).
-        # This field will be populated by the Select object this Selector is passed to.
-        self.position = None  # type: Optional[int]
+        self.position = position
 
     def copy(self, new_children):
         # type: (Sequence[EvaluatableNode]) -> EvaluatableNode
-        return Selector(new_children[0], self.name())
+        return Selector(new_children[0], self.name(), self.position)
+
+    def with_position(self, position):
+        # type: (int) -> Selector
+        '''Returns a copy of this selector at a position in the select list.'''
+        return Selector(self.children[0], self.alias, position)
 
     def name(self):
         # type: () -> str
@@ -512,6 +582,14 @@ class Selector(EvaluatableNodeWithChildren):
             return GroupedBy(self)
         return self.copy([self.children[0].mark_grouped_by(group_by_paths, context)])
 
+    def structural_key(self):
+        # type: () -> Optional[Tuple[Any, ...]]
+        '''See parent class for docstring.
+
+        A selector is only its expression under a name; the expression itself is what is shared.
+        '''
+        return None
+
     def _evaluate_node(self, evaluated_arguments):
         # type: (List[TypedSeries]) -> TypedSeries
         result, = evaluated_arguments
@@ -521,6 +599,9 @@ class Selector(EvaluatableNodeWithChildren):
 
 class UnaryNegation(EvaluatableNodeWithChildren):
     '''Expression that negates a series, such as turning [1, 2] into [-1, -2]'''
+
+    __slots__ = ('children',)
+
     def __init__(self, expression):
         # type: (EvaluatableNode) -> None
         ''' Set up unary negation
@@ -560,16 +641,49 @@ def _get_index(dataframe):
     # column(s); to figure that out, apply some aggregating operation and get the index of the
     # aggregated result.  Different aggregating operations (.min, .max, .sum, etc.) would
     # return different results, obviously, but they'd all have the same index, which is what
-    # we want here, so we just pick .max() arbitrarily.
+    # we want here, so we pick .size(), which doesn't need to look at the columns' values.
     if isinstance(dataframe, pd.core.groupby.DataFrameGroupBy):
-        return dataframe.max().index
+        return dataframe.size().index
     else:
         return dataframe.index
 
 
+def _where(condition, then, otherwise):
+    # type: (Union[TypedSeries, TypedScalar], Union[TypedSeries, TypedScalar], Union[TypedSeries, TypedScalar]) -> Union[TypedSeries, TypedScalar]  # noqa: E501
+    '''Selects then in the rows where a condition is true, and otherwise in the other rows.
+
+    Any of the arguments may be a literal (see EvaluatableNodeWithChildren.accepts_scalars).
+
+    Args:
+        condition: A boolean column or literal.
+        then: The values for the rows where the condition is true.
+        otherwise: The values for the other rows.
+    Returns:
+        A column, or a literal if all the arguments are literals.
+    '''
+    type_ = implicitly_coerce(then.type_, otherwise.type_)
+    if isinstance(condition, TypedScalar):
+        selected = then if condition.value else otherwise
+        if isinstance(selected, TypedScalar):
+            return TypedScalar(selected.value, type_)
+        # Columns are renamed by their consumers (see Selector), so the operand's own column is
+        # not returned; the data itself is shared.
+        return TypedSeries(selected.series.copy(deep=False), type_)
+    # A NULL condition selects otherwise.
+    is_true = condition.series.fillna(False).astype(bool)
+    if isinstance(then, TypedSeries):
+        return TypedSeries(then.series.where(is_true, column_values(otherwise)), type_)
+    if isinstance(otherwise, TypedSeries):
+        return TypedSeries(otherwise.series.mask(is_true, then.value), type_)
+    return TypedSeries(pd.Series(then.value, index=is_true.index)
+                       .where(is_true, otherwise.value), type_)
+
+
 class Value(EvaluatableLeafNode):
     '''A node representing a literal value (number, string, boolean, null).'''
 
+    __slots__ = ('value', 'type_')
+
     def __init__(self, value, type_):
         # type: (Optional[LiteralType], Optional[BQScalarType]) -> None
         if (value is None) != (type_ is None):
@@ -587,23 +701,28 @@ class Value(EvaluatableLeafNode):
         # type: () -> str
         return repr(self.value)
 
-    def __eq__(self, other):
-        # type: (Any) -> bool
-        if isinstance(other, Value):
-            return (self.type_ == other.type_) and (self.value == other.value)
-        return False
+    def constant_scalar(self):
+        # type: () -> Optional[TypedScalar]
+        '''See parent, EvaluatableNode'''
+        if self.value is None:
+            return None
+        return TypedScalar(self.value, self.type_)
 
     def _evaluate_leaf_node(self, context):
         # type: (EvaluationContext) -> TypedSeries
         '''See parent, EvaluatableNode'''
-        return TypedSeries(pd.Series([self.value] * len(context.table.dataframe),
-                                     index=_get_index(context.table.dataframe)),
-                           self.type_)
+        index = context.index
+        if self.value is None:
+            # pandas would fill a Series with NaN rather than None.
+            return TypedSeries(pd.Series([None] * len(index), index=index), self.type_)
+        return TypedScalar(self.value, self.type_).to_series(index)
 
 
 class Struct(EvaluatableNodeWithChildren):
     '''A STRUCT expression.'''
 
+    __slots__ = ('type_', 'children')
+
     def __init__(self, type_, expressions):
         # type: (BQStructType, Sequence[EvaluatableNode]) -> None
         self.type_ = type_
@@ -695,6 +814,9 @@ class _Function(object):
     # summing a column of floats gives a float, summing a column of ints gives an int.
     _result_type = None  # type: Optional[BQType]
 
+    # Whether the function always gives the same result for the same arguments.
+    deterministic = True
+
     def compute_result_type(self, argument_types):
         # type: (Sequence[BQType]) -> BQType
         '''Computes the type of the result of applying this function.
@@ -712,6 +834,10 @@ class _Function(object):
 class _NonAggregatingFunction(_Function):
     '''Base class for regular functions (not aggregating).'''
 
+    # Whether function can be given literal arguments as plain values, rather than as columns, and
+    # broadcast them to its other arguments; see EvaluatableNodeWithChildren.accepts_scalars.
+    accepts_scalars = False
+
     @abstractmethod
     def function(self, values):
         # type: (List[pd.Series]) -> pd.Series
@@ -890,9 +1016,11 @@ class Count(_AggregatingFunction):
 class Mod(_NonAggregatingFunction):
     '''The modulus of two columns of numbers, i.e. remainder after a is divided by b.'''
 
+    accepts_scalars = True
+
     def function(self, values):
         a, b = values
-        return a.mod(b)
+        return a % b
 
 
 class Sum(_AggregatingFunction):
@@ -926,6 +1054,7 @@ class Concat(_NonAggregatingFunction):
     '''The concatenation of a series of strings.'''
 
     _result_type = BQScalarType.STRING
+    accepts_scalars = True
 
     def function(self, values):
         # type: (List[pd.Series]) -> pd.Series
@@ -946,6 +1075,7 @@ class Current_Timestamp(_NonAggregatingFunction):
     '''The current time.'''
 
     _result_type = BQScalarType.TIMESTAMP
+    deterministic = False
 
     def function(self, values):
         # No-argument functions are given a constant argument in order to
@@ -968,6 +1098,8 @@ class Row_Number(_NonAggregatingFunction):
 class FunctionCall(object):
     '''Abstract base class for function call expressions. Subclasses are aggregating or not.'''
 
+    __slots__ = ()
+
     _FUNCTION_MAP = {function_info.name(): function_info()
                      for function_info in (Min, Max, Sum, Mod, Concat, Timestamp, Current_Timestamp,
                                            Row_Number)}
@@ -1002,26 +1134,40 @@ class FunctionCall(object):
         else:
             raise ValueError("Invalid function info {}".format(function_info))
 
+    def structural_key(self):
+        # type: () -> Optional[Tuple[Any, ...]]
+        '''See EvaluatableNode.structural_key for docstring.'''
+        if not self.function_info.deterministic:  # type: ignore
+            return None
+        return super(FunctionCall, self).structural_key()  # type: ignore
+
     def _evaluate(self, arguments, function, compute_result_type):
-        # type: (List[TypedSeries], _FunctionType, Callable[[List[BQType]], BQType]) -> TypedSeries
+        # type: (Sequence[Union[TypedSeries, TypedScalar]], _FunctionType, Callable[[List[BQType]], BQType]) -> TypedSeries  # noqa: E501
         '''Evaluates arguments using function.
 
         Args:
-            arguments: A list of TypedSeries (columns of data)
+            arguments: A list of TypedSeries (columns of data), and of TypedScalars for literal
+                arguments if the function accepts them (see accepts_scalars).
             function: A function to apply to the arguments.
             compute_result_type: A function to call to compute the result type based on the types
                 of the arguments.
         Returns:
             The result of applying the function to the arguments.
         '''
-        argument_values = [argument.series for argument in arguments]
+        argument_values = [column_values(argument) for argument in arguments]
         argument_types = [argument.type_ for argument in arguments]
-        return TypedSeries(function(argument_values), compute_result_type(argument_types))
+        result = function(argument_values)
+        if any(isinstance(argument, TypedScalar) for argument in arguments):
+            # As when combining columns, the result is an unnamed column.
+            result.name = None
+        return TypedSeries(result, compute_result_type(argument_types))
 
 
 class _NonAggregatingFunctionCall(FunctionCall, EvaluatableNodeWithChildren):
     '''A function call that does not aggregate rows, e.g. concat.'''
 
+    __slots__ = ('function_info', 'children')
+
     def __init__(self, function_info, expression):
         # type: (_NonAggregatingFunction, Union[_EmptyNode, Sequence[EvaluatableNode]]) -> None
         self.function_info = function_info
@@ -1036,8 +1182,13 @@ class _NonAggregatingFunctionCall(FunctionCall, EvaluatableNodeWithChildren):
         # type: (Sequence[EvaluatableNode]) -> EvaluatableNode
         return _NonAggregatingFunctionCall(self.function_info, new_arguments)
 
+    def accepts_scalars(self):
+        # type: () -> bool
+        '''See parent, EvaluatableNodeWithChildren.'''
+        return self.function_info.accepts_scalars
+
     def _evaluate_node(self, arguments):
-        # type: (List[TypedSeries]) -> TypedSeries
+        # type: (List[Union[TypedSeries, TypedScalar]]) -> TypedSeries
         return self._evaluate(
                 arguments, self.function_info.function, self.function_info.compute_result_type)
 
@@ -1045,6 +1196,8 @@ class _NonAggregatingFunctionCall(FunctionCall, EvaluatableNodeWithChildren):
 class _AggregatingFunctionCall(FunctionCall, EvaluatableNodeThatAggregatesOrGroups):
     '''A function call that aggregates rows, e.g. sum.'''
 
+    __slots__ = ('function_info', 'children')
+
     def __init__(self, function_info, expression):
         # type: (_AggregatingFunction, Union[_EmptyNode, Sequence[EvaluatableNode]]) -> None
         self.function_info = function_info
@@ -1068,6 +1221,9 @@ class _AggregatingFunctionCall(FunctionCall, EvaluatableNodeThatAggregatesOrGrou
 class _AnalyticFunctionCall(FunctionCall, EvaluatableNodeWithChildren):
     '''A function call that is evaluated over windows of the data but with results for each row.'''
 
+    __slots__ = ('function_info', 'order_by_ascending', 'children', 'num_arguments',
+                 'num_partition_by')
+
     def __init__(self, function_info, maybe_arguments, over_clause):
         # type: (_Function, Union[_EmptyNode, Sequence[EvaluatableNode]], _OverClauseType) -> None
         '''Creates a function call expression for an invocation of an analytic function
@@ -1105,6 +1261,11 @@ class _AnalyticFunctionCall(FunctionCall, EvaluatableNodeWithChildren):
         self.num_arguments = len(arguments)
         self.num_partition_by = len(partition_by)
 
+    def depends_on_other_rows(self):
+        # type: () -> bool
+        '''An analytic function's value for a row depends on the other rows in its window.'''
+        return True
+
     def copy(self, new_children):
         # type: (Sequence[EvaluatableNode]) -> EvaluatableNode
         return _AnalyticFunctionCall(
@@ -1178,3 +1339,23 @@ class _AnalyticFunctionCall(FunctionCall, EvaluatableNodeWithChildren):
         evaluated_argument, = evaluated_arguments
         result = evaluated_argument.series.transform(lambda x: function([x]))
         return TypedSeries(result, result_type)
+
+
+def is_deterministic(node):
+    # type: (Any) -> bool
+    '''Returns whether a syntax tree calls no non-deterministic functions, e.g. CURRENT_TIMESTAMP.
+
+    Args:
+        node: A syntax tree node, or a list or tuple of them.
+    Returns:
+        True if evaluating the tree twice on the same data gives the same result.
+    '''
+    if isinstance(node, FunctionCall) and not node.function_info.deterministic:  # type: ignore
+        return False
+    if isinstance(node, AbstractSyntaxTreeNode):
+        children = [value for unused_name, value in node.attributes()]  # type: Sequence[Any]
+    elif isinstance(node, (list, tuple)):
+        children = node
+    else:
+        return True
+    return all(is_deterministic(child) for child in children)
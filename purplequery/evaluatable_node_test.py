@@ -18,7 +18,7 @@ from purplequery.bq_abstract_syntax_tree import (EMPTY_CONTEXT, EMPTY_NODE,  # n
                                                  AbstractSyntaxTreeNode, EvaluatableNode,
                                                  EvaluationContext, Field, GroupedBy, _EmptyNode)
 from purplequery.bq_types import (BQArray, BQScalarType, BQStructType, BQType,  # noqa: F401
-                                  PythonType, TypedDataFrame, TypedSeries)
+                                  PythonType, TypedDataFrame, TypedScalar, TypedSeries)
 from purplequery.dataframe_node import QueryExpression, Select, TableReference
 from purplequery.evaluatable_node import LiteralType  # noqa: F401
 from purplequery.evaluatable_node import (Case, Cast, Exists, Extract, FunctionCall, If, InCheck,
@@ -30,6 +30,25 @@ from purplequery.storage import DatasetTableContext
 from purplequery.tokenizer import tokenize
 
 
+class _UnexpandedValue(Value):
+    '''A literal that fails if it is evaluated into a column.'''
+
+    def _evaluate_leaf_node(self, context):
+        # type: (EvaluationContext) -> TypedSeries
+        raise AssertionError('Literal {!r} expanded into a column'.format(self.value))
+
+
+class _CountedNegation(UnaryNegation):
+    '''A negation that counts the times it is evaluated.'''
+
+    evaluations = 0
+
+    def _evaluate_node(self, evaluated_children):
+        # type: (List[TypedSeries]) -> TypedSeries
+        _CountedNegation.evaluations += 1
+        return super(_CountedNegation, self)._evaluate_node(evaluated_children)
+
+
 @ddt
 class EvaluatableNodeTest(unittest.TestCase):
 
@@ -72,8 +91,7 @@ class EvaluatableNodeTest(unittest.TestCase):
 
     def test_selector_group_by_success(self):
         # type: () -> None
-        selector = Selector(Field(('c',)), EMPTY_NODE)
-        selector.position = 1
+        selector = Selector(Field(('c',)), EMPTY_NODE, position=1)
         context = EvaluationContext(self.large_table_context)
         context.add_table_from_node(TableReference(('my_project', 'my_dataset', 'my_table')),
                                     EMPTY_NODE)
@@ -117,6 +135,182 @@ class EvaluatableNodeTest(unittest.TestCase):
         assert isinstance(typed_series, TypedSeries)
         self.assertEqual(list(typed_series.series), [12345, 12345])
 
+    @data(
+        dict(expression=If(BinaryExpression(Field(('a',)), '>',
+                                            _UnexpandedValue(1, BQScalarType.INTEGER)),
+                           _UnexpandedValue('yes', BQScalarType.STRING),
+                           _UnexpandedValue('no', BQScalarType.STRING)),
+             result=['no', 'yes']),
+        dict(expression=If(_UnexpandedValue(False, BQScalarType.BOOLEAN),
+                           _UnexpandedValue(0, BQScalarType.INTEGER), Field(('a',))),
+             result=[1, 2]),
+        dict(expression=If(BinaryExpression(Field(('a',)), '=',
+                                            _UnexpandedValue(1, BQScalarType.INTEGER)),
+                           _UnexpandedValue(0, BQScalarType.INTEGER), Field(('a',))),
+             result=[0, 2]),
+        dict(expression=Case(EMPTY_NODE,
+                             [(_UnexpandedValue(False, BQScalarType.BOOLEAN), Field(('a',))),
+                              (_UnexpandedValue(True, BQScalarType.BOOLEAN),
+                               _UnexpandedValue(5, BQScalarType.INTEGER))],
+                             Field(('a',))),
+             result=[5, 5]),
+        dict(expression=InCheck(_UnexpandedValue(2, BQScalarType.INTEGER), 'IN',
+                                (Field(('a',)), _UnexpandedValue(3, BQScalarType.INTEGER))),
+             result=[False, True]),
+        dict(expression=FunctionCall.create(
+                 'concat', [_UnexpandedValue('x', BQScalarType.STRING),
+                            If(BinaryExpression(Field(('a',)), '>',
+                                                _UnexpandedValue(1, BQScalarType.INTEGER)),
+                               _UnexpandedValue('y', BQScalarType.STRING),
+                               _UnexpandedValue('z', BQScalarType.STRING))], EMPTY_NODE),
+             result=['xz', 'xy']),
+        dict(expression=FunctionCall.create(
+                 'mod', [_UnexpandedValue(5, BQScalarType.INTEGER), Field(('a',))], EMPTY_NODE),
+             result=[0, 1]),
+    )
+    @unpack
+    def test_literals_broadcast(self, expression, result):
+        # type: (EvaluatableNode, List[PythonType]) -> None
+        context = EvaluationContext(self.small_table_context)
+        context.add_table_from_node(TableReference(('my_project', 'my_dataset', 'my_table')),
+                                    EMPTY_NODE)
+        typed_series = expression.evaluate(context)
+        assert isinstance(typed_series, TypedSeries)
+        self.assertEqual([typed_series.type_.convert(element) for element in typed_series.series],
+                         result)
+
+    @data(
+        dict(expression1=BinaryExpression(Field(('a',)), '+', Value(1, BQScalarType.INTEGER)),
+             expression2=BinaryExpression(Field(('a',)), '+', Value(1, BQScalarType.INTEGER)),
+             same=True),
+        dict(expression1=Selector(UnaryNegation(Field(('a',))), 'x'),
+             expression2=Selector(UnaryNegation(Field(('a',))), 'y'),
+             same=True),
+        dict(expression1=BinaryExpression(Field(('a',)), '+', Value(1, BQScalarType.INTEGER)),
+             expression2=BinaryExpression(Field(('a',)), '+', Value(2, BQScalarType.INTEGER)),
+             same=False),
+        dict(expression1=Value(1, BQScalarType.INTEGER),
+             expression2=Value(True, BQScalarType.BOOLEAN),
+             same=False),
+        dict(expression1=Field(('a',)),
+             expression2=Field(('my_table', 'a')),
+             same=False),
+    )
+    @unpack
+    def test_structural_key(self, expression1, expression2, same):
+        # type: (EvaluatableNode, EvaluatableNode, bool) -> None
+        if isinstance(expression1, Selector) and isinstance(expression2, Selector):
+            # Only the selected expressions are compared; their names don't matter.
+            expression1, = expression1.children
+            expression2, = expression2.children
+        key1 = expression1.structural_key()
+        key2 = expression2.structural_key()
+        self.assertIsNotNone(key1)
+        self.assertEqual(key1 == key2, same)
+        if same:
+            self.assertEqual(hash(key1), hash(key2))
+
+    @data(
+        Selector(Field(('a',)), 'x'),
+        FunctionCall.create('current_timestamp', [], EMPTY_NODE),
+        BinaryExpression(Field(('a',)), '+',
+                         FunctionCall.create('current_timestamp', [], EMPTY_NODE)),
+        Not(Exists(QueryExpression(EMPTY_NODE, Select(
+            EMPTY_NODE, [Selector(Value(1, BQScalarType.INTEGER), EMPTY_NODE)],
+            EMPTY_NODE, EMPTY_NODE, EMPTY_NODE, EMPTY_NODE), EMPTY_NODE, EMPTY_NODE))),
+    )
+    def test_no_structural_key(self, expression):
+        # type: (EvaluatableNode) -> None
+        self.assertIsNone(expression.structural_key())
+
+    def test_repeated_expression_evaluated_once(self):
+        # type: () -> None
+        context = EvaluationContext(self.small_table_context)
+        context.add_table_from_node(TableReference(('my_project', 'my_dataset', 'my_table')),
+                                    EMPTY_NODE)
+        negation = _CountedNegation(Field(('a',)))
+        expression = BinaryExpression(_CountedNegation(Field(('a',))), '*',
+                                      _CountedNegation(Field(('a',))))
+        _CountedNegation.evaluations = 0
+
+        result = negation.evaluate(context)
+        assert isinstance(result, TypedSeries)
+        self.assertEqual(list(result.series), [-1, -2])
+        # Renaming a result doesn't rename the column reused later.
+        result.series.name = 'x'
+
+        result = expression.evaluate(context)
+        assert isinstance(result, TypedSeries)
+        self.assertEqual(list(result.series), [1, 4])
+        self.assertEqual(negation.evaluate(context).series.name, 'a')
+        self.assertEqual(_CountedNegation.evaluations, 1)
+
+        # Filtering the table, e.g. by a WHERE clause, changes the columns.
+        context.table = TypedDataFrame(context.table.dataframe.iloc[1:], context.table.types)
+        result = expression.evaluate(context)
+        assert isinstance(result, TypedSeries)
+        self.assertEqual(list(result.series), [4])
+        self.assertEqual(_CountedNegation.evaluations, 2)
+
+    def test_repeated_expression_evaluated_once_before_group_by(self):
+        # type: () -> None
+        context = EvaluationContext(self.small_table_context)
+        context.add_table_from_node(TableReference(('my_project', 'my_dataset', 'my_table')),
+                                    EMPTY_NODE)
+        _CountedNegation.evaluations = 0
+        selectors = context.do_group_by(
+            [FunctionCall.create(function_name,
+                                 [BinaryExpression(_CountedNegation(Field(('a',))), '*',
+                                                   Value(2, BQScalarType.INTEGER))],
+                                 EMPTY_NODE)
+             for function_name in ('sum', 'min')], [])
+        self.assertEqual(_CountedNegation.evaluations, 1)
+
+        results = [selector.evaluate(context) for selector in selectors]
+        self.assertEqual([list(cast(TypedSeries, result).series) for result in results],
+                         [[-6], [-4]])
+
+    @data(
+        dict(expression='IF(b, 1, a)', result=[1, 2, 1]),
+        dict(expression='IF(b, a, 0)', result=[0, 0, 3]),
+        dict(expression='IF(b, 1, 0)', result=[0, 0, 1]),
+        dict(expression='CASE WHEN b THEN 1 ELSE a END', result=[1, 2, 1]),
+    )
+    @unpack
+    def test_null_condition(self, expression, result):
+        # type: (str, List[int]) -> None
+        # A NULL condition selects the ELSE.
+        table_context = DatasetTableContext({
+            'my_project': {
+                'my_dataset': {
+                    'my_table': TypedDataFrame(
+                        pd.DataFrame([[1, None], [2, False], [3, True]], columns=['a', 'b']),
+                        types=[BQScalarType.INTEGER, BQScalarType.BOOLEAN]
+                    )
+                }
+            }
+        })
+        node, leftover = apply_rule(query_expression, tokenize(
+            'select {} from `my_project.my_dataset.my_table`'.format(expression)))
+        assert isinstance(node, QueryExpression)
+        self.assertFalse(leftover)
+        table, _ = node.get_dataframe(table_context)
+        self.assertEqual(table.to_list_of_lists(), [[value] for value in result])
+
+    @data(
+        'IF(TRUE, a, 0)',
+        'CASE WHEN TRUE THEN a END',
+    )
+    def test_literal_condition_keeps_column_name(self, expression):
+        # type: (str) -> None
+        node, leftover = apply_rule(query_expression, tokenize(
+            'select a, {} as c from unnest([struct(1 as a), struct(2)])'.format(expression)))
+        assert isinstance(node, QueryExpression)
+        self.assertFalse(leftover)
+        table, _ = node.get_dataframe(DatasetTableContext({}))
+        self.assertEqual(list(table.dataframe.columns), ['a', 'c'])
+        self.assertEqual(table.to_list_of_lists(), [[1, 1], [2, 2]])
+
     def test_field(self):
         # type: () -> None
         field = Field(('a',))
@@ -755,8 +949,9 @@ class EvaluatableNodeTest(unittest.TestCase):
             comparand=EMPTY_NODE,
             whens=[(Value(1, BQScalarType.INTEGER), Value("one", BQScalarType.STRING))],
             else_=EMPTY_NODE,
+            # A literal condition isn't expanded into a column.
             error="CASE condition isn't boolean! Found: {!r}".format(
-                TypedSeries(pd.Series([1, 1]), BQScalarType.INTEGER))
+                TypedScalar(1, BQScalarType.INTEGER))
         ),
         dict(
             comparand=Field(('a',)),
@@ -0,0 +1,146 @@
+# Copyright 2019 Verily Life Sciences LLC
+#
+# Use of this source code is governed by a BSD-style
+# license that can be found in the LICENSE file.
+
+'''Evaluates filter conditions progressively, each operand of an AND or OR on the rows it decides.
+
+A filter like a AND b AND c keeps the rows where all of a, b and c are TRUE.  Rather than evaluate
+each of them over all the rows, the conjuncts are evaluated one after the other, each only on the
+rows that satisfied the ones before; the disjuncts of an OR are likewise each evaluated only on
+the rows that none of the ones before satisfied.  The rows are narrowed with selection vectors
+(see EvaluationContext.with_selected_rows), so no column is copied to do so.
+
+The order the operands are evaluated in is chosen from statistics measured as they are: the time
+each takes per row, and the fraction of rows it passes.  An AND first evaluates the operands that
+eliminate the most rows for their cost, and an OR those that accept the most.  The statistics are
+kept by expression for the duration of a query, on its TableContext, so they carry over from one
+batch of rows to the next, e.g. the chunks of a join's cross product.  Operands not measured yet
+are evaluated first, in the order they were written.
+
+As in BigQuery, the order in which a filter's operands are evaluated is not specified, so an
+operand may not be evaluated (and so not raise an error) on rows that another operand eliminated.
+'''
+
+import timeit
+from typing import Any, Dict, List, NamedTuple, Optional  # noqa: F401
+
+import numpy as np
+
+from .binary_expression import BinaryExpression
+from .bq_abstract_syntax_tree import EvaluatableNode, EvaluationContext  # noqa: F401
+from .bq_types import TypedSeries
+
+# The operators whose operands are evaluated progressively.
+_AND = 'AND'
+_OR = 'OR'
+
+# The weight of the statistics already measured for an operand, when averaged with those of the
+# latest batch of rows it was evaluated on.
+_STATISTICS_DECAY = 0.5
+
+# What an operand was measured to cost, and how selective it was.
+_OperandStatistics = NamedTuple('_OperandStatistics', [('seconds_per_row', float),
+                                                       ('pass_rate', float)])
+
+
+def true_positions(condition):
+    # type: (TypedSeries) -> np.ndarray
+    '''Returns the positions of the rows where a condition is TRUE (not FALSE or NULL).'''
+    return np.flatnonzero(condition.series.fillna(False).values.astype(bool))
+
+
+def _operands(condition, operator):
+    # type: (EvaluatableNode, str) -> List[EvaluatableNode]
+    '''Flattens a chain of one operator, e.g. (a AND b) AND c, into its operands.'''
+    if isinstance(condition, BinaryExpression) and condition.operator_info.operator == operator:
+        return [operand for child in condition.children for operand in _operands(child, operator)]
+    return [condition]
+
+
+def _rank(statistics, operand, operator):
+    # type: (Dict[Any, _OperandStatistics], EvaluatableNode, str) -> float
+    '''Returns the cost of an operand for the rows it decides; lower ranks are evaluated first.'''
+    operand_statistics = (statistics.get(operand) if operand.structural_key() is not None
+                          else None)  # type: Optional[_OperandStatistics]
+    if operand_statistics is None:
+        return 0.0
+    # An AND decides the rows an operand fails, an OR those it passes.
+    pass_rate = operand_statistics.pass_rate
+    decided_rate = 1 - pass_rate if operator == _AND else pass_rate
+    return operand_statistics.seconds_per_row / max(decided_rate, 1e-6)
+
+
+def _record(statistics, operand, num_rows, num_passed, seconds):
+    # type: (Dict[Any, _OperandStatistics], EvaluatableNode, int, int, float) -> None
+    '''Updates an operand's statistics with a batch of rows it was evaluated on.'''
+    if not num_rows or operand.structural_key() is None:
+        return
+    observed = _OperandStatistics(seconds / num_rows, float(num_passed) / num_rows)
+    previous = statistics.get(operand)
+    if previous is not None:
+        observed = _OperandStatistics(*[
+                _STATISTICS_DECAY * old + (1 - _STATISTICS_DECAY) * new
+                for old, new in zip(previous, observed)])
+    statistics[operand] = observed
+
+
+def _evaluate(condition, context):
+    # type: (EvaluatableNode, EvaluationContext) -> np.ndarray
+    '''Evaluates a condition over all the rows of a context; returns where it's TRUE.'''
+    result = condition.evaluate(context)
+    if not isinstance(result, TypedSeries):
+        raise ValueError("Invalid filter condition {}".format(result))
+    return true_positions(result)
+
+
+def _evaluate_on(condition, context, positions, statistics):
+    # type: (EvaluatableNode, EvaluationContext, np.ndarray, Dict[Any, _OperandStatistics]) -> np.ndarray  # noqa: E501
+    '''Returns the positions, among some positions of a context's rows, where condition is TRUE.'''
+    operator = (condition.operator_info.operator if isinstance(condition, BinaryExpression)
+                else None)
+    if operator not in (_AND, _OR):
+        rows = (context if len(positions) == context.num_rows
+                else context.with_selected_rows(positions))
+        return positions[_evaluate(condition, rows)]
+
+    # The rows not decided yet: for an AND, those that passed every operand so far; for an OR,
+    # those that passed none.
+    undecided = positions
+    passed_positions = []  # type: List[np.ndarray]
+    for operand in sorted(_operands(condition, operator),
+                          key=lambda operand: _rank(statistics, operand, operator)):
+        if not len(undecided):
+            break
+        start = timeit.default_timer()
+        passed = _evaluate_on(operand, context, undecided, statistics)
+        _record(statistics, operand, len(undecided), len(passed),
+                timeit.default_timer() - start)
+        if operator == _AND:
+            undecided = passed
+        else:
+            passed_positions.append(passed)
+            undecided = np.setdiff1d(undecided, passed, assume_unique=True)
+    if operator == _AND:
+        return undecided
+    return np.sort(np.concatenate(passed_positions)) if passed_positions else undecided
+
+
+def filter_positions(condition, context):
+    # type: (EvaluatableNode, EvaluationContext) -> np.ndarray
+    '''Returns the positions of the rows of a context that satisfy a filter condition.
+
+    Args:
+        condition: A boolean expression, e.g. a WHERE condition.
+        context: The context to evaluate it in.
+    Returns:
+        The positions, in order, of the rows where the condition is TRUE.
+    '''
+    # The columns of an outer query's context (a subcontext) don't follow this context's rows, so
+    # the operands of a correlated subquery's condition can't be evaluated on just some of them.
+    if context.subcontext is not None or condition.depends_on_other_rows():
+        return _evaluate(condition, context)
+    statistics = context.table_context.filter_statistics
+    if statistics is None:
+        statistics = {}
+    return _evaluate_on(condition, context, np.arange(context.num_rows), statistics)
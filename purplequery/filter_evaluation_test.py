@@ -0,0 +1,141 @@
+# Copyright 2019 Verily Life Sciences LLC
+#
+# Use of this source code is governed by a BSD-style
+# license that can be found in the LICENSE file.
+
+import unittest
+from typing import List  # noqa: F401
+
+import pandas as pd
+from ddt import data, ddt, unpack
+
+from purplequery import filter_evaluation
+from purplequery.binary_expression import BinaryExpression
+from purplequery.bq_abstract_syntax_tree import EMPTY_NODE, EvaluationContext, Field
+from purplequery.bq_types import BQScalarType, TypedDataFrame, TypedSeries  # noqa: F401
+from purplequery.dataframe_node import TableReference
+from purplequery.evaluatable_node import Value
+from purplequery.filter_evaluation import filter_positions
+from purplequery.query import execute_query
+from purplequery.storage import DatasetTableContext
+
+
+class _RecordedField(Field):
+    '''A field that records the number of rows it is evaluated on.'''
+
+    evaluated_rows = []  # type: List[int]
+
+    def _evaluate_leaf_node(self, context):
+        # type: (EvaluationContext) -> TypedSeries
+        result = super(_RecordedField, self)._evaluate_leaf_node(context)
+        _RecordedField.evaluated_rows.append(len(result.series))
+        return result
+
+
+def _greater_than(field, value):
+    # type: (Field, int) -> BinaryExpression
+    return BinaryExpression(field, '>', Value(value, BQScalarType.INTEGER))
+
+
+@ddt
+class FilterEvaluationTest(unittest.TestCase):
+
+    def setUp(self):
+        # type: () -> None
+        self.datasets = {
+            'my_project': {
+                'my_dataset': {
+                    'my_table': TypedDataFrame(
+                        pd.DataFrame([[1, True, 10], [2, None, 20], [3, False, 30],
+                                      [4, True, 40]],
+                                     columns=['a', 'b', 'c']),
+                        [BQScalarType.INTEGER, BQScalarType.BOOLEAN, BQScalarType.INTEGER]),
+                }
+            }
+        }
+        self.context = EvaluationContext(DatasetTableContext(self.datasets))
+        self.context.add_table_from_node(TableReference(('my_table',)), EMPTY_NODE)
+        self.statistics = self.context.table_context.filter_statistics
+        _RecordedField.evaluated_rows = []
+
+    @data(
+        dict(condition='a > 1 AND b', expected=[[4]]),
+        dict(condition='b AND a > 1', expected=[[4]]),
+        dict(condition='a > 3 OR b', expected=[[1], [4]]),
+        dict(condition='b OR a = 2', expected=[[1], [2], [4]]),
+        dict(condition='(a = 1 OR a = 3) AND c > 10', expected=[[3]]),
+        dict(condition='a = 1 OR (a > 2 AND b)', expected=[[1], [4]]),
+        # A NULL operand doesn't keep a row.
+        dict(condition='b OR NULL', expected=[[1], [4]]),
+        dict(condition='a > 2 AND NOT b', expected=[[3]]),
+        dict(condition='a = 1 OR NOT b', expected=[[1], [3]]),
+        dict(condition='FALSE AND b', expected=[]),
+    )
+    @unpack
+    def test_filter(self, condition, expected):
+        # type: (str, List[List[int]]) -> None
+        query = 'SELECT a FROM my_table WHERE {}'.format(condition)
+        self.assertEqual(execute_query(query, self.datasets).table.to_list_of_lists(), expected)
+
+    def test_conjuncts_evaluated_on_surviving_rows(self):
+        # type: () -> None
+        condition = BinaryExpression(_greater_than(Field(('a',)), 2), 'AND',
+                                     _greater_than(_RecordedField(('c',)), 0))
+
+        self.assertEqual(list(filter_positions(condition, self.context)), [2, 3])
+        self.assertEqual(_RecordedField.evaluated_rows, [2])
+
+    def test_disjuncts_evaluated_on_undecided_rows(self):
+        # type: () -> None
+        condition = BinaryExpression(_greater_than(Field(('a',)), 1), 'OR',
+                                     _greater_than(_RecordedField(('c',)), 0))
+
+        self.assertEqual(list(filter_positions(condition, self.context)), [0, 1, 2, 3])
+        self.assertEqual(_RecordedField.evaluated_rows, [1])
+
+    def test_conjuncts_ordered_by_statistics(self):
+        # type: () -> None
+        first = _greater_than(_RecordedField(('c',)), 0)
+        second = _greater_than(Field(('a',)), 3)
+        condition = BinaryExpression(first, 'AND', second)
+
+        # Not measured yet, the conjuncts are evaluated in the order they were written.
+        filter_positions(condition, self.context)
+        self.assertEqual(_RecordedField.evaluated_rows, [4])
+
+        # The second conjunct is cheaper for the rows it eliminates, so it is evaluated first.
+        self.statistics[first] = filter_evaluation._OperandStatistics(1.0, 1.0)
+        self.statistics[second] = filter_evaluation._OperandStatistics(1.0, 0.25)
+        _RecordedField.evaluated_rows = []
+        self.assertEqual(list(filter_positions(condition, self.context)), [3])
+        self.assertEqual(_RecordedField.evaluated_rows, [1])
+
+    def test_statistics_adapt(self):
+        # type: () -> None
+        conjunct = _greater_than(Field(('a',)), 3)
+        filter_evaluation._record(self.statistics, conjunct, 4, 1, 4.0)
+        self.assertEqual(self.statistics[conjunct],
+                         filter_evaluation._OperandStatistics(1.0, 0.25))
+
+        # Equal expressions share their statistics, which average those of each batch of rows.
+        filter_evaluation._record(self.statistics, _greater_than(Field(('a',)), 3), 2, 2, 1.0)
+        self.assertEqual(self.statistics[conjunct],
+                         filter_evaluation._OperandStatistics(0.75, 0.625))
+
+    def test_statistics_kept_per_query(self):
+        # type: () -> None
+        condition = BinaryExpression(_greater_than(Field(('a',)), 2), 'AND',
+                                     _greater_than(Field(('c',)), 0))
+        filter_positions(condition, self.context)
+        self.assertEqual(len(self.statistics), 2)
+
+        # Another query's table context starts without statistics.
+        other_context = EvaluationContext(DatasetTableContext(self.datasets))
+        other_context.add_table_from_node(TableReference(('my_table',)), EMPTY_NODE)
+        self.assertEqual(other_context.table_context.filter_statistics, {})
+        filter_positions(condition, other_context)
+        self.assertEqual(len(self.statistics), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
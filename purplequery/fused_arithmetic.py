@@ -0,0 +1,189 @@
+# Copyright 2019 Verily Life Sciences LLC
+#
+# Use of this source code is governed by a BSD-style
+# license that can be found in the LICENSE file.
+
+'''Evaluates trees of arithmetic, comparison and boolean operators over numeric columns at once.
+
+Evaluated one operator at a time, an expression like (a * b + c * d) / e - f allocates a new
+column for each of its five operators, and pays for pandas' dispatch (alignment, naming, type
+checks) on each.  Instead, a tree of such operators is compiled into a single Python function
+applying the corresponding NumPy ufuncs to the operands' arrays, writing each intermediate result
+into the buffer of one it consumes when their dtypes agree (ufuncs' out= argument), so that the
+expression above allocates three arrays rather than five.
+
+A tree is described by its program: the steps of its operators, in the order they are applied.
+Each step is a tuple (operator, left, right), where left and right refer to the step's operands:
+the i-th operand of the tree as i, and the result of the j-th step as the number of the tree's
+operands plus j.  The result of the tree is that of its last step.  The functions compiled are
+kept by program and operand dtypes, so that each shape of tree is only compiled once for each
+combination of operand dtypes.
+
+Only operands that NumPy computes on exactly as pandas does, and whose results' dtypes don't
+depend on their values, are fused: arrays of booleans, 64-bit integers or 64-bit floats (not, e.g.,
+of objects), and Python booleans, 64-bit integers and floats.
+'''
+
+import collections
+from typing import Any, Callable, Dict, Optional, Sequence, Set, Tuple, cast  # noqa: F401
+
+import numpy as np
+import six
+
+Program = Tuple[Tuple[str, int, int], ...]
+
+# The dtypes of the arrays fused, and their kinds (see numpy.dtype.kind).
+_FUSED_DTYPES = (np.dtype(np.bool_), np.dtype(np.int64), np.dtype(np.float64))
+_NUMERIC_KINDS = 'if'
+_INTEGER_KINDS = 'i'
+
+_MIN_INTEGER = -(1 << 63)
+_MAX_INTEGER = (1 << 63) - 1
+
+
+def _numeric(left_kind, right_kind):
+    # type: (str, str) -> bool
+    return left_kind in _NUMERIC_KINDS and right_kind in _NUMERIC_KINDS
+
+
+def _integers(left_kind, right_kind):
+    # type: (str, str) -> bool
+    return left_kind in _INTEGER_KINDS and right_kind in _INTEGER_KINDS
+
+
+def _booleans(left_kind, right_kind):
+    # type: (str, str) -> bool
+    return left_kind == right_kind == 'b'
+
+
+def _comparable(left_kind, right_kind):
+    # type: (str, str) -> bool
+    return _numeric(left_kind, right_kind) or _booleans(left_kind, right_kind)
+
+
+def _bitwise(left_kind, right_kind):
+    # type: (str, str) -> bool
+    return _integers(left_kind, right_kind) or _booleans(left_kind, right_kind)
+
+
+# The ufunc applying each operator (as in bq_binary_operators.BINARY_OPERATOR_INFO), and which
+# kinds of operands it's fused for.
+_UFUNCS = {
+    '*': (np.multiply, _numeric),
+    '/': (np.true_divide, _numeric),
+    '+': (np.add, _numeric),
+    '-': (np.subtract, _numeric),
+    '<<': (np.left_shift, _integers),
+    '>>': (np.right_shift, _integers),
+    '&': (np.bitwise_and, _bitwise),
+    '^': (np.bitwise_xor, _bitwise),
+    '|': (np.bitwise_or, _bitwise),
+    '=': (np.equal, _comparable),
+    '<': (np.less, _comparable),
+    '>': (np.greater, _comparable),
+    '<=': (np.less_equal, _comparable),
+    '>=': (np.greater_equal, _comparable),
+    '!=': (np.not_equal, _comparable),
+    '<>': (np.not_equal, _comparable),
+    'AND': (np.bitwise_and, _booleans),
+    'OR': (np.bitwise_or, _booleans),
+}  # type: Dict[str, Tuple[np.ufunc, Callable[[str, str], bool]]]
+
+# Compiled functions are kept for this many programs and operand dtypes, the most recently
+# compiled.
+_MAX_KERNELS = 1024
+
+# The functions compiled so far (None for programs that can't be fused), by program and operand
+# dtypes, least recently compiled first.
+_kernels = collections.OrderedDict()  # type: collections.OrderedDict
+
+
+def is_fusible(operator):
+    # type: (str) -> bool
+    '''Returns whether an operator can be part of a fused tree.'''
+    return operator in _UFUNCS
+
+
+def _kind(operand):
+    # type: (Any) -> Optional[str]
+    '''Returns the dtype kind of an operand, or None if it isn't fused.'''
+    if isinstance(operand, np.ndarray):
+        return operand.dtype.kind if operand.dtype in _FUSED_DTYPES else None
+    if isinstance(operand, bool):
+        return 'b'
+    if isinstance(operand, six.integer_types):
+        return 'i' if _MIN_INTEGER <= operand <= _MAX_INTEGER else None
+    if isinstance(operand, float):
+        return 'f'
+    return None
+
+
+def _signature(operand):
+    # type: (Any) -> Any
+    '''Returns what the function compiled for a program depends on about an operand.'''
+    if isinstance(operand, np.ndarray):
+        return operand.dtype.str
+    return type(operand)
+
+
+def _compile(program, operands):
+    # type: (Program, Sequence[Any]) -> Optional[Callable[..., np.ndarray]]
+    '''Compiles a program into a function of its operands, or returns None if it can't be fused.'''
+    # Empty arrays standing for the operands and the steps' results, to infer the results' dtypes
+    # as the ufuncs will.
+    samples = [np.empty(0, operand.dtype) if isinstance(operand, np.ndarray) else operand
+               for operand in operands]
+    names = ['x{}'.format(i) for i in range(len(operands))]
+    # The steps' results whose buffers the function can write to: those not consumed yet.
+    free_buffers = set()  # type: Set[int]
+    lines = []
+    for step, (operator, left, right) in enumerate(program):
+        ufunc, fusible = _UFUNCS[operator]
+        left_kind, right_kind = _kind(samples[left]), _kind(samples[right])
+        if left_kind is None or right_kind is None or not fusible(left_kind, right_kind):
+            return None
+        sample = ufunc(samples[left], samples[right])
+        if not isinstance(sample, np.ndarray):
+            return None
+        buffers = [operand for operand in (left, right)
+                   if operand in free_buffers and samples[operand].dtype == sample.dtype]
+        out = ', out={}'.format(names[buffers[0]]) if buffers else ''
+        free_buffers.difference_update((left, right))
+        free_buffers.add(len(samples))
+        names.append('t{}'.format(step))
+        samples.append(sample)
+        lines.append('    {} = np.{}({}, {}{})'.format(
+                names[-1], ufunc.__name__, names[left], names[right], out))
+    source = 'def kernel({}):\n{}\n    return {}\n'.format(
+            ', '.join(names[:len(operands)]), '\n'.join(lines), names[-1])
+    namespace = {'np': np}
+    six.exec_(compile(source, '<fused {}>'.format(program), 'exec'), namespace)
+    return cast(Callable[..., np.ndarray], namespace['kernel'])
+
+
+def evaluate_fused(program, operands):
+    # type: (Program, Sequence[Any]) -> Optional[np.ndarray]
+    '''Evaluates a tree of operators over arrays and scalars in one pass.
+
+    Args:
+        program: The steps of the tree's operators (see the module docstring).
+        operands: The tree's operands: arrays of the same length, or scalars.
+    Returns:
+        The array the tree evaluates to, or None if the operands can't be fused, in which case
+        the tree should be evaluated one operator at a time.
+    '''
+    if any(_kind(operand) is None for operand in operands):
+        return None
+    key = (program, tuple(_signature(operand) for operand in operands))
+    if key in _kernels:
+        kernel = _kernels[key]
+    else:
+        kernel = _compile(program, operands)
+        _kernels[key] = kernel
+        while len(_kernels) > _MAX_KERNELS:
+            _kernels.popitem(last=False)
+    if kernel is None:
+        return None
+    # As with pandas, dividing by zero or overflowing results in inf or nan rather than warnings.
+    with np.errstate(all='ignore'):
+        return kernel(*operands)
@@ -0,0 +1,94 @@
+# Copyright 2019 Verily Life Sciences LLC
+#
+# Use of this source code is governed by a BSD-style
+# license that can be found in the LICENSE file.
+
+import unittest
+from typing import Any, List  # noqa: F401
+
+import numpy as np
+import pandas as pd
+from ddt import data, ddt, unpack
+
+from purplequery import fused_arithmetic
+from purplequery.bq_types import BQScalarType, TypedDataFrame
+from purplequery.fused_arithmetic import evaluate_fused
+from purplequery.query import execute_query
+
+# (a * b + c * d) / e - f, over six operands.
+_PROGRAM = (('*', 0, 1), ('*', 2, 3), ('+', 6, 7), ('/', 8, 4), ('-', 9, 5))
+
+
+@ddt
+class FusedArithmeticTest(unittest.TestCase):
+
+    def setUp(self):
+        # type: () -> None
+        self.datasets = {
+            'my_project': {
+                'my_dataset': {
+                    'my_table': TypedDataFrame(
+                        pd.DataFrame([[1, 2.5, True, None], [2, None, False, True],
+                                      [3, 0.5, True, False]],
+                                     columns=['a', 'b', 'c', 'd']),
+                        [BQScalarType.INTEGER, BQScalarType.FLOAT, BQScalarType.BOOLEAN,
+                         BQScalarType.BOOLEAN]),
+                }
+            }
+        }
+        fused_arithmetic._kernels.clear()
+
+    def test_evaluate_fused(self):
+        # type: () -> None
+        operands = [np.array([1, 2]), np.array([3, 4]), np.array([5, 6]), 2, np.array([2, 4]),
+                    0.5]
+        self.assertEqual(list(evaluate_fused(_PROGRAM, operands)), [6, 4.5])
+
+    def test_kernels_compiled_once_per_shape(self):
+        # type: () -> None
+        evaluate_fused(_PROGRAM, [np.arange(3)] * 6)
+        evaluate_fused(_PROGRAM, [np.arange(5)] * 6)
+        self.assertEqual(len(fused_arithmetic._kernels), 1)
+
+        # The dtypes of the steps' results depend on those of the operands.
+        evaluate_fused(_PROGRAM, [np.arange(3.0)] * 6)
+        self.assertEqual(len(fused_arithmetic._kernels), 2)
+
+    @data(
+        # Objects aren't fused, nor are operators on kinds of operands that pandas treats
+        # differently than NumPy.
+        [np.array(['x', 'y'], dtype=object), np.array([1, 2])],
+        [np.array([True, False]), np.array([1, 2])],
+        [np.array([1, 2]), 'x'],
+        [np.array([1, 2]), 1 << 64],
+    )
+    def test_not_fused(self, operands):
+        # type: (List[Any]) -> None
+        self.assertIsNone(evaluate_fused((('+', 0, 1), ('+', 2, 0)), operands))
+
+    @data(
+        dict(expression='(a * 2 + a * b) / a - 1', expected=[[3.5], [None], [1.5]],
+             type_=BQScalarType.FLOAT),
+        dict(expression='a * a - a', expected=[[0], [2], [6]], type_=BQScalarType.INTEGER),
+        dict(expression='a > 1 AND b < 1 OR c', expected=[[True], [False], [True]],
+             type_=BQScalarType.BOOLEAN),
+        dict(expression='b / (a - 1) + 1', expected=[[np.inf], [None], [1.25]],
+             type_=BQScalarType.FLOAT),
+        dict(expression='(a << 2) | a & 1', expected=[[5], [8], [13]],
+             type_=BQScalarType.INTEGER),
+        # Columns with NULLs that pandas keeps as objects are not fused.
+        dict(expression='c AND d OR a = 1', expected=[[True], [False], [False]],
+             type_=BQScalarType.BOOLEAN),
+    )
+    @unpack
+    def test_results(self, expression, expected, type_):
+        # type: (str, List[List[Any]], BQScalarType) -> None
+        result = execute_query('SELECT {} FROM my_table'.format(expression), self.datasets)
+        self.assertEqual([[None if pd.isnull(value) else value for value in row]
+                          for row in result.table.to_list_of_lists()],
+                         expected)
+        self.assertEqual(result.table.types, [type_])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,376 @@
+# Copyright 2019 Verily Life Sciences LLC
+#
+# Use of this source code is governed by a BSD-style
+# license that can be found in the LICENSE file.
+
+'''Hooks run around the evaluation of each node of a query, for profiling and tracing.
+
+An ExecutionHook is called before and after every call to EvaluatableNode.evaluate (computing an
+expression) and DataframeNode.get_dataframe or get_first_rows (computing a table, or the first
+rows of one for a LIMIT).  Hooks are installed globally, with install_hook or the installed_hooks
+context manager:
+
+    profiler = FlatProfiler()
+    with installed_hooks(profiler):
+        client.query('SELECT ...')
+    print(profiler.report())
+
+Installing the first hook replaces the evaluate, get_dataframe and get_first_rows methods of the
+node classes with instrumented versions, and removing the last hook puts the original methods
+back, so that while no hook is installed, executing a query costs nothing extra.
+
+Three hooks are provided: FlatProfiler (time spent per kind of node and per function),
+SlowestExpressions (the expressions that took the longest to evaluate) and ChromeTraceExporter
+(a trace of every call, viewable in chrome://tracing or https://ui.perfetto.dev).
+'''
+
+import contextlib
+import functools
+import heapq
+import itertools
+import json
+import timeit
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple  # noqa: F401
+
+# Importing these modules defines all the node classes to instrument.
+from . import dataframe_node, evaluatable_node, join  # noqa: F401
+from .bq_abstract_syntax_tree import (AbstractSyntaxTreeNode, DataframeNode,  # noqa: F401
+                                      EvaluatableNode, EvaluationContext)
+
+# Category of the calls to EvaluatableNode.evaluate.
+EVALUATE = 'evaluate'
+# Category of the calls to DataframeNode.get_dataframe and get_first_rows.
+GET_DATAFRAME = 'get_dataframe'
+
+# Longest node representation kept by the hooks below.
+_MAX_REPR_LENGTH = 200
+
+
+class ExecutionHook(object):
+    '''Base class for hooks called around the evaluation of each node.
+
+    Subclasses override before, after or both.  Calls are properly nested: a node's children are
+    evaluated between its before and after calls, and after is called even if evaluation raises.
+    '''
+
+    def before(self, node, category, context_size):
+        # type: (AbstractSyntaxTreeNode, str, int) -> None
+        '''Called before a node is evaluated.
+
+        Args:
+            node: The EvaluatableNode or DataframeNode about to be evaluated.
+            category: EVALUATE or GET_DATAFRAME, the method being called.
+            context_size: The number of rows of the context the node is evaluated in: for
+                EVALUATE, the rows of the table the expression is computed on; for GET_DATAFRAME,
+                the rows of the outer query (e.g. for a correlated subquery), or 0 if none.
+        '''
+
+    def after(self, node, category, context_size, elapsed_seconds):
+        # type: (AbstractSyntaxTreeNode, str, int, float) -> None
+        '''Called after a node is evaluated.
+
+        Args:
+            node: The node just evaluated.
+            category: EVALUATE or GET_DATAFRAME, the method called.
+            context_size: As for before.
+            elapsed_seconds: Wall time spent evaluating the node, including its children.
+        '''
+
+
+# The installed hooks, in order of installation.
+_hooks = []  # type: List[ExecutionHook]
+# The methods replaced by instrumented versions while hooks are installed: class, name, original.
+_replaced_methods = []  # type: List[Tuple[type, str, Callable]]
+
+
+def _context_size(context):
+    # type: (Optional[EvaluationContext]) -> int
+    '''Returns the number of rows in an evaluation context, or 0 for no context.'''
+    if context is None:
+        return 0
+    return context.num_rows
+
+
+def _run_hooked(method, node, category, context, args, kwargs):
+    # type: (Callable, AbstractSyntaxTreeNode, str, Optional[EvaluationContext], Tuple, Dict[str, Any]) -> Any  # noqa: E501
+    '''Calls a node's original method, with the installed hooks around it.'''
+    hooks = list(_hooks)
+    context_size = _context_size(context)
+    for hook in hooks:
+        hook.before(node, category, context_size)
+    start = timeit.default_timer()
+    try:
+        return method(node, *args, **kwargs)
+    finally:
+        elapsed_seconds = timeit.default_timer() - start
+        for hook in reversed(hooks):
+            hook.after(node, category, context_size, elapsed_seconds)
+
+
+def _instrument_evaluate(method):
+    # type: (Callable) -> Callable
+    '''Returns an EvaluatableNode.evaluate implementation calling the hooks around method.'''
+    @functools.wraps(method)
+    def evaluate(self, context, *args, **kwargs):
+        # type: (EvaluatableNode, EvaluationContext, *Any, **Any) -> Any
+        return _run_hooked(method, self, EVALUATE, context, (context,) + args, kwargs)
+    return evaluate
+
+
+def _instrument_get_dataframe(method):
+    # type: (Callable) -> Callable
+    '''Returns a DataframeNode.get_dataframe implementation calling the hooks around method.'''
+    @functools.wraps(method)
+    def get_dataframe(self, table_context, outer_context=None):
+        # type: (DataframeNode, Any, Optional[EvaluationContext]) -> Any
+        return _run_hooked(method, self, GET_DATAFRAME, outer_context,
+                           (table_context, outer_context), {})
+    return get_dataframe
+
+
+def _instrument_get_first_rows(method):
+    # type: (Callable) -> Callable
+    '''Returns a DataframeNode.get_first_rows implementation calling the hooks around method.'''
+    @functools.wraps(method)
+    def get_first_rows(self, table_context, num_rows, outer_context=None):
+        # type: (DataframeNode, Any, int, Optional[EvaluationContext]) -> Any
+        return _run_hooked(method, self, GET_DATAFRAME, outer_context,
+                           (table_context, num_rows, outer_context), {})
+    return get_first_rows
+
+
+def _subclasses(cls):
+    # type: (type) -> List[type]
+    '''Returns a class and all its subclasses, recursively.'''
+    classes = [cls]
+    subclasses = cls.__subclasses__()  # type: List[type]
+    for subclass in subclasses:
+        classes.extend(_subclasses(subclass))
+    return classes
+
+
+def _instrument_methods():
+    # type: () -> None
+    '''Replaces the evaluating methods of all node classes by hooked versions.'''
+    for base, name, instrument in (
+            (EvaluatableNode, 'evaluate', _instrument_evaluate),
+            (DataframeNode, 'get_dataframe', _instrument_get_dataframe),
+            (DataframeNode, 'get_first_rows', _instrument_get_first_rows)):
+        # The base classes' methods are abstract, or (DataframeNode.get_first_rows) call
+        # get_dataframe, which is hooked already.
+        for cls in _subclasses(base)[1:]:
+            method = cls.__dict__.get(name)
+            if method is None or getattr(method, '__isabstractmethod__', False):
+                continue
+            _replaced_methods.append((cls, name, method))
+            setattr(cls, name, instrument(method))
+
+
+def _restore_methods():
+    # type: () -> None
+    '''Puts back the methods replaced by _instrument_methods.'''
+    while _replaced_methods:
+        cls, name, method = _replaced_methods.pop()
+        setattr(cls, name, method)
+
+
+def install_hook(hook):
+    # type: (ExecutionHook) -> None
+    '''Starts calling a hook around the evaluation of every node.'''
+    if not _hooks:
+        _instrument_methods()
+    _hooks.append(hook)
+
+
+def remove_hook(hook):
+    # type: (ExecutionHook) -> None
+    '''Stops calling a hook installed by install_hook.'''
+    _hooks.remove(hook)
+    if not _hooks:
+        _restore_methods()
+
+
+@contextlib.contextmanager
+def installed_hooks(*hooks):
+    # type: (*ExecutionHook) -> Iterator[None]
+    '''Returns a context manager that installs hooks while inside it.'''
+    for hook in hooks:
+        install_hook(hook)
+    try:
+        yield
+    finally:
+        for hook in reversed(hooks):
+            remove_hook(hook)
+
+
+def _node_name(node):
+    # type: (AbstractSyntaxTreeNode) -> str
+    '''Returns a short name for a node: its class, and its function for a function call.'''
+    function_info = getattr(node, 'function_info', None)
+    if function_info is not None:
+        return '{}({})'.format(node.__class__.__name__, function_info.name())
+    return node.__class__.__name__
+
+
+def _short_repr(node):
+    # type: (AbstractSyntaxTreeNode) -> str
+    '''Returns the representation of a node, truncated to a readable length.'''
+    representation = repr(node)
+    if len(representation) > _MAX_REPR_LENGTH:
+        return representation[:_MAX_REPR_LENGTH - 3] + '...'
+    return representation
+
+
+class _ProfileEntry(object):
+    '''Statistics of the FlatProfiler for one kind of node or function.'''
+
+    def __init__(self):
+        # type: () -> None
+        self.calls = 0
+        self.rows = 0
+        # Time including the nodes evaluated inside, and excluding them.
+        self.total_seconds = 0.0
+        self.self_seconds = 0.0
+
+
+class FlatProfiler(ExecutionHook):
+    '''Accumulates the time spent evaluating nodes, per node class and per function name.
+
+    The time of a node includes that of its children (total time), and also is counted without it
+    (self time), so that the self times add up to the time spent executing a query.
+    '''
+
+    def __init__(self):
+        # type: () -> None
+        # Statistics by node class name.
+        self.by_class = {}  # type: Dict[str, _ProfileEntry]
+        # Statistics of function calls by function name, e.g. 'CONCAT'.
+        self.by_function = {}  # type: Dict[str, _ProfileEntry]
+        # For each node being evaluated, the time spent evaluating nodes inside it so far.
+        self._children_seconds = []  # type: List[float]
+
+    def before(self, node, category, context_size):
+        # type: (AbstractSyntaxTreeNode, str, int) -> None
+        self._children_seconds.append(0.0)
+
+    def after(self, node, category, context_size, elapsed_seconds):
+        # type: (AbstractSyntaxTreeNode, str, int, float) -> None
+        self_seconds = elapsed_seconds - self._children_seconds.pop()
+        if self._children_seconds:
+            self._children_seconds[-1] += elapsed_seconds
+        entries = [self.by_class.setdefault(node.__class__.__name__, _ProfileEntry())]
+        function_info = getattr(node, 'function_info', None)
+        if function_info is not None:
+            entries.append(self.by_function.setdefault(function_info.name(), _ProfileEntry()))
+        for entry in entries:
+            entry.calls += 1
+            entry.rows += context_size
+            entry.total_seconds += elapsed_seconds
+            entry.self_seconds += self_seconds
+
+    def report(self):
+        # type: () -> str
+        '''Returns the statistics as text, sorted by decreasing self time.'''
+        lines = ['{:<40} {:>8} {:>12} {:>10} {:>10}'.format(
+            'Node', 'Calls', 'Rows', 'Self ms', 'Total ms')]
+        for title, entries in (('class', self.by_class), ('function', self.by_function)):
+            for name, entry in sorted(entries.items(),
+                                      key=lambda item: (-item[1].self_seconds, item[0])):
+                lines.append('{:<40} {:>8} {:>12} {:>10.3f} {:>10.3f}'.format(
+                    '{} {}'.format(title, name), entry.calls, entry.rows,
+                    entry.self_seconds * 1000, entry.total_seconds * 1000))
+        return '\n'.join(lines)
+
+
+class SlowestExpressions(ExecutionHook):
+    '''Keeps the slowest evaluations of expressions (EvaluatableNodes).'''
+
+    def __init__(self, count=10):
+        # type: (int) -> None
+        '''Constructs the hook.
+
+        Args:
+            count: The number of evaluations to keep.
+        '''
+        self.count = count
+        # A heap of the slowest evaluations: time, a tie breaker, context size and node.
+        self._slowest = []  # type: List[Tuple[float, int, int, str]]
+        self._counter = itertools.count()
+
+    def after(self, node, category, context_size, elapsed_seconds):
+        # type: (AbstractSyntaxTreeNode, str, int, float) -> None
+        if category != EVALUATE:
+            return
+        if len(self._slowest) == self.count:
+            if elapsed_seconds <= self._slowest[0][0]:
+                return
+            heapq.heappop(self._slowest)
+        heapq.heappush(self._slowest,
+                       (elapsed_seconds, next(self._counter), context_size, _short_repr(node)))
+
+    def slowest(self):
+        # type: () -> List[Tuple[float, int, str]]
+        '''Returns the slowest evaluations, slowest first.
+
+        Returns:
+            For each evaluation, the time it took in seconds, the number of rows of its context,
+            and a representation of the expression.
+        '''
+        return [(seconds, context_size, representation)
+                for seconds, _, context_size, representation in sorted(self._slowest,
+                                                                       reverse=True)]
+
+    def report(self):
+        # type: () -> str
+        '''Returns the slowest evaluations as text, slowest first.'''
+        return '\n'.join('{:>10.3f} ms {:>10} rows  {}'.format(seconds * 1000, context_size,
+                                                               representation)
+                         for seconds, context_size, representation in self.slowest())
+
+
+class ChromeTraceExporter(ExecutionHook):
+    '''Records every evaluation as an event in the Chrome trace event format.
+
+    The trace can be opened in chrome://tracing or https://ui.perfetto.dev; see
+    https://docs.google.com/document/d/1CvAClvFfyA5R-PhYUmn5OOQtYMH4h6I0nSsKchNAySU for the format.
+    Each call is a complete ('X') event, nested within the event of the node that evaluated it.
+    '''
+
+    def __init__(self):
+        # type: () -> None
+        self.events = []  # type: List[Dict[str, Any]]
+        # The time events are measured from.
+        self._origin = None  # type: Optional[float]
+        # For each node being evaluated, the time it started, in microseconds since the origin.
+        self._starts = []  # type: List[float]
+
+    def before(self, node, category, context_size):
+        # type: (AbstractSyntaxTreeNode, str, int) -> None
+        now = timeit.default_timer()
+        if self._origin is None:
+            self._origin = now
+        self._starts.append((now - self._origin) * 1e6)
+
+    def after(self, node, category, context_size, elapsed_seconds):
+        # type: (AbstractSyntaxTreeNode, str, int, float) -> None
+        self.events.append({
+            'name': _node_name(node),
+            'cat': category,
+            'ph': 'X',
+            'ts': self._starts.pop(),
+            'dur': elapsed_seconds * 1e6,
+            'pid': 1,
+            'tid': 1,
+            'args': {'context_size': context_size, 'node': _short_repr(node)},
+        })
+
+    def to_json(self):
+        # type: () -> str
+        '''Returns the trace as a JSON string.'''
+        return json.dumps({'traceEvents': self.events, 'displayTimeUnit': 'ms'})
+
+    def write(self, path):
+        # type: (str) -> None
+        '''Writes the trace to a JSON file.'''
+        with open(path, 'w') as trace_file:
+            trace_file.write(self.to_json())
@@ -0,0 +1,162 @@
+# Copyright 2019 Verily Life Sciences LLC
+#
+# Use of this source code is governed by a BSD-style
+# license that can be found in the LICENSE file.
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from typing import Any, List, Tuple  # noqa: F401
+
+import pandas as pd
+
+from purplequery.bq_abstract_syntax_tree import (AbstractSyntaxTreeNode,  # noqa: F401
+                                                 EvaluatableLeafNode, EvaluatableNodeWithChildren)
+from purplequery.bq_types import BQScalarType, TypedDataFrame
+from purplequery.dataframe_node import Select
+from purplequery.instrumentation import (EVALUATE, GET_DATAFRAME, ChromeTraceExporter,
+                                         ExecutionHook, FlatProfiler, SlowestExpressions,
+                                         install_hook, installed_hooks, remove_hook)
+from purplequery.query import execute_query
+
+
+class _RecordingHook(ExecutionHook):
+    '''Records the calls to the hook.'''
+
+    def __init__(self):
+        # type: () -> None
+        self.calls = []  # type: List[Tuple[str, str, str, int]]
+
+    def before(self, node, category, context_size):
+        # type: (AbstractSyntaxTreeNode, str, int) -> None
+        self.calls.append(('before', category, node.__class__.__name__, context_size))
+
+    def after(self, node, category, context_size, elapsed_seconds):
+        # type: (AbstractSyntaxTreeNode, str, int, float) -> None
+        self.calls.append(('after', category, node.__class__.__name__, context_size))
+
+
+class InstrumentationTest(unittest.TestCase):
+
+    def setUp(self):
+        # type: () -> None
+        self.datasets = {
+            'my_project': {
+                'my_dataset': {
+                    'table1': TypedDataFrame(
+                        pd.DataFrame([[1, 'a'], [2, 'b'], [3, 'c']], columns=['a', 'b']),
+                        [BQScalarType.INTEGER, BQScalarType.STRING]),
+                }
+            }
+        }
+
+    def test_hook_calls(self):
+        # type: () -> None
+        hook = _RecordingHook()
+        with installed_hooks(hook):
+            execute_query('SELECT a + 1 FROM table1', self.datasets)
+
+        self.assertEqual(hook.calls[0], ('before', GET_DATAFRAME, 'QueryExpression', 0))
+        self.assertEqual(hook.calls[-1], ('after', GET_DATAFRAME, 'QueryExpression', 0))
+        self.assertIn(('after', EVALUATE, 'Field', 3), hook.calls)
+        self.assertIn(('after', EVALUATE, 'BinaryExpression', 3), hook.calls)
+        # Calls are nested: the children of the addition are evaluated inside it.
+        addition = hook.calls.index(('before', EVALUATE, 'BinaryExpression', 3))
+        self.assertEqual(hook.calls[addition + 1], ('before', EVALUATE, 'Field', 3))
+
+    def test_no_hook_installed_leaves_methods_untouched(self):
+        # type: () -> None
+        originals = (EvaluatableLeafNode.__dict__['evaluate'],
+                     EvaluatableNodeWithChildren.__dict__['evaluate'],
+                     Select.__dict__['get_dataframe'])
+        hook = _RecordingHook()
+        install_hook(hook)
+        self.assertIsNot(Select.__dict__['get_dataframe'], originals[2])
+        remove_hook(hook)
+
+        self.assertEqual((EvaluatableLeafNode.__dict__['evaluate'],
+                          EvaluatableNodeWithChildren.__dict__['evaluate'],
+                          Select.__dict__['get_dataframe']),
+                         originals)
+        execute_query('SELECT a FROM table1', self.datasets)
+        self.assertEqual(hook.calls, [])
+
+    def test_after_called_on_error(self):
+        # type: () -> None
+        hook = _RecordingHook()
+        with installed_hooks(hook):
+            with self.assertRaises(Exception):
+                execute_query('SELECT a + b FROM table1', self.datasets)
+        self.assertEqual(len([call for call in hook.calls if call[0] == 'before']),
+                         len([call for call in hook.calls if call[0] == 'after']))
+
+    def test_flat_profiler(self):
+        # type: () -> None
+        profiler = FlatProfiler()
+        with installed_hooks(profiler):
+            execute_query("SELECT CONCAT(b, 'x'), a * 2 FROM table1", self.datasets)
+
+        self.assertEqual(profiler.by_class['Field'].calls, 2)
+        self.assertEqual(profiler.by_class['Field'].rows, 6)
+        self.assertEqual(profiler.by_function['CONCAT'].calls, 1)
+        query = profiler.by_class['QueryExpression']
+        self.assertLessEqual(query.self_seconds, query.total_seconds)
+        # The self times of all the nodes add up to the time of the whole query.
+        self.assertAlmostEqual(sum(entry.self_seconds for entry in profiler.by_class.values()),
+                               query.total_seconds, places=3)
+        report = profiler.report()
+        self.assertIn('class Field', report)
+        self.assertIn('function CONCAT', report)
+
+    def test_flat_profiler_limit(self):
+        # type: () -> None
+        # A LIMIT computes only the first rows of the tables it reads, through get_first_rows.
+        profiler = FlatProfiler()
+        with installed_hooks(profiler):
+            execute_query('SELECT a FROM table1 LIMIT 2', self.datasets)
+
+        self.assertEqual(profiler.by_class['Select'].calls, 1)
+        self.assertEqual(profiler.by_class['TableReference'].calls, 1)
+        self.assertEqual(profiler.by_class['Field'].rows, 2)
+
+    def test_slowest_expressions(self):
+        # type: () -> None
+        slowest = SlowestExpressions(count=2)
+        with installed_hooks(slowest):
+            execute_query('SELECT a + 1, a * 2, a - 3 FROM table1', self.datasets)
+
+        evaluations = slowest.slowest()
+        self.assertEqual(len(evaluations), 2)
+        self.assertGreaterEqual(evaluations[0][0], evaluations[1][0])
+        self.assertEqual(evaluations[0][1], 3)
+        self.assertEqual(len(slowest.report().split('\n')), 2)
+
+    def test_chrome_trace(self):
+        # type: () -> None
+        exporter = ChromeTraceExporter()
+        with installed_hooks(exporter):
+            execute_query('SELECT a FROM table1 WHERE a > 1', self.datasets)
+
+        temp_dir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(temp_dir, 'trace.json')
+            exporter.write(path)
+            with open(path) as trace_file:
+                trace = json.load(trace_file)
+        finally:
+            shutil.rmtree(temp_dir)
+        events = trace['traceEvents']  # type: List[Any]
+        self.assertEqual(len(events), len(exporter.events))
+        self.assertTrue(all(event['ph'] == 'X' for event in events))
+        query, = [event for event in events if event['name'] == 'QueryExpression']
+        self.assertEqual(query['cat'], GET_DATAFRAME)
+        # Every other event is nested inside the query's.
+        for event in events:
+            self.assertGreaterEqual(event['ts'], query['ts'])
+            self.assertLessEqual(event['ts'] + event['dur'], query['ts'] + query['dur'] + 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
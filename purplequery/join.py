@@ -9,9 +9,11 @@ DataSource is an abstract syntax tree representing the data pulled into a select
 consisting of one or more tables JOINed together.  The create_context method of this class
 implements the logic to join the tables together according to specified conditions.
 '''
-from typing import (Any, Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple,  # noqa: F401
-                    Union, cast)
+import collections
+from typing import (Any, Callable, Dict, Iterator, List, NamedTuple, Optional,  # noqa: F401
+                    Sequence, Tuple, Union, cast)
 
+import numpy as np
 import pandas as pd
 
 from .binary_expression import BinaryExpression
@@ -19,10 +21,30 @@ from .bq_abstract_syntax_tree import (EMPTY_NODE, AbstractSyntaxTreeNode,  # noq
                                       DataframeNode, EvaluatableNode, EvaluationContext, Field,
                                       TableContext, _EmptyNode)
 from .bq_types import TypedDataFrame, TypedSeries  # noqa: F401
+from .filter_evaluation import filter_positions
+from .join_order import (JoinEdge, JoinOrder, JoinStep, choose_join_order,
+                         compute_table_statistics, estimate_distinct_values)
+from .query_plan import plan_stage
+from .semi_join import reduce_pair
 
-# column name of ephemeral key added to implement a cross join with pandas merge.
-_CROSS_KEY = '__cross_key__'
+# Maximum number of rows of a cross product that are materialized at once when a join condition
+# is evaluated over it.
+_CROSS_JOIN_CHUNK_ROWS = 1 << 20
 
+'''Ceilings on the size of the result of any one join.
+
+A join whose result is estimated to exceed either ceiling raises an error before it runs, rather
+than trying to materialize the result and exhausting memory.  A TableContext's join_limits are
+used for the joins of queries executed in it; DEFAULT_JOIN_LIMITS if it has none.
+
+    Attributes:
+        max_rows: The maximum number of rows, or None for no limit.
+        max_bytes: The maximum size in bytes, or None for no limit.
+'''
+JoinLimits = NamedTuple('JoinLimits', [('max_rows', Optional[int]),
+                                       ('max_bytes', Optional[int])])
+
+DEFAULT_JOIN_LIMITS = JoinLimits(max_rows=100 * 1000 * 1000, max_bytes=8 << 30)
 
 FromItemType = Tuple[DataframeNode, Union[_EmptyNode, str]]
 ConditionsType = Union[_EmptyNode,  # JOIN with no condition
@@ -58,6 +80,108 @@ def _extract_simple_comparison(node):
     return None
 
 
+def _check_join_size(description,  # type: str
+                     estimated_rows,  # type: float
+                     left_table,  # type: TypedDataFrame
+                     right_table,  # type: TypedDataFrame
+                     join_limits  # type: Optional[JoinLimits]
+                     ):
+    # type: (...) -> None
+    '''Raises an error if the estimated result of a join exceeds the join limits.
+
+    The size of the result is estimated from the average size of a row of each input, with object
+    columns (e.g. strings) counted at the size of a reference.
+
+    Args:
+        description: A description of the join for the error, e.g. 'table1 CROSS JOIN table2'.
+        estimated_rows: The estimated number of rows of the result.
+        left_table: The left side of the join.
+        right_table: The right side of the join.
+        join_limits: The limits to apply; DEFAULT_JOIN_LIMITS if None.
+    '''
+    if join_limits is None:
+        join_limits = DEFAULT_JOIN_LIMITS
+    if join_limits.max_rows is not None and estimated_rows > join_limits.max_rows:
+        raise ValueError("{} would result in an estimated {:.0f} rows, more than the limit of {} "
+                         "rows".format(description, estimated_rows, join_limits.max_rows))
+    if join_limits.max_bytes is not None:
+        row_bytes = 0.0
+        for table in (left_table, right_table):
+            if len(table.dataframe):
+                row_bytes += (float(table.dataframe.memory_usage(index=False).sum()) /
+                              len(table.dataframe))
+        if estimated_rows * row_bytes > join_limits.max_bytes:
+            raise ValueError("{} would result in an estimated {:.0f} rows of {:.0f} bytes, more "
+                             "than the limit of {} bytes".format(
+                                 description, estimated_rows, row_bytes, join_limits.max_bytes))
+
+
+def _gather_cross_product(left_table, right_table, start, stop):
+    # type: (TypedDataFrame, TypedDataFrame, int, int) -> TypedDataFrame
+    '''Returns the rows of the cross product of two tables for a range of left rows.
+
+    Row i of the left table is paired with every row of the right table, in order, for i in
+    [start, stop).  The pairs are computed as positional take-indices (np.repeat for the left side
+    and np.tile for the right side), and only those rows are gathered from each input; the inputs
+    themselves are never modified.  The index of the result is the position of each row in the
+    full cross product, so that chunks computed separately can be concatenated back together.
+
+    Args:
+        left_table: A TypedDataFrame
+        right_table: A TypedDataFrame
+        start: First left row to include.
+        stop: One past the last left row to include.
+
+    Returns:
+        The slice of the cross-joined table.
+    '''
+    num_right_rows = len(right_table.dataframe)
+    left_positions = np.repeat(np.arange(start, stop), num_right_rows)
+    right_positions = np.tile(np.arange(num_right_rows), stop - start)
+    index = pd.RangeIndex(start * num_right_rows, stop * num_right_rows)
+
+    left_dataframe = left_table.dataframe.take(left_positions)
+    left_dataframe.index = index
+    right_dataframe = right_table.dataframe.take(right_positions)
+    right_dataframe.index = index
+    return TypedDataFrame(pd.concat([left_dataframe, right_dataframe], axis=1),
+                          left_table.types + right_table.types)
+
+
+def _cross_join_chunks(left_table, right_table, chunk_rows=_CROSS_JOIN_CHUNK_ROWS):
+    # type: (TypedDataFrame, TypedDataFrame, int) -> Iterator[TypedDataFrame]
+    '''Lazily generates the cross join of two tables, a bounded number of rows at a time.
+
+    Consumers that filter the product (or only need its first few rows) can process it chunk by
+    chunk and stop early, rather than holding all len(left) * len(right) rows in memory at once.
+    At least one chunk is always generated, so that an empty product still has the right columns.
+
+    Args:
+        left_table: A TypedDataFrame
+        right_table: A TypedDataFrame
+        chunk_rows: Approximate maximum number of rows in each chunk.  Chunks always contain
+            whole groups of rows sharing a left row, so a chunk may exceed this if the right table
+            alone is larger.
+
+    Yields:
+        Consecutive slices of the cross-joined table, in order.
+    '''
+    num_left_rows = len(left_table.dataframe)
+    num_right_rows = len(right_table.dataframe)
+    if num_right_rows:
+        left_rows_per_chunk = max(1, chunk_rows // num_right_rows)
+    else:
+        # The product is empty no matter how many left rows there are.
+        left_rows_per_chunk = max(1, num_left_rows)
+    start = 0
+    while True:
+        stop = min(num_left_rows, start + left_rows_per_chunk)
+        yield _gather_cross_product(left_table, right_table, start, stop)
+        if stop >= num_left_rows:
+            return
+        start = stop
+
+
 def _cross_join(left_table, right_table):
     # type: (TypedDataFrame, TypedDataFrame) -> TypedDataFrame
     '''Returns the cross join of the two tables.
@@ -65,8 +189,7 @@ def _cross_join(left_table, right_table):
     A CROSS join takes the cartesian product of the left and right, i.e. all possible pairs
     of a row from the left and a row from the right.  No conditions are necessary to perform
     this join, and also this join type isn't directly supported by the pandas merge function,
-    so we have special handling for it here.  We perform the cross join by adding a constant
-    column to both the left and right table and joining on it, which gives the desired result.
+    so we have special handling for it here: see _gather_cross_product.
 
     Args:
         left_table: A TypedDataFrame
@@ -75,20 +198,7 @@ def _cross_join(left_table, right_table):
     Returns:
         The cross-joined table.
     '''
-    left_table.dataframe[_CROSS_KEY] = 0
-    right_table.dataframe[_CROSS_KEY] = 0
-    result = TypedDataFrame(
-            left_table.dataframe.merge(
-                    right_table.dataframe,
-                    # the join type ('how' in pandas) doesn't matter, because
-                    # the difference between the join types lies in what to do with rows that
-                    # don't match, and here all rows match, so all the join types behave the same.
-                    how='inner',
-                    on=_CROSS_KEY).drop(_CROSS_KEY, axis=1),
-            left_table.types + right_table.types)
-    left_table.dataframe.drop(_CROSS_KEY, inplace=True, axis=1)
-    right_table.dataframe.drop(_CROSS_KEY, inplace=True, axis=1)
-    return result
+    return _gather_cross_product(left_table, right_table, 0, len(left_table.dataframe))
 
 
 def _get_common_columns(left_table, right_table):
@@ -216,12 +326,13 @@ def _join_on_arbitrary_condition(left_table,  # type: TypedDataFrame
     Returns:
         The joined table.
     '''
-    context.table = _cross_join(left_table, right_table)
-    rows_to_keep = join_condition.evaluate(context)
-    if not isinstance(rows_to_keep, TypedSeries):
-        raise RuntimeError("join condition {} evaluated to a table rather than a column"
-                           .format(join_condition))
-    result_dataframe = context.table.dataframe.loc[rows_to_keep.series]
+    # The condition is evaluated over the cross product one chunk at a time, so that only the
+    # matching rows of the (potentially huge) cross product are ever held in memory together.
+    matching_chunks = []
+    for chunk in _cross_join_chunks(left_table, right_table):
+        context.table = chunk
+        matching_chunks.append(chunk.dataframe.take(filter_positions(join_condition, context)))
+    result_dataframe = pd.concat(matching_chunks)
     if pandas_join_type in ['left', 'outer']:
         result_dataframe = pd.concat(
                 [result_dataframe, left_table.dataframe]).drop_duplicates(
@@ -233,6 +344,152 @@ def _join_on_arbitrary_condition(left_table,  # type: TypedDataFrame
     return TypedDataFrame(result_dataframe, context.table.types)
 
 
+def _factorize_join_keys(left_keys, right_keys):
+    # type: (List[pd.Series], List[pd.Series]) -> Optional[Tuple[np.ndarray, np.ndarray]]
+    '''Encodes two sides' join keys as shared int64 codes.
+
+    Each key column is factorized over the values of both sides together, so each key value is
+    hashed once and equal values on either side get the same code; multi-column keys are then
+    combined into a single code per row.  INTEGER columns are stored as float64, so numeric keys
+    are converted to float64 first, which matches an integer 1 with a float 1.0 just as comparing
+    them would.
+
+    A row with a NULL in any key column can never match (NULL = NULL is not true), so such rows
+    get the code -1 on the left and -2 on the right.
+
+    Args:
+        left_keys: The key columns of the left side.
+        right_keys: The corresponding key columns of the right side.
+    Returns:
+        The codes of the left and right rows, or None if the keys can't be factorized (if some
+        pair of columns have incomparable types, or the values aren't hashable, e.g. arrays).
+    '''
+    num_left_rows = len(left_keys[0]) if left_keys else 0
+    codes = None  # type: Optional[np.ndarray]
+    num_codes = 1
+    null_rows = None  # type: Optional[np.ndarray]
+    for left_column, right_column in zip(left_keys, right_keys):
+        if (pd.api.types.is_numeric_dtype(left_column.dtype)
+                and pd.api.types.is_numeric_dtype(right_column.dtype)):
+            values = np.concatenate([left_column.values.astype(np.float64),
+                                     right_column.values.astype(np.float64)])
+        elif left_column.dtype == right_column.dtype:
+            values = np.concatenate([left_column.values, right_column.values])
+        else:
+            return None
+        try:
+            column_codes, uniques = pd.factorize(values)
+        except TypeError:
+            return None
+        column_codes = column_codes.astype(np.int64)
+        column_nulls = column_codes < 0
+        null_rows = column_nulls if null_rows is None else null_rows | column_nulls
+        column_codes[column_nulls] = 0
+        num_uniques = max(len(uniques), 1)
+        if codes is None:
+            codes = column_codes
+        else:
+            if num_codes * num_uniques >= np.iinfo(np.int64).max:
+                # Renumber the combined codes densely so that they can't overflow.
+                codes, combined_uniques = pd.factorize(codes)
+                num_codes = len(combined_uniques)
+            codes = codes * num_uniques + column_codes
+        num_codes *= num_uniques
+    if codes is None or null_rows is None:
+        return None
+    left_codes, right_codes = codes[:num_left_rows], codes[num_left_rows:]
+    left_codes[null_rows[:num_left_rows]] = -1
+    right_codes[null_rows[num_left_rows:]] = -2
+    return left_codes, right_codes
+
+
+def _count_merged_rows(left_codes, right_codes, pandas_join_type):
+    # type: (np.ndarray, np.ndarray, str) -> int
+    '''Returns the number of rows merging two sides on their factorized keys results in.'''
+    left_counts = pd.Series(left_codes).value_counts()
+    right_counts = pd.Series(right_codes).value_counts()
+    matched_counts = left_counts.mul(right_counts).dropna()
+    rows = int(matched_counts.sum())
+    if pandas_join_type in ('left', 'outer'):
+        rows += len(left_codes) - int(left_counts[matched_counts.index].sum())
+    if pandas_join_type in ('right', 'outer'):
+        rows += len(right_codes) - int(right_counts[matched_counts.index].sum())
+    return rows
+
+
+def _estimate_merged_rows(left_dataframe, left_ons, right_dataframe, right_ons, pandas_join_type):
+    # type: (pd.DataFrame, Sequence[str], pd.DataFrame, Sequence[str], str) -> float
+    '''Estimates the number of rows merging two tables on some key columns results in.
+
+    This is the textbook estimate also used to order joins (see join_order.py): each equality of
+    keys keeps one in max(distinct left values, distinct right values) pairs of rows.
+    '''
+    rows = float(len(left_dataframe)) * len(right_dataframe)
+    for left_on, right_on in zip(left_ons, right_ons):
+        rows /= max(estimate_distinct_values(left_dataframe[left_on]),
+                    estimate_distinct_values(right_dataframe[right_on]))
+    if pandas_join_type in ('left', 'outer'):
+        rows += len(left_dataframe)
+    if pandas_join_type in ('right', 'outer'):
+        rows += len(right_dataframe)
+    return rows
+
+
+def _merge_on_keys(left_table,  # type: TypedDataFrame
+                   left_ons,  # type: Sequence[str]
+                   right_table,  # type: TypedDataFrame
+                   right_ons,  # type: Sequence[str]
+                   pandas_join_type,  # type: str
+                   description='JOIN',  # type: str
+                   join_limits=None  # type: Optional[JoinLimits]
+                   ):
+    # type: (...) -> TypedDataFrame
+    '''Joins two tables on the equality of some of their columns.
+
+    The merge runs on the dense integer codes computed by _factorize_join_keys rather than on the
+    key columns themselves, which avoids hashing float or Python string keys repeatedly, and
+    makes rows with NULL keys not match anything.  If the keys can't be factorized, the tables are
+    merged on the key columns directly.
+
+    Before merging, the size of the result is checked against the join limits: counted exactly
+    from the factorized keys, or estimated from the number of distinct keys if they can't be
+    factorized.
+
+    Args:
+        left_table: The left side of the join.
+        left_ons: The left side's join key columns.
+        right_table: The right side of the join.
+        right_ons: The right side's join key columns, corresponding to left_ons.
+        pandas_join_type: 'inner', 'left', 'right' or 'outer'.
+        description: A description of the join, for errors.
+        join_limits: The limits on the size of the result; DEFAULT_JOIN_LIMITS if None.
+    Returns:
+        The joined table.
+    '''
+    left_dataframe = left_table.dataframe
+    right_dataframe = right_table.dataframe
+    types = left_table.types + right_table.types
+    codes = _factorize_join_keys([left_dataframe[column] for column in left_ons],
+                                 [right_dataframe[column] for column in right_ons])
+    if codes is None:
+        _check_join_size(description,
+                         _estimate_merged_rows(left_dataframe, left_ons, right_dataframe,
+                                               right_ons, pandas_join_type),
+                         left_table, right_table, join_limits)
+        return TypedDataFrame(left_dataframe.merge(right_dataframe, how=pandas_join_type,
+                                                   left_on=list(left_ons),
+                                                   right_on=list(right_ons)),
+                              types)
+    left_codes, right_codes = codes
+    _check_join_size(description, _count_merged_rows(left_codes, right_codes, pandas_join_type),
+                     left_table, right_table, join_limits)
+    merged = left_dataframe.merge(right_dataframe, how=pandas_join_type,
+                                  left_on=[left_codes], right_on=[right_codes])
+    # Merging on arrays rather than columns adds a column holding the codes; drop it.
+    columns = list(left_dataframe.columns) + list(right_dataframe.columns)
+    return TypedDataFrame(merged[columns], types)
+
+
 class DataSource(AbstractSyntaxTreeNode):
     '''Node representing JOIN operations.
 
@@ -290,6 +547,7 @@ class DataSource(AbstractSyntaxTreeNode):
         Returns:
             The TypedDataFrame after the join is done.
         """
+        left_table_ids = sorted(context.table_ids)
         join_table, join_table_id = context.add_table_from_node(*join_with_alias)
 
         join_type = join_type.upper() if isinstance(join_type, str) else join_type
@@ -297,6 +555,11 @@ class DataSource(AbstractSyntaxTreeNode):
         pandas_join_type = self.BIGQUERY_TO_PANDAS_JOIN_TYPE.get(join_type)
         if pandas_join_type is None:
             raise NotImplementedError("Join type {} is not supported".format(join_type))
+        description = '{} {} JOIN {}'.format(
+            ', '.join(left_table_ids),
+            join_type.replace('_', ' ') if isinstance(join_type, str) else 'INNER',
+            join_table_id)
+        join_limits = context.table_context.join_limits
 
         # Now we execute the JOIN operation by determining the type of join condition -- the
         # user-specified condition of which rows from `table' are joined with which rows from
@@ -309,6 +572,9 @@ class DataSource(AbstractSyntaxTreeNode):
         # expression -- are not supported by the merge method, and so we have separate logic that
         # directly calculates and returns the merged table.
         if join_type == 'CROSS' and join_condition is EMPTY_NODE:
+            _check_join_size(description,
+                             float(len(table.dataframe)) * len(join_table.dataframe),
+                             table, join_table, join_limits)
             return _cross_join(table, join_table)
 
         # If no specific join condition is given, we join on columns that are common between
@@ -330,25 +596,210 @@ class DataSource(AbstractSyntaxTreeNode):
                         join_comparisons, join_table_id, context)
 
             # The user can also join ON some arbitrary boolean condition, e.g. JOIN ON (a+b < c).
+            # The condition is evaluated for every pair of rows, and in the worst case, every pair
+            # matches.
             else:
+                _check_join_size(description,
+                                 float(len(table.dataframe)) * len(join_table.dataframe),
+                                 table, join_table, join_limits)
                 return _join_on_arbitrary_condition(table, join_table, join_condition, context,
                                                     pandas_join_type)
 
-        return TypedDataFrame(table.dataframe.merge(
-                join_table.dataframe, how=pandas_join_type, left_on=left_ons, right_on=right_ons),
-                              table.types + join_table.types)
+        table, join_table = reduce_pair(table, left_ons, join_table, right_ons, pandas_join_type)
+        return _merge_on_keys(table, left_ons, join_table, right_ons, pandas_join_type,
+                              description, join_limits)
+
+    def _is_inner_equijoin_chain(self):
+        # type: () -> bool
+        """Returns True if every join is an inner join on a conjunction of field equalities.
+
+        Such chains of joins can be executed in any order; see join_order.py.
+        """
+        if len(self.joins) < 2:
+            return False
+        for join_type, unused_join_with_alias, join_condition in self.joins:
+            join_type = join_type.upper() if isinstance(join_type, str) else join_type
+            if (self.BIGQUERY_TO_PANDAS_JOIN_TYPE.get(join_type) != 'inner'
+                    or not isinstance(join_condition, EvaluatableNode)
+                    or _extract_simple_comparison(join_condition) is None):
+                return False
+        return True
+
+    def _resolve_inner_equijoin_chain(self, context):
+        # type: (EvaluationContext) -> Tuple[List[TypedDataFrame], List[str], List[JoinEdge]]
+        """Adds the tables of an inner equijoin chain to the context without joining them.
+
+        The join conditions are resolved exactly as they would be if the tables were joined in
+        FROM clause order: each condition sees only the tables up to and including its own join.
+
+        Args:
+            context: EvaluationContext to add the tables to.
+        Returns:
+            The tables, their ids, and the resolved join conditions between them.
+        """
+        table, table_id = context.add_table_from_node(*self.first_from)
+        tables, table_ids = [table], [table_id]
+        column_to_table = {column: 0 for column in table.dataframe.columns}
+        edges = []  # type: List[JoinEdge]
+        for unused_join_type, join_with_alias, join_condition in self.joins:
+            join_table, join_table_id = context.add_table_from_node(*join_with_alias)
+            left_ons, right_ons = _get_join_on_equality_comparisons(
+                cast(List[Tuple[Field, Field]], _extract_simple_comparison(
+                    cast(EvaluatableNode, join_condition))),
+                join_table_id, context)
+            for column in join_table.dataframe.columns:
+                column_to_table[column] = len(tables)
+            for left_on, right_on in zip(left_ons, right_ons):
+                edges.append(JoinEdge(column_to_table[left_on], left_on, len(tables), right_on))
+            tables.append(join_table)
+            table_ids.append(join_table_id)
+        return tables, table_ids, edges
+
+    @staticmethod
+    def _is_reorderable(table_ids, edges):
+        # type: (List[str], List[JoinEdge]) -> bool
+        """Returns True unless some join in a chain must be executed exactly as written.
+
+        If a table is joined to itself without an alias, or a condition compares a table to
+        itself, the merges must happen in FROM clause order for columns to come out right.
+        """
+        return (len(set(table_ids)) == len(table_ids)
+                and all(edge.left_table != edge.right_table for edge in edges))
+
+    @staticmethod
+    def _reduce_inner_equijoin_chain(tables, edges):
+        # type: (List[TypedDataFrame], List[JoinEdge]) -> List[TypedDataFrame]
+        """Prunes each table of an inner equijoin chain by the keys of the tables it joins.
+
+        Every pair of joined tables is semi-join reduced (see semi_join.py) once in FROM clause
+        order and once in reverse, so that a restrictive table prunes its neighbors, and through
+        them, their neighbors in turn: a selective dimension table prunes the fact table it is
+        joined to, which then prunes the other dimension tables joined to that fact table.
 
-    def create_context(self, table_context):
-        # type: (TableContext) -> EvaluationContext
+        Args:
+            tables: The tables to join, in FROM clause order.
+            edges: The resolved join conditions between them.
+        Returns:
+            The pruned tables, in the same order.
+        """
+        tables = list(tables)
+        keys_by_pair = collections.OrderedDict()  # type: Dict[Tuple[int, int], List[JoinEdge]]
+        for edge in edges:
+            keys_by_pair.setdefault((edge.left_table, edge.right_table), []).append(edge)
+        pairs = list(keys_by_pair.items())
+        for (left, right), pair_edges in pairs + pairs[::-1]:
+            tables[left], tables[right] = reduce_pair(
+                tables[left], [edge.left_column for edge in pair_edges],
+                tables[right], [edge.right_column for edge in pair_edges],
+                'inner')
+        return tables
+
+    def _plan_inner_equijoin_chain(self, tables, table_ids, edges):
+        # type: (List[TypedDataFrame], List[str], List[JoinEdge]) -> Tuple[List[TypedDataFrame], JoinOrder]  # noqa: E501
+        """Prunes the tables of an inner equijoin chain, and chooses the order to join them in.
+
+        Args:
+            tables: The tables to join, in FROM clause order.
+            table_ids: Their ids in the evaluation context.
+            edges: The resolved join conditions between them.
+        Returns:
+            The tables to join, pruned if the joins can be reordered, and the chosen order.
+        """
+        if self._is_reorderable(table_ids, edges):
+            tables = self._reduce_inner_equijoin_chain(tables, edges)
+            return tables, choose_join_order(table_ids, compute_table_statistics(tables, edges),
+                                             edges)
+
+        return tables, JoinOrder(table_ids, [JoinStep(0, [], float(len(tables[0].dataframe)))] + [
+            JoinStep(i, [(edge.left_column, edge.right_column)
+                         for edge in edges if edge.right_table == i], float('nan'))
+            for i in range(1, len(tables))], float('nan'), 'FROM clause order')
+
+    def _join_inner_equijoin_chain(self, context):
+        # type: (EvaluationContext) -> TypedDataFrame
+        """Executes an inner equijoin chain, in the cheapest order found.
+
+        The result has its columns in FROM clause order, whatever order the joins ran in.
+
+        Args:
+            context: EvaluationContext in which to evaluate the joins.
+        Returns:
+            The joined table.
+        """
+        tables, table_ids, edges = self._resolve_inner_equijoin_chain(context)
+        # The tables are all scanned before joining; the join stage consumes all the scans.
+        with plan_stage(context.table_context, 'Join', 'JOIN', ['INNER JOIN']) as stage:
+            tables, join_order = self._plan_inner_equijoin_chain(tables, table_ids, edges)
+            stage.add_substep('order: ' + ', '.join(join_order.table_names[i]
+                                                    for i in join_order.order))
+
+            first_step = join_order.steps[0]
+            table = tables[first_step.table]
+            joined_names = [join_order.table_names[first_step.table]]
+            for step in join_order.steps[1:]:
+                join_table = tables[step.table]
+                left_ons = [left for left, _ in step.keys]
+                right_ons = [right for _, right in step.keys]
+                table_name = join_order.table_names[step.table]
+                table = _merge_on_keys(
+                    table, left_ons, join_table, right_ons, 'inner',
+                    '{} INNER JOIN {}'.format(', '.join(joined_names), table_name),
+                    context.table_context.join_limits)
+                joined_names.append(table_name)
+
+            if join_order.order != list(range(len(tables))):
+                columns = [column for joined in tables for column in joined.dataframe.columns]
+                types = [type_ for joined in tables for type_ in joined.types]
+                table = TypedDataFrame(table.dataframe[columns], types)
+            stage.set_output(table)
+        return table
+
+    def explain(self, table_context):
+        # type: (TableContext) -> str
+        """Returns an EXPLAIN-style description of the order the joins will be executed in.
+
+        Args:
+            table_context: The tables available to the query.
+        Returns:
+            A human-readable description of the join order.
+        """
+        if not self._is_inner_equijoin_chain():
+            return 'Joins executed in FROM clause order'
+        tables, table_ids, edges = self._resolve_inner_equijoin_chain(
+            EvaluationContext(table_context))
+        unused_tables, join_order = self._plan_inner_equijoin_chain(tables, table_ids, edges)
+        return join_order.explain()
+
+    def create_context(self, table_context, num_rows=None):
+        # type: (TableContext, Optional[int]) -> EvaluationContext
         '''Given a representation of the entire database, add the specified
         table(s) to the query's context.
+
+        Args:
+            table_context: All the tables in the database.
+            num_rows: If not None, only the first num_rows rows of the joined table are needed.
         '''
         context = EvaluationContext(table_context)
+        if num_rows is not None and not self.joins:
+            # With nothing to join, the first rows of the context are the FROM item's first rows.
+            from_item, alias = self.first_from
+            table, table_id = from_item.get_first_rows(table_context, num_rows)
+            context.table, _ = context.add_table_from_dataframe(table, table_id, alias)
+            return context
+
+        if self._is_inner_equijoin_chain():
+            context.table = self._join_inner_equijoin_chain(context)
+            return context
+
         table, _ = context.add_table_from_node(*self.first_from)
 
         for join_type, join_with_alias, join_condition in self.joins:
-            table = self._get_joined_table(
-                    context, table, join_type, join_with_alias, join_condition)
+            join_name = (join_type.upper().replace('_', ' ') if isinstance(join_type, str)
+                         else 'INNER')
+            with plan_stage(table_context, 'Join', 'JOIN', [join_name + ' JOIN']) as stage:
+                table = self._get_joined_table(
+                        context, table, join_type, join_with_alias, join_condition)
+                stage.set_output(table)
 
         context.table = table
         return context
@@ -0,0 +1,308 @@
+# Copyright 2019 Verily Life Sciences LLC
+#
+# Use of this source code is governed by a BSD-style
+# license that can be found in the LICENSE file.
+
+'''Cost-based ordering of chains of inner joins.
+
+Users write FROM clauses in whatever order reads best, but the order in which tables are joined
+can change the size of the intermediate results by orders of magnitude.  Inner joins are
+commutative and associative, so a chain of them can be executed in any order that keeps every
+intermediate result connected by join conditions.  This module chooses such an order from simple
+table statistics: the number of rows in each table and an estimate of the number of distinct
+values in each join key.
+
+The cost of an order is the sum of the estimated sizes of the intermediate results it produces.
+Short chains are ordered exhaustively, by dynamic programming over subsets of tables; long chains
+are ordered greedily.
+'''
+
+import math
+from typing import Dict, FrozenSet, List, NamedTuple, Optional, Sequence, Tuple  # noqa: F401
+
+import numpy as np
+import pandas as pd  # noqa: F401
+
+from .bq_types import TypedDataFrame  # noqa: F401
+
+# Chains of at most this many tables are ordered by an exhaustive search; longer chains are ordered
+# greedily.
+_MAX_TABLES_FOR_EXHAUSTIVE_SEARCH = 10
+
+# The number of distinct values in a join key is estimated from a sample of at most this many rows.
+_DISTINCT_VALUE_SAMPLE_ROWS = 100000
+
+'''An equality condition between a column of one table and a column of another.
+
+    Attributes:
+        left_table: Index of the table, in FROM clause order, that the left column belongs to.
+        left_column: Name of the left column in the context's table.
+        right_table: Index of the table that the right column belongs to.
+        right_column: Name of the right column in the context's table.
+'''
+JoinEdge = NamedTuple('JoinEdge', [('left_table', int),
+                                   ('left_column', str),
+                                   ('right_table', int),
+                                   ('right_column', str)])
+
+'''Statistics about one table used to estimate the size of joins.
+
+    Attributes:
+        row_count: The number of rows in the table.
+        distinct_values: Estimated number of distinct values in each of the table's join keys.
+'''
+TableStatistics = NamedTuple('TableStatistics', [('row_count', int),
+                                                 ('distinct_values', Dict[str, int])])
+
+'''One step of a join order.
+
+    Attributes:
+        table: Index of the table joined in this step, in FROM clause order.
+        keys: (already joined column, newly joined column) pairs the join is performed on; empty
+            for the first table.
+        estimated_rows: Estimated number of rows after this step, or NaN if not estimated.
+'''
+JoinStep = NamedTuple('JoinStep', [('table', int),
+                                   ('keys', List[Tuple[str, str]]),
+                                   ('estimated_rows', float)])
+
+_PartialPlan = NamedTuple('_PartialPlan', [('cost', float),
+                                           ('rows', float),
+                                           ('order', Tuple[int, ...])])
+
+
+def estimate_distinct_values(series):
+    # type: (pd.Series) -> int
+    '''Estimates the number of distinct non-NULL values in a column.
+
+    Small columns are counted exactly.  For large columns, the count is estimated from a sample with
+    the Guaranteed-Error Estimator (Charikar et al., "Towards Estimation Error Guarantees for
+    Distinct Values", PODS 2000): values seen once in the sample are scaled up by
+    sqrt(rows / sample rows), values seen more than once are counted once.
+
+    Args:
+        series: A column of data.
+    Returns:
+        The estimated number of distinct values, at least 1.
+    '''
+    num_rows = len(series)
+    if num_rows <= _DISTINCT_VALUE_SAMPLE_ROWS:
+        return max(1, series.nunique())
+    frequencies = series.sample(n=_DISTINCT_VALUE_SAMPLE_ROWS, random_state=0).value_counts()
+    seen_once = (frequencies == 1).sum()
+    seen_more_than_once = (frequencies > 1).sum()
+    scale = np.sqrt(float(num_rows) / _DISTINCT_VALUE_SAMPLE_ROWS)
+    return max(1, int(scale * seen_once + seen_more_than_once))
+
+
+def compute_table_statistics(tables, edges):
+    # type: (Sequence[TypedDataFrame], Sequence[JoinEdge]) -> List[TableStatistics]
+    '''Computes the statistics needed to order joins of some tables.
+
+    Args:
+        tables: The tables to be joined, in FROM clause order.
+        edges: The join conditions between them.
+    Returns:
+        Statistics for each table, in the same order.
+    '''
+    distinct_values = [{} for _ in tables]  # type: List[Dict[str, int]]
+    for edge in edges:
+        for table, column in ((edge.left_table, edge.left_column),
+                              (edge.right_table, edge.right_column)):
+            if column not in distinct_values[table]:
+                distinct_values[table][column] = estimate_distinct_values(
+                    tables[table].dataframe[column])
+    return [TableStatistics(len(table.dataframe), table_distinct_values)
+            for table, table_distinct_values in zip(tables, distinct_values)]
+
+
+def _connecting_edges(joined, table, edges):
+    # type: (FrozenSet[int], int, Sequence[JoinEdge]) -> List[JoinEdge]
+    '''Returns the edges between a set of already joined tables and one more table.
+
+    Each edge is oriented so that its left side is in the joined set and its right side is table.
+    '''
+    connecting = []
+    for edge in edges:
+        if edge.right_table == table and edge.left_table in joined:
+            connecting.append(edge)
+        elif edge.left_table == table and edge.right_table in joined:
+            connecting.append(JoinEdge(edge.right_table, edge.right_column,
+                                       edge.left_table, edge.left_column))
+    return connecting
+
+
+def _estimate_join_rows(left_rows, table, connecting_edges, statistics):
+    # type: (float, int, Sequence[JoinEdge], Sequence[TableStatistics]) -> float
+    '''Estimates the size of joining an intermediate result with another table.
+
+    This is the textbook estimate assuming independent, uniformly distributed keys: each equality
+    condition keeps one in max(distinct left values, distinct right values) pairs of rows.
+    '''
+    rows = float(left_rows) * statistics[table].row_count
+    for edge in connecting_edges:
+        rows /= max(statistics[edge.left_table].distinct_values[edge.left_column],
+                    statistics[edge.right_table].distinct_values[edge.right_column])
+    return rows
+
+
+def _extend(plan, table, edges, statistics):
+    # type: (_PartialPlan, int, Sequence[JoinEdge], Sequence[TableStatistics]) -> Optional[_PartialPlan]  # noqa: E501
+    '''Returns the plan joining one more table, or None if that would be a cross product.'''
+    connecting_edges = _connecting_edges(frozenset(plan.order), table, edges)
+    if not connecting_edges:
+        return None
+    rows = _estimate_join_rows(plan.rows, table, connecting_edges, statistics)
+    return _PartialPlan(plan.cost + rows, rows, plan.order + (table,))
+
+
+def _initial_plan(table, statistics):
+    # type: (int, Sequence[TableStatistics]) -> _PartialPlan
+    return _PartialPlan(0.0, float(statistics[table].row_count), (table,))
+
+
+def _plan_for_order(order, edges, statistics):
+    # type: (Sequence[int], Sequence[JoinEdge], Sequence[TableStatistics]) -> Optional[_PartialPlan]
+    '''Returns the plan for a fixed order, or None if the order requires a cross product.'''
+    plan = _initial_plan(order[0], statistics)  # type: Optional[_PartialPlan]
+    for table in order[1:]:
+        if plan is None:
+            return None
+        plan = _extend(plan, table, edges, statistics)
+    return plan
+
+
+def _exhaustive_search(num_tables, edges, statistics):
+    # type: (int, Sequence[JoinEdge], Sequence[TableStatistics]) -> Optional[_PartialPlan]
+    '''Finds the cheapest left-deep order by dynamic programming over subsets of tables.'''
+    level = {frozenset([table]): _initial_plan(table, statistics)
+             for table in range(num_tables)}  # type: Dict[FrozenSet[int], _PartialPlan]
+    for _ in range(num_tables - 1):
+        next_level = {}  # type: Dict[FrozenSet[int], _PartialPlan]
+        # Iterate in a fixed order so that ties are always broken the same way.
+        for plan in sorted(level.values(), key=lambda plan: plan.order):
+            for table in range(num_tables):
+                if table in plan.order:
+                    continue
+                extended = _extend(plan, table, edges, statistics)
+                if extended is None:
+                    continue
+                key = frozenset(extended.order)
+                if key not in next_level or extended.cost < next_level[key].cost:
+                    next_level[key] = extended
+        level = next_level
+    return level.get(frozenset(range(num_tables)))
+
+
+def _greedy_search(num_tables, edges, statistics):
+    # type: (int, Sequence[JoinEdge], Sequence[TableStatistics]) -> Optional[_PartialPlan]
+    '''Finds a cheap order by repeatedly joining whichever table gives the smallest result.
+
+    Every table is tried as the starting table, and the cheapest of the resulting orders is kept.
+    '''
+    best = None  # type: Optional[_PartialPlan]
+    for start in range(num_tables):
+        plan = _initial_plan(start, statistics)  # type: Optional[_PartialPlan]
+        while plan is not None and len(plan.order) < num_tables:
+            candidates = [candidate
+                          for candidate in (_extend(plan, table, edges, statistics)
+                                            for table in range(num_tables)
+                                            if table not in plan.order)
+                          if candidate is not None]
+            plan = (min(candidates, key=lambda candidate: candidate.rows)
+                    if candidates else None)
+        if plan is not None and (best is None or plan.cost < best.cost):
+            best = plan
+    return best
+
+
+class JoinOrder(object):
+    '''The order in which a chain of inner joins is executed.'''
+
+    def __init__(self, table_names, steps, estimated_cost, strategy):
+        # type: (Sequence[str], Sequence[JoinStep], float, str) -> None
+        '''Constructs a JoinOrder.
+
+        Args:
+            table_names: Names of all the tables joined, in FROM clause order.
+            steps: The tables in execution order, with the keys they're joined on.
+            estimated_cost: Sum of the estimated sizes of the intermediate results, or NaN if
+                not estimated.
+            strategy: How the order was chosen, for display.
+        '''
+        self.table_names = table_names
+        self.steps = steps
+        self.estimated_cost = estimated_cost
+        self.strategy = strategy
+
+    @property
+    def order(self):
+        # type: () -> List[int]
+        '''The indexes of the tables, in FROM clause order, in the order they are joined.'''
+        return [step.table for step in self.steps]
+
+    def explain(self):
+        # type: () -> str
+        '''Returns a human-readable EXPLAIN-style description of this order.'''
+        if math.isnan(self.estimated_cost):
+            lines = ['Inner join order ({}):'.format(self.strategy)]
+        else:
+            lines = ['Inner join order ({}; estimated cost {:.0f} rows):'.format(
+                self.strategy, self.estimated_cost)]
+        for i, step in enumerate(self.steps):
+            name = self.table_names[step.table]
+            if step.keys:
+                description = 'JOIN {} ON {}'.format(
+                    name, ' AND '.join('{} = {}'.format(left, right) for left, right in step.keys))
+            else:
+                description = 'SCAN {}'.format(name)
+            if not math.isnan(step.estimated_rows):
+                description += '  (estimated rows: {:.0f})'.format(step.estimated_rows)
+            lines.append('  {}. {}'.format(i + 1, description))
+        return '\n'.join(lines)
+
+    def __repr__(self):
+        return 'JoinOrder({!r}, {!r})'.format([self.table_names[i] for i in self.order],
+                                              self.strategy)
+
+
+def choose_join_order(table_names, statistics, edges):
+    # type: (Sequence[str], Sequence[TableStatistics], Sequence[JoinEdge]) -> JoinOrder
+    '''Chooses the order in which to execute a chain of inner joins.
+
+    The FROM clause order is kept unless a strictly cheaper order is found, so that a query whose
+    tables are already well ordered executes exactly as written.
+
+    Args:
+        table_names: Names of the tables joined, in FROM clause order.
+        statistics: Statistics for each table, in the same order.
+        edges: The equality conditions between the tables.  Every table after the first must be
+            connected to an earlier one.
+    Returns:
+        The chosen JoinOrder.
+    '''
+    num_tables = len(table_names)
+    textual = _plan_for_order(range(num_tables), edges, statistics)
+    if textual is None:
+        raise ValueError("Join chain of {} is not connected by its conditions".format(table_names))
+
+    if num_tables <= _MAX_TABLES_FOR_EXHAUSTIVE_SEARCH:
+        strategy = 'dynamic programming'
+        searched = _exhaustive_search(num_tables, edges, statistics)
+    else:
+        strategy = 'greedy'
+        searched = _greedy_search(num_tables, edges, statistics)
+    if searched is None or searched.cost >= textual.cost:
+        best, strategy = textual, 'FROM clause order'
+    else:
+        best = searched
+
+    steps = [JoinStep(best.order[0], [], float(statistics[best.order[0]].row_count))]
+    rows = steps[0].estimated_rows
+    for i, table in enumerate(best.order[1:]):
+        connecting_edges = _connecting_edges(frozenset(best.order[:i + 1]), table, edges)
+        rows = _estimate_join_rows(rows, table, connecting_edges, statistics)
+        steps.append(JoinStep(table,
+                              [(edge.left_column, edge.right_column) for edge in connecting_edges],
+                              rows))
+    return JoinOrder(table_names, steps, best.cost, strategy)
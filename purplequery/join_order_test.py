@@ -0,0 +1,102 @@
+# Copyright 2019 Verily Life Sciences LLC
+#
+# Use of this source code is governed by a BSD-style
+# license that can be found in the LICENSE file.
+
+import unittest
+
+import pandas as pd
+from ddt import data, ddt, unpack
+
+from purplequery import join_order
+from purplequery.join_order import (JoinEdge, TableStatistics, choose_join_order,
+                                    estimate_distinct_values)
+
+
+@ddt
+class JoinOrderTest(unittest.TestCase):
+
+    def setUp(self):
+        # type: () -> None
+        # A big fact table listed first, joined to two small dimension tables on distinct keys.
+        self.table_names = ['fact', 'dim1', 'dim2']
+        self.statistics = [
+            TableStatistics(1000000, {'fact.k1': 1000, 'fact.k2': 10}),
+            TableStatistics(1000, {'dim1.k1': 1000, 'dim1.k2': 10}),
+            TableStatistics(10, {'dim2.k2': 10}),
+        ]
+        self.edges = [JoinEdge(0, 'fact.k1', 1, 'dim1.k1'),
+                      JoinEdge(1, 'dim1.k2', 2, 'dim2.k2')]
+
+    @data(
+        dict(values=[1, 2, 2, 3, None], expected=3),
+        dict(values=[], expected=1),
+        dict(values=['a', 'a'], expected=1),
+    )
+    @unpack
+    def test_estimate_distinct_values(self, values, expected):
+        self.assertEqual(estimate_distinct_values(pd.Series(values)), expected)
+
+    def test_estimate_distinct_values_sampled(self):
+        # type: () -> None
+        old_sample_rows = join_order._DISTINCT_VALUE_SAMPLE_ROWS
+        join_order._DISTINCT_VALUE_SAMPLE_ROWS = 100
+        try:
+            self.assertEqual(estimate_distinct_values(pd.Series([7] * 1000)), 1)
+            unique_estimate = estimate_distinct_values(pd.Series(range(10000)))
+        finally:
+            join_order._DISTINCT_VALUE_SAMPLE_ROWS = old_sample_rows
+        # All sampled values are distinct, so the estimate is scaled up to sqrt(10000/100) * 100.
+        self.assertEqual(unique_estimate, 1000)
+
+    def test_choose_join_order_dynamic_programming(self):
+        # type: () -> None
+        chosen = choose_join_order(self.table_names, self.statistics, self.edges)
+
+        self.assertEqual(chosen.order, [1, 2, 0])
+        self.assertEqual(chosen.strategy, 'dynamic programming')
+        self.assertEqual(chosen.steps[1].keys, [('dim1.k2', 'dim2.k2')])
+        self.assertEqual(chosen.steps[2].keys, [('dim1.k1', 'fact.k1')])
+
+    def test_choose_join_order_greedy(self):
+        # type: () -> None
+        old_max_tables = join_order._MAX_TABLES_FOR_EXHAUSTIVE_SEARCH
+        join_order._MAX_TABLES_FOR_EXHAUSTIVE_SEARCH = 2
+        try:
+            chosen = choose_join_order(self.table_names, self.statistics, self.edges)
+        finally:
+            join_order._MAX_TABLES_FOR_EXHAUSTIVE_SEARCH = old_max_tables
+
+        self.assertEqual(chosen.order, [1, 2, 0])
+        self.assertEqual(chosen.strategy, 'greedy')
+
+    def test_choose_join_order_keeps_from_clause_order(self):
+        # type: () -> None
+        statistics = [TableStatistics(10, {'a.k': 10}),
+                      TableStatistics(10, {'b.k': 10, 'b.j': 10}),
+                      TableStatistics(10, {'c.j': 10})]
+        edges = [JoinEdge(0, 'a.k', 1, 'b.k'), JoinEdge(1, 'b.j', 2, 'c.j')]
+
+        chosen = choose_join_order(['a', 'b', 'c'], statistics, edges)
+
+        self.assertEqual(chosen.order, [0, 1, 2])
+        self.assertEqual(chosen.strategy, 'FROM clause order')
+
+    def test_choose_join_order_disconnected(self):
+        # type: () -> None
+        with self.assertRaisesRegexp(ValueError, 'not connected'):
+            choose_join_order(self.table_names, self.statistics, self.edges[:1])
+
+    def test_explain(self):
+        # type: () -> None
+        chosen = choose_join_order(self.table_names, self.statistics, self.edges)
+
+        self.assertEqual(chosen.explain(),
+                         'Inner join order (dynamic programming; estimated cost 1001000 rows):\n'
+                         '  1. SCAN dim1  (estimated rows: 1000)\n'
+                         '  2. JOIN dim2 ON dim1.k2 = dim2.k2  (estimated rows: 1000)\n'
+                         '  3. JOIN fact ON dim1.k1 = fact.k1  (estimated rows: 1000000)')
+
+
+if __name__ == '__main__':
+    unittest.main()
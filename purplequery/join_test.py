@@ -15,7 +15,8 @@ from purplequery.bq_types import BQScalarType, TypedDataFrame
 from purplequery.dataframe_node import TableReference
 from purplequery.grammar import data_source
 from purplequery.join import ConditionsType  # noqa: F401
-from purplequery.join import DataSource, Join
+from purplequery.join import (DataSource, Join, JoinLimits, _count_merged_rows, _cross_join,
+                              _cross_join_chunks, _factorize_join_keys)
 from purplequery.query_helper import apply_rule
 from purplequery.storage import DatasetTableContext
 from purplequery.tokenizer import tokenize
@@ -322,6 +323,239 @@ class JoinTest(unittest.TestCase):
         ]
         self.assertEqual(context.table.to_list_of_lists(), result)
 
+    def test_cross_join_does_not_modify_inputs(self):
+        # type: () -> None
+        left = TypedDataFrame(pd.DataFrame([[1], [2]], columns=['t1.a']), [BQScalarType.INTEGER])
+        right = TypedDataFrame(pd.DataFrame([['x', 3.0]], columns=['t2.b', 't2.c']),
+                               [BQScalarType.STRING, BQScalarType.FLOAT])
+
+        result = _cross_join(left, right)
+
+        self.assertEqual(result.to_list_of_lists(), [[1, 'x', 3.0], [2, 'x', 3.0]])
+        self.assertEqual(list(result.dataframe), ['t1.a', 't2.b', 't2.c'])
+        self.assertEqual(list(left.dataframe), ['t1.a'])
+        self.assertEqual(list(right.dataframe), ['t2.b', 't2.c'])
+
+    @data(
+        dict(num_left=5, num_right=3, chunk_rows=1, expected_num_chunks=5),
+        dict(num_left=5, num_right=3, chunk_rows=7, expected_num_chunks=3),
+        dict(num_left=5, num_right=3, chunk_rows=100, expected_num_chunks=1),
+        dict(num_left=0, num_right=3, chunk_rows=1, expected_num_chunks=1),
+        dict(num_left=5, num_right=0, chunk_rows=1, expected_num_chunks=1),
+    )
+    @unpack
+    def test_cross_join_chunks(self, num_left, num_right, chunk_rows, expected_num_chunks):
+        # type: (int, int, int, int) -> None
+        left = TypedDataFrame(pd.DataFrame({'t1.a': range(num_left)}), [BQScalarType.INTEGER])
+        right = TypedDataFrame(pd.DataFrame({'t2.b': range(num_right)}), [BQScalarType.INTEGER])
+
+        chunks = list(_cross_join_chunks(left, right, chunk_rows))
+
+        self.assertEqual(len(chunks), expected_num_chunks)
+        combined = TypedDataFrame(pd.concat([chunk.dataframe for chunk in chunks]),
+                                  chunks[0].types)
+        self.assertEqual(combined.to_list_of_lists(),
+                         [[a, b] for a in range(num_left) for b in range(num_right)])
+        self.assertEqual(list(combined.dataframe.index), list(range(num_left * num_right)))
+
+    def test_data_source_inner_join_chain_reordered(self):
+        # type: () -> None
+        table_context = DatasetTableContext({
+            'my_project': {
+                'my_dataset': {
+                    'fact': TypedDataFrame(
+                        pd.DataFrame([[i % 4, i] for i in range(8)], columns=['k1', 'v']),
+                        types=[BQScalarType.INTEGER, BQScalarType.INTEGER]
+                    ),
+                    'dim1': TypedDataFrame(
+                        pd.DataFrame([[0, 10], [1, 20]], columns=['k1', 'k2']),
+                        types=[BQScalarType.INTEGER, BQScalarType.INTEGER]
+                    ),
+                    'dim2': TypedDataFrame(
+                        pd.DataFrame([[10]], columns=['k2']),
+                        types=[BQScalarType.INTEGER]
+                    )
+                }
+            }
+        })
+        data_source_node, leftover = data_source(tokenize(
+            'fact JOIN dim1 ON fact.k1 = dim1.k1 JOIN dim2 ON dim1.k2 = dim2.k2'))
+        self.assertFalse(leftover)
+        assert isinstance(data_source_node, DataSource)
+
+        self.assertEqual(data_source_node.explain(table_context),
+                         'Inner join order (dynamic programming; estimated cost 3 rows):\n'
+                         '  1. SCAN dim1  (estimated rows: 2)\n'
+                         '  2. JOIN dim2 ON dim1.k2 = dim2.k2  (estimated rows: 1)\n'
+                         '  3. JOIN fact ON dim1.k1 = fact.k1  (estimated rows: 2)')
+
+        context = data_source_node.create_context(table_context)
+        # Columns come out in FROM clause order, whatever order the joins were executed in.
+        self.assertEqual(list(context.table.dataframe),
+                         ['fact.k1', 'fact.v', 'dim1.k1', 'dim1.k2', 'dim2.k2'])
+        self.assertEqual(sorted(context.table.to_list_of_lists()),
+                         [[0, 0, 0, 10, 10], [0, 4, 0, 10, 10]])
+
+    def test_data_source_explain_plans_pruned_tables(self):
+        # type: () -> None
+        # Large enough tables are pruned by the keys of the tables they are joined to before the
+        # join order is chosen; explain describes the plan chosen for the pruned tables.
+        table_context = DatasetTableContext({
+            'my_project': {
+                'my_dataset': {
+                    'fact': TypedDataFrame(
+                        pd.DataFrame([[i % 10000, i] for i in range(20000)], columns=['k1', 'v']),
+                        types=[BQScalarType.INTEGER, BQScalarType.INTEGER]
+                    ),
+                    'dim1': TypedDataFrame(
+                        pd.DataFrame([[i, i] for i in range(10000)], columns=['k1', 'k2']),
+                        types=[BQScalarType.INTEGER, BQScalarType.INTEGER]
+                    ),
+                    'dim2': TypedDataFrame(
+                        pd.DataFrame([[0]], columns=['k2']),
+                        types=[BQScalarType.INTEGER]
+                    )
+                }
+            }
+        })
+        data_source_node, leftover = data_source(tokenize(
+            'fact JOIN dim1 ON fact.k1 = dim1.k1 JOIN dim2 ON dim1.k2 = dim2.k2'))
+        self.assertFalse(leftover)
+        assert isinstance(data_source_node, DataSource)
+
+        self.assertEqual(data_source_node.explain(table_context),
+                         'Inner join order (dynamic programming; estimated cost 3 rows):\n'
+                         '  1. SCAN dim1  (estimated rows: 1)\n'
+                         '  2. JOIN dim2 ON dim1.k2 = dim2.k2  (estimated rows: 1)\n'
+                         '  3. JOIN fact ON dim1.k1 = fact.k1  (estimated rows: 2)')
+
+    @data(
+        dict(left=[['x', 1], ['y', 2]], right=[['y', 1], ['x', 1], ['z', 1]],
+             left_codes=[0, 3], right_codes=[2, 0, 4]),
+        # Integer and float keys are compared numerically.
+        dict(left=[[1, 1]], right=[[1.0, 1.0], [2.0, 1.0]],
+             left_codes=[0], right_codes=[0, 1]),
+        # Multi-column keys are combined into one code per row.
+        dict(left=[['x', 1], ['x', 2]], right=[['x', 2], ['y', 1]],
+             left_codes=[0, 1], right_codes=[1, 2]),
+        # Rows with a NULL in any key column never match anything.
+        dict(left=[[None, 1], ['x', None]], right=[[None, 1], ['x', None]],
+             left_codes=[-1, -1], right_codes=[-2, -2]),
+    )
+    @unpack
+    def test_factorize_join_keys(self, left, right, left_codes, right_codes):
+        left_dataframe = pd.DataFrame(left)
+        right_dataframe = pd.DataFrame(right)
+
+        codes = _factorize_join_keys([left_dataframe[0], left_dataframe[1]],
+                                     [right_dataframe[0], right_dataframe[1]])
+
+        assert codes is not None
+        self.assertEqual(list(codes[0]), left_codes)
+        self.assertEqual(list(codes[1]), right_codes)
+
+    def test_factorize_join_keys_incomparable(self):
+        # type: () -> None
+        self.assertIsNone(_factorize_join_keys([pd.Series([1])], [pd.Series(['1'])]))
+
+    @data(
+        dict(join_type='INNER JOIN', result=[['a', 1, 'a', 3]]),
+        dict(join_type='LEFT OUTER JOIN', result=[['a', 1, 'a', 3], [None, 2, None, None]]),
+        dict(join_type='FULL OUTER JOIN',
+             result=[['a', 1, 'a', 3], [None, 2, None, None], [None, None, None, 4]]),
+    )
+    @unpack
+    def test_data_source_join_null_keys_do_not_match(self, join_type, result):
+        # type: (str, List[List[int]]) -> None
+        table_context = DatasetTableContext({
+            'my_project': {
+                'my_dataset': {
+                    'my_table': TypedDataFrame(
+                        pd.DataFrame([['a', 1], [None, 2]], columns=['s', 'a']),
+                        types=[BQScalarType.STRING, BQScalarType.INTEGER]
+                    ),
+                    'my_table2': TypedDataFrame(
+                        pd.DataFrame([['a', 3], [None, 4]], columns=['s', 'b']),
+                        types=[BQScalarType.STRING, BQScalarType.INTEGER]
+                    )
+                }
+            }
+        })
+        data_source_node, leftover = data_source(tokenize(
+            'my_table {} my_table2 ON my_table.s = my_table2.s'.format(join_type)))
+        self.assertFalse(leftover)
+        assert isinstance(data_source_node, DataSource)
+        context = data_source_node.create_context(table_context)
+
+        self.assertEqual(context.table.to_list_of_lists(), result)
+
+    @data(
+        dict(pandas_join_type='inner', rows=2 * 1 + 1 * 2),
+        dict(pandas_join_type='left', rows=2 * 1 + 1 * 2 + 2),
+        dict(pandas_join_type='right', rows=2 * 1 + 1 * 2 + 2),
+        dict(pandas_join_type='outer', rows=2 * 1 + 1 * 2 + 2 + 2),
+    )
+    @unpack
+    def test_count_merged_rows(self, pandas_join_type, rows):
+        # type: (str, int) -> None
+        # Negative codes are NULL keys, which match nothing.
+        left_codes = pd.Series([0, 0, 1, 2, -1]).values
+        right_codes = pd.Series([0, 1, 1, 3, -2]).values
+        self.assertEqual(_count_merged_rows(left_codes, right_codes, pandas_join_type), rows)
+
+    @data(
+        dict(join='my_table CROSS JOIN my_table2',
+             error='my_table CROSS JOIN my_table2 would result in an estimated 4 rows'),
+        dict(join='my_table JOIN my_table2 ON my_table.a < my_table2.b',
+             error='my_table INNER JOIN my_table2 would result in an estimated 4 rows'),
+        dict(join='my_table AS t1 JOIN my_table AS t2 ON t1.a = t2.a JOIN my_table AS t3 '
+                  'ON t2.a = t3.a',
+             error='t1 INNER JOIN t2 would result in an estimated 4 rows'),
+    )
+    @unpack
+    def test_data_source_join_exceeds_row_limit(self, join, error):
+        # type: (str, str) -> None
+        table_context = DatasetTableContext({
+            'my_project': {
+                'my_dataset': {
+                    'my_table': TypedDataFrame(
+                        pd.DataFrame([[1], [1]], columns=['a']),
+                        types=[BQScalarType.INTEGER]
+                    ),
+                    'my_table2': TypedDataFrame(
+                        pd.DataFrame([[2], [3]], columns=['b']),
+                        types=[BQScalarType.INTEGER]
+                    )
+                }
+            }
+        }, join_limits=JoinLimits(max_rows=3, max_bytes=None))
+        data_source_node, leftover = data_source(tokenize(join))
+        self.assertFalse(leftover)
+        assert isinstance(data_source_node, DataSource)
+
+        with self.assertRaisesRegexp(ValueError, error + ', more than the limit of 3 rows'):
+            data_source_node.create_context(table_context)
+
+    def test_data_source_join_exceeds_byte_limit(self):
+        # type: () -> None
+        table_context = DatasetTableContext(
+            {'my_project': {'my_dataset': {'my_table': TypedDataFrame(
+                pd.DataFrame([[1, 2.0], [2, 3.0]], columns=['a', 'b']),
+                types=[BQScalarType.INTEGER, BQScalarType.FLOAT])}}},
+            join_limits=JoinLimits(max_rows=None, max_bytes=100))
+        equijoin, _ = data_source(tokenize(
+            'my_table AS t1 JOIN my_table AS t2 ON t1.a = t2.a'))
+        cross_join, _ = data_source(tokenize('my_table AS t1 CROSS JOIN my_table AS t2'))
+        assert isinstance(equijoin, DataSource)
+        assert isinstance(cross_join, DataSource)
+
+        # Two rows of two eight-byte columns on each side fit in the limit; four don't.
+        self.assertEqual(len(equijoin.create_context(table_context).table.dataframe), 2)
+        with self.assertRaisesRegexp(
+                ValueError, 't1 CROSS JOIN t2 would result in an estimated 4 rows of 32 bytes, '
+                'more than the limit of 100 bytes'):
+            cross_join.create_context(table_context)
+
     @data(
         dict(
             join_type='fake_join_type',
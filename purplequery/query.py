@@ -6,10 +6,16 @@
 '''Run queries against the BigQuery fake implementation.'''
 
 import re
+from typing import Optional, Union  # noqa: F401
 
 from .bq_abstract_syntax_tree import DatasetType, Result  # noqa: F401
+from .bq_abstract_syntax_tree import intern_expressions
+from .constant_folding import fold_constants
 from .dataframe_node import QueryExpression
+from .dry_run import DryRunResult, dry_run  # noqa: F401
+from .join import JoinLimits  # noqa: F401
 from .query_helper import apply_rule
+from .query_plan import QueryPlan  # noqa: F401
 from .statement_grammar import bigquery_statement
 from .statements import Statement
 from .storage import DatasetTableContext
@@ -28,34 +34,96 @@ def _simplify_query(query):
     return re.sub(r'[\n\s]+', ' ', remove_comments(query))
 
 
-def execute_query(query, datasets):
-    # type: (str, DatasetType) -> Result
+def _add_query_to_error(error, query):
+    # type: (Exception, str) -> None
+    '''Appends the query to an exception's message.'''
+    first = error.args[0] if len(error.args) > 0 else ''
+    rest = error.args[1:] if len(error.args) > 1 else tuple()
+    error.args = (first + "\nsimplified query {!r}\nraw query {!r}".format(
+        _simplify_query(query), query),) + rest
+
+
+def _parse_query(query):
+    # type: (str) -> Union[QueryExpression, Statement]
+    '''See parse_query for docstring; errors are not annotated with the query.'''
+    tokens = tokenize(query)
+    tree, leftover = apply_rule(bigquery_statement, tokens)
+    if leftover:
+        raise RuntimeError('Could not fully parse query: leftover tokens {!r}'.format(leftover))
+    if not isinstance(tree, tuple) or len(tree) != 2:
+        raise RuntimeError('Parsing expression did not return appropriate data type: {!r}'
+                           .format(tree))
+    node, unused_optional_semicolon = tree
+    if isinstance(node, (QueryExpression, Statement)):
+        intern_expressions(node)
+        return node
+    raise RuntimeError('Parsing expression did not return appropriate data type: {!r}'
+                       .format(node))
+
+
+def parse_query(query):
+    # type: (str) -> Union[QueryExpression, Statement]
+    '''Parses a query without executing it.
+
+    Args:
+        query: The SQL query as a string
+    Returns:
+        The query or statement's abstract syntax tree, in which the expressions that are the same
+        are one shared instance (see intern_expressions).
+    '''
+    try:
+        return _parse_query(query)
+    except Exception as e:
+        _add_query_to_error(e, query)
+        raise
+
+
+def execute_query(query, datasets, node=None, plan=None, join_limits=None):
+    # type: (str, DatasetType, Optional[Union[QueryExpression, Statement]], Optional[QueryPlan], Optional[JoinLimits]) -> Result  # noqa: E501
     '''Entrypoint method to run a query against the specified database.
 
     Args:
         query: The SQL query as a string
         datasets: A representation of all the data in this universe in the
             DatasetType format (see bq_abstract_syntax_tree.py)
+        node: The query already parsed by parse_query, if it has been.  Its constant
+            subexpressions are folded in place (see constant_folding.py), and the expressions
+            that are then the same are interned (see intern_expressions).
+        plan: If not None, a QueryPlan on which to record the stages of executing the query.
+        join_limits: If not None, the limits on the size of joins; see join.JoinLimits.
     Returns:
         A Result object containing the results of the SQL query on the given data
     '''
     try:
-        tokens = tokenize(query)
-        tree, leftover = apply_rule(bigquery_statement, tokens)
-        if leftover:
-            raise RuntimeError('Could not fully parse query: leftover tokens {!r}'.format(leftover))
-        if not isinstance(tree, tuple) or len(tree) != 2:
-            raise RuntimeError('Parsing expression did not return appropriate data type: {!r}'
-                               .format(tree))
-        node, unused_optional_semicolon = tree
-        table_context = DatasetTableContext(datasets)
-        if isinstance(node, (QueryExpression, Statement)):
-            return node.execute(table_context)
-        raise RuntimeError('Parsing expression did not return appropriate data type: {!r}'
-                           .format(node))
+        if node is None:
+            node = _parse_query(query)
+        intern_expressions(fold_constants(node))
+        return node.execute(DatasetTableContext(datasets, plan, join_limits))
+    except Exception as e:
+        _add_query_to_error(e, query)
+        raise
+
+
+def dry_run_query(query, datasets, node=None):
+    # type: (str, DatasetType, Optional[QueryExpression]) -> DryRunResult
+    '''Validates a query against the specified database without running it.
+
+    Args:
+        query: The SQL query as a string
+        datasets: A representation of all the data in this universe in the
+            DatasetType format (see bq_abstract_syntax_tree.py)
+        node: The query already parsed by parse_query, if it has been.
+    Returns:
+        An empty table with the columns and types of the query's result, and the number of bytes
+        running the query would process and be billed for; see dry_run.py.
+    '''
+    try:
+        if node is None:
+            parsed = _parse_query(query)
+            if not isinstance(parsed, QueryExpression):
+                raise NotImplementedError("Dry run of statements is not implemented")
+            node = parsed
+        return dry_run(node, datasets)
     except Exception as e:
-        first = e.args[0] if len(e.args) > 0 else ''
-        rest = e.args[1:] if len(e.args) > 1 else tuple()
-        e.args = (first + "\nsimplified query {!r}\nraw query {!r}".format(
-            _simplify_query(query), query),) + rest
+        _add_query_to_error(e, query)
         raise
@@ -0,0 +1,318 @@
+# Copyright 2019 Verily Life Sciences LLC
+#
+# Use of this source code is governed by a BSD-style
+# license that can be found in the LICENSE file.
+
+'''Statistics on the stages of executing a query, in the shape of BigQuery's query plan.
+
+Each operator that runs while executing a query (a table scan, a filter, a join, an aggregation,
+an analytic function, a sort, a limit, a set operation, a projection or an expression subquery)
+records a stage with its input and output row counts, its wall time and the approximate size of
+its output.  The stages are reported like the ExplainQueryStages of a BigQuery job's query plan:
+https://cloud.google.com/bigquery/docs/reference/rest/v2/Job#ExplainQueryStage
+
+Stages are recorded on the QueryPlan of the TableContext a query is executed in, if any; with no
+QueryPlan, recording a stage costs one attribute lookup.
+
+A stage's inputs are the stages whose output it consumes.  Operators like filters and sorts
+consume the output of the stages that ran before them in the same query (see QueryPlan.scope),
+while stages that read their own data, like table scans, don't.  Any stage also consumes the output
+of stages that ran nested inside it, like the scan of a join's right-hand table.
+'''
+
+import time
+from typing import Any, Dict, List, Optional, Sequence  # noqa: F401
+
+from .bq_types import TypedDataFrame, TypedSeries  # noqa: F401
+from .storage import TableContext  # noqa: F401
+
+
+class _Stage(object):
+    '''Statistics recorded for one stage.'''
+
+    def __init__(self, name, step_kind, substeps):
+        # type: (str, str, Sequence[str]) -> None
+        '''Starts recording a stage.
+
+        Args:
+            name: The kind of operator, e.g. 'Filter'.
+            step_kind: The kind of the stage's step, as in BigQuery, e.g. 'FILTER'.
+            substeps: Human-readable descriptions of what the stage does.
+        '''
+        self.name = name
+        self.step_kind = step_kind
+        self.substeps = list(substeps)
+        self.entry_id = None  # type: Optional[int]
+        self.input_stages = []  # type: List[int]
+        self.start = 0.0
+        self.end = 0.0
+        # Wall time spent in this stage, excluding the stages nested inside it.
+        self.compute_seconds = 0.0
+        self.records_read = None  # type: Optional[int]
+        self.records_written = 0
+        self.output_bytes = 0
+
+    def add_substep(self, substep):
+        # type: (str) -> None
+        '''Adds a human-readable description of something the stage does.'''
+        self.substeps.append(substep)
+
+    def set_input_rows(self, num_rows):
+        # type: (int) -> None
+        '''Records the number of rows read by a stage that doesn't consume other stages' output.'''
+        self.records_read = num_rows
+
+    def set_output(self, output):
+        # type: (Any) -> None
+        '''Records the stage's output.
+
+        Args:
+            output: The TypedDataFrame or TypedSeries the stage results in.
+        '''
+        if isinstance(output, TypedDataFrame):
+            self.records_written = len(output.dataframe)
+            # Object columns (e.g. strings) are counted at the size of a reference, so this is
+            # approximate, but cheap.
+            self.output_bytes = int(output.dataframe.memory_usage(index=False).sum())
+        elif isinstance(output, TypedSeries):
+            self.records_written = len(output.series)
+            self.output_bytes = int(output.series.memory_usage(index=False))
+
+    def set_output_rows(self, num_rows, num_bytes):
+        # type: (int, int) -> None
+        '''Records the size of a stage's output that isn't a table, e.g. the rows a filter keeps.'''
+        self.records_written = num_rows
+        self.output_bytes = num_bytes
+
+
+class _NoStage(object):
+    '''Stands in for a stage when no QueryPlan is recording; all its methods do nothing.'''
+
+    def __enter__(self):
+        # type: () -> _NoStage
+        return self
+
+    def __exit__(self, *unused_exception_info):
+        # type: (*Any) -> None
+        pass
+
+    def add_substep(self, substep):
+        # type: (str) -> None
+        pass
+
+    def set_input_rows(self, num_rows):
+        # type: (int) -> None
+        pass
+
+    def set_output(self, output):
+        # type: (Any) -> None
+        pass
+
+    def set_output_rows(self, num_rows, num_bytes):
+        # type: (int, int) -> None
+        pass
+
+
+_NO_STAGE = _NoStage()
+
+
+class _StageRecorder(object):
+    '''Context manager recording a stage of a QueryPlan while its operator runs.'''
+
+    def __init__(self, plan, stage, consumes_input, collapse):
+        # type: (QueryPlan, _Stage, bool, bool) -> None
+        self.plan = plan
+        self.stage = stage
+        self.consumes_input = consumes_input
+        self.collapse = collapse
+
+    def __enter__(self):
+        # type: () -> _Stage
+        self.plan._start(self.stage, self.consumes_input, self.collapse)
+        return self.stage
+
+    def __exit__(self, *unused_exception_info):
+        # type: (*Any) -> None
+        self.plan._finish(self.stage, self.collapse)
+
+
+class _Scope(object):
+    '''Context manager for a QueryPlan scope; see QueryPlan.scope.'''
+
+    def __init__(self, plan):
+        # type: (QueryPlan) -> None
+        self.plan = plan
+
+    def __enter__(self):
+        # type: () -> None
+        self.plan._unconsumed.append([])
+
+    def __exit__(self, *unused_exception_info):
+        # type: (*Any) -> None
+        finished = self.plan._unconsumed.pop()
+        self.plan._unconsumed[-1].extend(finished)
+
+
+class QueryPlan(object):
+    '''The stages recorded while executing one query.'''
+
+    def __init__(self):
+        # type: () -> None
+        # Finished stages, in order of entry_id, i.e. in the order they finished.
+        self.stages = []  # type: List[_Stage]
+        # For each scope or running stage, the ids of the stages finished in it whose output
+        # hasn't been consumed yet.
+        self._unconsumed = [[]]  # type: List[List[int]]
+        # For each running stage, the wall time spent in the stages nested inside it.
+        self._nested_seconds = []  # type: List[float]
+        # The number of running stages whose nested stages are not recorded separately.
+        self._collapsed = 0
+
+    def stage(self, name, step_kind, substeps=(), consumes_input=True, collapse=False):
+        # type: (str, str, Sequence[str], bool, bool) -> Any
+        '''Returns a context manager recording a stage while the operator runs inside it.
+
+        The context manager's value has methods to record the number of rows the stage reads
+        (set_input_rows; by default, the number of rows its inputs wrote), its output
+        (set_output) and more substeps (add_substep).
+
+        Args:
+            name: The kind of operator, e.g. 'Filter'.
+            step_kind: The kind of the stage's step, as in BigQuery, e.g. 'FILTER'.
+            substeps: Human-readable descriptions of what the stage does.
+            consumes_input: Whether the stage consumes the output of the stages that ran before
+                it in the same scope.
+            collapse: If true, stages running nested inside this one are not recorded; their
+                time counts as this stage's.  Used for subqueries that run once per row.
+        '''
+        if self._collapsed:
+            return _NO_STAGE
+        return _StageRecorder(self, _Stage(name, step_kind, substeps), consumes_input, collapse)
+
+    def scope(self):
+        # type: () -> Any
+        '''Returns a context manager delimiting the stages of one query (e.g. one SELECT).
+
+        Stages in a scope only consume the output of stages that ran before them in the same
+        scope.  The stages of a scope whose output isn't consumed inside it are left for the
+        stages of the enclosing scope to consume: e.g. the last stage of a subquery in a FROM
+        clause is the input of the filter of the enclosing SELECT.
+        '''
+        return _Scope(self)
+
+    def _start(self, stage, consumes_input, collapse):
+        # type: (_Stage, bool, bool) -> None
+        '''Starts recording a stage; see stage().'''
+        if consumes_input:
+            stage.input_stages = self._unconsumed[-1]
+            self._unconsumed[-1] = []
+        self._unconsumed.append([])
+        self._nested_seconds.append(0.0)
+        if collapse:
+            self._collapsed += 1
+        stage.start = time.time()
+
+    def _finish(self, stage, collapse):
+        # type: (_Stage, bool) -> None
+        '''Finishes recording a stage; see stage().'''
+        stage.end = time.time()
+        if collapse:
+            self._collapsed -= 1
+        seconds = stage.end - stage.start
+        stage.compute_seconds = max(seconds - self._nested_seconds.pop(), 0.0)
+        if self._nested_seconds:
+            self._nested_seconds[-1] += seconds
+        stage.input_stages = stage.input_stages + self._unconsumed.pop()
+        if stage.records_read is None:
+            stage.records_read = sum(self.stages[input_stage].records_written
+                                     for input_stage in stage.input_stages)
+        stage.entry_id = len(self.stages)
+        self.stages.append(stage)
+        self._unconsumed[-1].append(stage.entry_id)
+
+    def to_api_repr(self):
+        # type: () -> List[Dict[str, Any]]
+        '''Returns the stages as BigQuery API ExplainQueryStage resources.
+
+        The compute ratios are relative to the stage that took the longest, as in BigQuery.
+        '''
+        slowest = max([stage.compute_seconds for stage in self.stages] + [0.0])
+        resources = []
+        for stage in self.stages:
+            compute_ms = str(int(stage.compute_seconds * 1000))
+            compute_ratio = stage.compute_seconds / slowest if slowest else 0.0
+            resources.append({
+                'name': 'S{:02d}: {}'.format(stage.entry_id, stage.name),
+                'id': str(stage.entry_id),
+                'startMs': str(int(stage.start * 1000)),
+                'endMs': str(int(stage.end * 1000)),
+                'inputStages': [str(input_stage) for input_stage in stage.input_stages],
+                'parallelInputs': '1',
+                'completedParallelInputs': '1',
+                'computeMsAvg': compute_ms,
+                'computeMsMax': compute_ms,
+                'computeRatioAvg': compute_ratio,
+                'computeRatioMax': compute_ratio,
+                'recordsRead': str(stage.records_read),
+                'recordsWritten': str(stage.records_written),
+                'shuffleOutputBytes': str(stage.output_bytes),
+                'status': 'COMPLETE',
+                'steps': [{'kind': stage.step_kind, 'substeps': stage.substeps}],
+            })
+        return resources
+
+
+def plan_stage(table_context, name, step_kind, substeps=(), consumes_input=True, collapse=False):
+    # type: (TableContext, str, str, Sequence[str], bool, bool) -> Any
+    '''Returns a context manager recording a stage on a table context's QueryPlan.
+
+    If the table context has no QueryPlan, nothing is recorded.  See QueryPlan.stage for the
+    arguments.
+    '''
+    plan = table_context.plan
+    if plan is None:
+        return _NO_STAGE
+    return plan.stage(name, step_kind, substeps, consumes_input, collapse)
+
+
+def plan_scope(table_context):
+    # type: (TableContext) -> Any
+    '''Returns a context manager delimiting the stages of one query; see QueryPlan.scope.'''
+    plan = table_context.plan
+    if plan is None:
+        return _NO_STAGE
+    return plan.scope()
+
+
+def format_query_plan(query_plan):
+    # type: (Sequence[Any]) -> str
+    '''Renders a query plan as text, one line per stage.
+
+    Args:
+        query_plan: A job's query_plan, a list of google.cloud.bigquery.job.QueryPlanEntry.
+    Returns:
+        A table of the stages with their inputs, row counts, compute time (in milliseconds, and
+        relative to the slowest stage), output bytes and steps.
+    '''
+    header = ['Stage', 'Inputs', 'Rows in', 'Rows out', 'Time ms', 'Time %', 'Bytes out', 'Steps']
+    rows = [header]
+    for entry in query_plan:
+        steps = '; '.join(
+            '{}: {}'.format(step.kind, ', '.join(step.substeps)) if step.substeps else step.kind
+            for step in entry.steps)
+        rows.append([
+            entry.name,
+            ','.join('S{:02d}'.format(input_stage) for input_stage in entry.input_stages),
+            str(entry.records_read),
+            str(entry.records_written),
+            str(entry.compute_ms_max),
+            '{:.0f}'.format(100 * (entry.compute_ratio_max or 0.0)),
+            str(entry.shuffle_output_bytes),
+            steps])
+    widths = [max(len(row[i]) for row in rows) for i in range(len(header) - 1)]
+    lines = []
+    for row in rows:
+        cells = [row[0].ljust(widths[0]), row[1].ljust(widths[1])]
+        cells.extend(cell.rjust(width) for cell, width in zip(row[2:-1], widths[2:]))
+        lines.append('  '.join(cells + [row[-1]]).rstrip())
+    return '\n'.join(lines)
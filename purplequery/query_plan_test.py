@@ -0,0 +1,131 @@
+# Copyright 2019 Verily Life Sciences LLC
+#
+# Use of this source code is governed by a BSD-style
+# license that can be found in the LICENSE file.
+
+import unittest
+from typing import List, Tuple  # noqa: F401
+
+import pandas as pd
+from ddt import data, ddt, unpack
+from google.cloud.bigquery.job import QueryPlanEntry
+
+from purplequery.bq_types import BQScalarType, TypedDataFrame
+from purplequery.query import execute_query
+from purplequery.query_plan import QueryPlan, format_query_plan
+
+
+@ddt
+class QueryPlanTest(unittest.TestCase):
+
+    def setUp(self):
+        # type: () -> None
+        self.datasets = {
+            'my_project': {
+                'my_dataset': {
+                    'table1': TypedDataFrame(
+                        pd.DataFrame([[1, 'a'], [2, 'b'], [3, 'c'], [4, 'd']],
+                                     columns=['a', 'b']),
+                        [BQScalarType.INTEGER, BQScalarType.STRING]),
+                    'table2': TypedDataFrame(
+                        pd.DataFrame([[1, 10.0], [3, 30.0]], columns=['a', 'c']),
+                        [BQScalarType.INTEGER, BQScalarType.FLOAT]),
+                }
+            }
+        }
+
+    @data(
+        dict(query='SELECT a FROM table1 WHERE a > 1',
+             expected_stages=[('Scan', [], 4, 4),
+                              ('Filter', [0], 4, 3),
+                              ('Project', [1], 3, 3)]),
+        dict(query='SELECT b, COUNT(*) FROM table1 GROUP BY b ORDER BY b LIMIT 2 OFFSET 1',
+             expected_stages=[('Scan', [], 4, 4),
+                              ('Aggregate', [0], 4, 4),
+                              ('Sort', [1], 4, 4),
+                              ('Limit', [2], 4, 2)]),
+        dict(query=('SELECT table1.a, c FROM table1 LEFT JOIN table2 '
+                    'ON table1.a = table2.a'),
+             expected_stages=[('Scan', [], 4, 4),
+                              ('Scan', [], 2, 2),
+                              ('Join', [0, 1], 6, 4),
+                              ('Project', [2], 4, 4)]),
+        # Each query of a set operation is its own pipeline of stages.
+        dict(query='SELECT * FROM (SELECT a FROM table1 UNION ALL SELECT a FROM table2)',
+             expected_stages=[('Scan', [], 4, 4),
+                              ('Project', [0], 4, 4),
+                              ('Scan', [], 2, 2),
+                              ('Project', [2], 2, 2),
+                              ('Union', [1, 3], 6, 6),
+                              ('Project', [4], 6, 6)]),
+        dict(query='SELECT a, ROW_NUMBER() OVER (ORDER BY a) FROM table2',
+             expected_stages=[('Scan', [], 2, 2),
+                              ('Window', [0], 2, 2)]),
+        # The stages of a correlated subquery, run once per row, are not recorded separately.
+        dict(query=('SELECT a FROM table1 WHERE '
+                    'EXISTS (SELECT 1 FROM table2 WHERE table2.a = 3)'),
+             expected_stages=[('Scan', [], 4, 4),
+                              ('Subquery', [], 4, 4),
+                              ('Filter', [0, 1], 8, 4),
+                              ('Project', [2], 4, 4)]),
+    )
+    @unpack
+    def test_stages(self, query, expected_stages):
+        # type: (str, List[Tuple[str, List[int], int, int]]) -> None
+        plan = QueryPlan()
+        execute_query(query, self.datasets, plan=plan)
+        self.assertEqual([(stage.name, stage.input_stages, stage.records_read,
+                           stage.records_written)
+                          for stage in plan.stages],
+                         expected_stages)
+
+    def test_with_clause_stages_are_inputs_of_scan(self):
+        # type: () -> None
+        plan = QueryPlan()
+        execute_query('WITH t AS (SELECT a FROM table1 WHERE a < 3) SELECT a FROM t',
+                      self.datasets, plan=plan)
+        self.assertEqual([(stage.name, stage.input_stages) for stage in plan.stages],
+                         [('Scan', []), ('Filter', [0]), ('Project', [1]), ('Scan', [2]),
+                          ('Project', [3])])
+
+    def test_api_repr(self):
+        # type: () -> None
+        plan = QueryPlan()
+        execute_query('SELECT a FROM table1 WHERE a > 1', self.datasets, plan=plan)
+        entries = [QueryPlanEntry.from_api_repr(stage) for stage in plan.to_api_repr()]
+
+        self.assertEqual([entry.name for entry in entries],
+                         ['S00: Scan', 'S01: Filter', 'S02: Project'])
+        self.assertEqual([entry.entry_id for entry in entries], ['0', '1', '2'])
+        self.assertEqual([entry.input_stages for entry in entries], [[], [0], [1]])
+        self.assertEqual([entry.records_read for entry in entries], [4, 4, 3])
+        self.assertEqual([entry.records_written for entry in entries], [4, 3, 3])
+        # Three int64 values.
+        self.assertEqual(entries[2].shuffle_output_bytes, 24)
+        self.assertEqual(max(entry.compute_ratio_max for entry in entries), 1.0)
+        self.assertEqual([(step.kind, step.substeps) for step in entries[0].steps],
+                         [('READ', ['FROM table1'])])
+
+    def test_format_query_plan(self):
+        # type: () -> None
+        plan = QueryPlan()
+        execute_query('SELECT a FROM table1 WHERE a > 1', self.datasets, plan=plan)
+        lines = format_query_plan(
+            [QueryPlanEntry.from_api_repr(stage) for stage in plan.to_api_repr()]).split('\n')
+
+        self.assertEqual(lines[0].split(),
+                         ['Stage', 'Inputs', 'Rows', 'in', 'Rows', 'out', 'Time', 'ms', 'Time',
+                          '%', 'Bytes', 'out', 'Steps'])
+        self.assertEqual(len(lines), 4)
+        self.assertTrue(lines[2].startswith('S01: Filter'))
+        self.assertTrue(lines[2].endswith('FILTER: WHERE'))
+        self.assertIn('S00', lines[2])
+
+    def test_no_plan(self):
+        # type: () -> None
+        result = execute_query('SELECT a FROM table1 WHERE a > 1', self.datasets)
+        self.assertEqual(result.table.to_list_of_lists(), [[2], [3], [4]])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,205 @@
+# Copyright 2019 Verily Life Sciences LLC
+#
+# Use of this source code is governed by a BSD-style
+# license that can be found in the LICENSE file.
+
+'''Semi-join reduction: pruning one side of a join using the join keys of the other side.
+
+When a small table is joined to a big one, most rows of the big table typically have no match.
+Rather than hash all of them in a merge, we first build a compact filter over the small side's
+keys and use it to drop rows of the big side that cannot possibly match.  The filter is exact (a
+set of key hashes) when the small side has few distinct keys, and a Bloom filter otherwise.  Either
+way it may keep a few rows that have no match (if keys' hashes collide, or due to the Bloom filter's
+false positives), but it never drops a row that does match, so the merge that follows computes
+exactly the same result.
+'''
+
+from typing import List, Optional, Sequence, Tuple, Union  # noqa: F401
+
+import numpy as np
+import pandas as pd
+
+from .bq_types import TypedDataFrame
+
+# Semi-join reduction is only attempted when the side to be pruned has at least this many rows;
+# for smaller tables, building the filter costs more than it saves.
+_MIN_ROWS_TO_PRUNE = 10000
+
+# A set of exact key hashes is used as the filter for up to this many distinct keys; past that, a
+# Bloom filter is used.
+_MAX_EXACT_FILTER_KEYS = 1 << 16
+
+# Bloom filter parameters.  Ten bits per key and seven hash functions give a false positive rate
+# of about 1%.
+_BLOOM_FILTER_BITS_PER_KEY = 10
+_BLOOM_FILTER_NUM_HASHES = 7
+
+
+def _normalize_key_columns(build_keys, probe_keys):
+    # type: (pd.DataFrame, pd.DataFrame) -> Optional[Tuple[pd.DataFrame, pd.DataFrame]]
+    '''Converts two sides' join keys to dtypes whose hashes are equal exactly when values are.
+
+    pandas.merge matches an integer 1 with a float 1.0, but the hashes of the two are different, so
+    numeric keys are converted to float64 on both sides.  Keys of any other mismatched dtypes aren't
+    normalized; None is returned and the caller should skip the reduction.
+
+    Args:
+        build_keys: The key columns of the side the filter is built from.
+        probe_keys: The corresponding key columns of the side being pruned.
+    Returns:
+        The normalized key columns of both sides, or None.
+    '''
+    build_columns, probe_columns = [], []
+    for i in range(len(build_keys.columns)):
+        build_column = build_keys.iloc[:, i]
+        probe_column = probe_keys.iloc[:, i]
+        if (pd.api.types.is_numeric_dtype(build_column.dtype)
+                and pd.api.types.is_numeric_dtype(probe_column.dtype)):
+            build_column = build_column.astype(np.float64)
+            probe_column = probe_column.astype(np.float64)
+        elif build_column.dtype != probe_column.dtype:
+            return None
+        build_columns.append(build_column.reset_index(drop=True))
+        probe_columns.append(probe_column.reset_index(drop=True))
+    return (pd.concat(build_columns, axis=1, ignore_index=True),
+            pd.concat(probe_columns, axis=1, ignore_index=True))
+
+
+def hash_keys(keys):
+    # type: (pd.DataFrame) -> np.ndarray
+    '''Returns one 64-bit hash per row of some key columns.'''
+    return pd.util.hash_pandas_object(keys, index=False).values
+
+
+class KeyFilter(object):
+    '''A filter over a set of key hashes, possibly with false positives but no false negatives.'''
+
+    def might_contain(self, hashes):
+        # type: (np.ndarray) -> np.ndarray
+        '''Returns a boolean array: False where a hash is definitely not in the set.'''
+        raise NotImplementedError("Abstract method, not implemented")
+
+
+class ExactKeyFilter(KeyFilter):
+    '''A filter storing the exact set of key hashes.'''
+
+    def __init__(self, unique_hashes):
+        # type: (np.ndarray) -> None
+        self.hashes = pd.Index(unique_hashes)
+
+    def might_contain(self, hashes):
+        # type: (np.ndarray) -> np.ndarray
+        return self.hashes.get_indexer(hashes) != -1
+
+
+class BloomKeyFilter(KeyFilter):
+    '''A Bloom filter over key hashes, stored as a packed bit array.
+
+    The bit positions for a key are derived from its 64-bit hash by double hashing
+    (Kirsch and Mitzenmacher, "Less Hashing, Same Performance"): position i is h1 + i * h2, where
+    h1 and h2 are the low and high 32 bits of the hash.
+    '''
+
+    def __init__(self, unique_hashes,
+                 bits_per_key=_BLOOM_FILTER_BITS_PER_KEY,
+                 num_hashes=_BLOOM_FILTER_NUM_HASHES):
+        # type: (np.ndarray, int, int) -> None
+        num_bits = 64
+        while num_bits < len(unique_hashes) * bits_per_key:
+            num_bits *= 2
+        self.mask = np.uint64(num_bits - 1)
+        self.num_hashes = num_hashes
+        self.bits = np.zeros(num_bits // 8, dtype=np.uint8)
+        for positions in self._bit_positions(unique_hashes):
+            np.bitwise_or.at(self.bits, positions >> np.uint64(3),
+                             np.left_shift(1, positions & np.uint64(7)).astype(np.uint8))
+
+    def _bit_positions(self, hashes):
+        # type: (np.ndarray) -> List[np.ndarray]
+        hashes = hashes.astype(np.uint64)
+        low = hashes & np.uint64(0xffffffff)
+        high = (hashes >> np.uint64(32)) | np.uint64(1)
+        return [(low + np.uint64(i) * high) & self.mask for i in range(self.num_hashes)]
+
+    def might_contain(self, hashes):
+        # type: (np.ndarray) -> np.ndarray
+        result = np.ones(len(hashes), dtype=bool)
+        for positions in self._bit_positions(hashes):
+            result &= ((self.bits[positions >> np.uint64(3)] >> (positions & np.uint64(7)))
+                       & 1).astype(bool)
+        return result
+
+
+def build_key_filter(hashes):
+    # type: (np.ndarray) -> KeyFilter
+    '''Builds the most appropriate filter for a set of key hashes.'''
+    unique_hashes = pd.unique(hashes)
+    if len(unique_hashes) <= _MAX_EXACT_FILTER_KEYS:
+        return ExactKeyFilter(unique_hashes)
+    return BloomKeyFilter(unique_hashes)
+
+
+def semi_join_reduce(build_table,  # type: TypedDataFrame
+                     build_columns,  # type: Sequence[str]
+                     probe_table,  # type: TypedDataFrame
+                     probe_columns  # type: Sequence[str]
+                     ):
+    # type: (...) -> TypedDataFrame
+    '''Drops rows of one table whose join keys can't match any row of another.
+
+    The reduction is only performed if the table being pruned is big enough for it to be worth it
+    and larger than the table the filter is built from; otherwise probe_table is returned as is.
+
+    Args:
+        build_table: The table whose keys are kept.
+        build_columns: Its join key columns.
+        probe_table: The table to prune.
+        probe_columns: Its join key columns, corresponding to build_columns.
+    Returns:
+        probe_table, possibly without some rows that have no match in build_table.  The remaining
+        rows are in their original order.
+    '''
+    num_probe_rows = len(probe_table.dataframe)
+    if (not build_columns or num_probe_rows < _MIN_ROWS_TO_PRUNE
+            or len(build_table.dataframe) >= num_probe_rows):
+        return probe_table
+    keys = _normalize_key_columns(build_table.dataframe[list(build_columns)],
+                                  probe_table.dataframe[list(probe_columns)])
+    if keys is None:
+        return probe_table
+    build_keys, probe_keys = keys
+    key_filter = build_key_filter(hash_keys(build_keys))
+    rows_to_keep = key_filter.might_contain(hash_keys(probe_keys))
+    if rows_to_keep.all():
+        return probe_table
+    return TypedDataFrame(probe_table.dataframe[rows_to_keep], probe_table.types)
+
+
+def reduce_pair(left_table,  # type: TypedDataFrame
+                left_columns,  # type: Sequence[str]
+                right_table,  # type: TypedDataFrame
+                right_columns,  # type: Sequence[str]
+                pandas_join_type  # type: str
+                ):
+    # type: (...) -> Tuple[TypedDataFrame, TypedDataFrame]
+    '''Prunes whichever sides of a join can be pruned without changing its result.
+
+    For an inner join, the larger side is pruned by the smaller side's keys.  For a left (right)
+    join, only the right (left) side may be pruned, since every row of the other side is kept.
+    Nothing is pruned for a full outer join.
+
+    Args:
+        left_table: The left side of the join.
+        left_columns: The left side's join key columns.
+        right_table: The right side of the join.
+        right_columns: The right side's join key columns, corresponding to left_columns.
+        pandas_join_type: 'inner', 'left', 'right' or 'outer'.
+    Returns:
+        The left and right tables, possibly pruned.
+    '''
+    larger_left = len(left_table.dataframe) > len(right_table.dataframe)
+    if pandas_join_type == 'left' or (pandas_join_type == 'inner' and not larger_left):
+        right_table = semi_join_reduce(left_table, left_columns, right_table, right_columns)
+    elif pandas_join_type in ('right', 'inner'):
+        left_table = semi_join_reduce(right_table, right_columns, left_table, left_columns)
+    return left_table, right_table
@@ -0,0 +1,97 @@
+# Copyright 2019 Verily Life Sciences LLC
+#
+# Use of this source code is governed by a BSD-style
+# license that can be found in the LICENSE file.
+
+import unittest
+
+import numpy as np
+import pandas as pd
+from ddt import data, ddt, unpack
+
+from purplequery import semi_join
+from purplequery.bq_types import BQScalarType, TypedDataFrame
+from purplequery.semi_join import (BloomKeyFilter, ExactKeyFilter, build_key_filter, hash_keys,
+                                   reduce_pair, semi_join_reduce)
+
+
+@ddt
+class SemiJoinTest(unittest.TestCase):
+
+    def setUp(self):
+        # type: () -> None
+        self.old_min_rows_to_prune = semi_join._MIN_ROWS_TO_PRUNE
+        semi_join._MIN_ROWS_TO_PRUNE = 0
+        self.small = TypedDataFrame(pd.DataFrame([[1, 'a'], [3, 'c']], columns=['k', 's']),
+                                    [BQScalarType.INTEGER, BQScalarType.STRING])
+        self.big = TypedDataFrame(
+            pd.DataFrame([[float(i), chr(ord('a') + i)] for i in range(5)], columns=['k', 's']),
+            [BQScalarType.INTEGER, BQScalarType.STRING])
+
+    def tearDown(self):
+        # type: () -> None
+        semi_join._MIN_ROWS_TO_PRUNE = self.old_min_rows_to_prune
+
+    @data(ExactKeyFilter, BloomKeyFilter)
+    def test_key_filter_has_no_false_negatives(self, filter_class):
+        build_hashes = hash_keys(pd.DataFrame({'k': np.arange(0, 20000, 2)}))
+        probe_hashes = hash_keys(pd.DataFrame({'k': np.arange(20000)}))
+
+        might_contain = filter_class(pd.unique(build_hashes)).might_contain(probe_hashes)
+
+        self.assertTrue(might_contain[::2].all())
+        # The odd keys are not in the set; all but a few false positives are filtered out.
+        self.assertLess(might_contain[1::2].mean(), 0.05)
+
+    def test_build_key_filter(self):
+        # type: () -> None
+        old_max_exact_filter_keys = semi_join._MAX_EXACT_FILTER_KEYS
+        semi_join._MAX_EXACT_FILTER_KEYS = 2
+        try:
+            self.assertIsInstance(build_key_filter(np.array([1, 2, 2], dtype=np.uint64)),
+                                  ExactKeyFilter)
+            self.assertIsInstance(build_key_filter(np.array([1, 2, 3], dtype=np.uint64)),
+                                  BloomKeyFilter)
+        finally:
+            semi_join._MAX_EXACT_FILTER_KEYS = old_max_exact_filter_keys
+
+    @data(
+        dict(build_columns=['k'], probe_columns=['k'], expected=[[1, 'b'], [3, 'd']]),
+        dict(build_columns=['k', 's'], probe_columns=['k', 's'], expected=[]),
+        dict(build_columns=['s'], probe_columns=['s'], expected=[[0, 'a'], [2, 'c']]),
+        # Integer keys can't be compared to string keys; nothing is pruned.
+        dict(build_columns=['k'], probe_columns=['s'],
+             expected=[[0, 'a'], [1, 'b'], [2, 'c'], [3, 'd'], [4, 'e']]),
+    )
+    @unpack
+    def test_semi_join_reduce(self, build_columns, probe_columns, expected):
+        result = semi_join_reduce(self.small, build_columns, self.big, probe_columns)
+
+        self.assertEqual(result.to_list_of_lists(), expected)
+        self.assertEqual(result.types, self.big.types)
+
+    def test_semi_join_reduce_small_probe_side(self):
+        # type: () -> None
+        # The filter is always built over the smaller side.
+        self.assertIs(semi_join_reduce(self.big, ['k'], self.small, ['k']), self.small)
+
+    @data(
+        dict(pandas_join_type='inner', small_is_left=True, pruned='right'),
+        dict(pandas_join_type='inner', small_is_left=False, pruned='left'),
+        dict(pandas_join_type='left', small_is_left=True, pruned='right'),
+        dict(pandas_join_type='left', small_is_left=False, pruned=None),
+        dict(pandas_join_type='right', small_is_left=False, pruned='left'),
+        dict(pandas_join_type='outer', small_is_left=True, pruned=None),
+    )
+    @unpack
+    def test_reduce_pair(self, pandas_join_type, small_is_left, pruned):
+        left, right = (self.small, self.big) if small_is_left else (self.big, self.small)
+
+        new_left, new_right = reduce_pair(left, ['k'], right, ['k'], pandas_join_type)
+
+        self.assertEqual(new_left is not left, pruned == 'left')
+        self.assertEqual(new_right is not right, pruned == 'right')
+
+
+if __name__ == '__main__':
+    unittest.main()
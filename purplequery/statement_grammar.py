@@ -30,7 +30,10 @@ statement = [
     (CreateView,
      [grammar_literal('CREATE', 'VIEW', 'IF', 'NOT', 'EXISTS'),
       grammar_literal('CREATE', 'VIEW'),
-      grammar_literal('CREATE', 'OR', 'REPLACE', 'VIEW')],
+      grammar_literal('CREATE', 'OR', 'REPLACE', 'VIEW'),
+      grammar_literal('CREATE', 'MATERIALIZED', 'VIEW', 'IF', 'NOT', 'EXISTS'),
+      grammar_literal('CREATE', 'MATERIALIZED', 'VIEW'),
+      grammar_literal('CREATE', 'OR', 'REPLACE', 'MATERIALIZED', 'VIEW')],
      separated_sequence(identifier, '.'),
      [('OPTIONS', '(',
        [separated_sequence((identifier, '=', expression), ','), None],
@@ -13,6 +13,8 @@ from .bq_abstract_syntax_tree import TableContext  # noqa: F401
 from .bq_abstract_syntax_tree import AbstractSyntaxTreeNode, Result, _EmptyNode
 from .bq_types import BQType, TypedDataFrame, implicitly_coerce  # noqa: F401
 from .dataframe_node import QueryExpression  # noqa: F401
+from .dataframe_node import table_references
+from .storage import DatasetTableContext, View
 
 
 class Statement(AbstractSyntaxTreeNode):
@@ -49,11 +51,7 @@ class CreateTable(Statement):
                           if isinstance(self.query_expression, _EmptyNode)
                           else 'CREATE_TABLE_AS_SELECT')
         result = Result(statement_type, path=self.path)
-        try:
-            table_context.lookup(self.path)
-            already_exists = True
-        except KeyError:
-            already_exists = False
+        already_exists = table_context.contains(self.path)
         if already_exists and self.create_type == 'CREATE_TABLE':
             raise ValueError('Already Exists')
         if already_exists and self.create_type == 'CREATE_TABLE_IF_NOT_EXISTS':
@@ -81,7 +79,11 @@ class CreateTable(Statement):
 
 
 class CreateView(Statement):
-    '''A CREATE VIEW Statement'''
+    '''A CREATE VIEW Statement.
+
+    The view's query is stored in the table context, and evaluated whenever the view is referenced;
+    the result of a CREATE MATERIALIZED VIEW is kept until a base table it depends on changes.
+    '''
 
     def __init__(self, create_type, path, options, query_expression):
         # type: (str, List[str], _EmptyNode, QueryExpression) -> None
@@ -93,6 +95,22 @@ class CreateView(Statement):
     def execute(self, table_context):
         # type: (TableContext) -> Result
         '''See parent class for docstring.'''
-        statement_type = 'CREATE_VIEW'
-        # TODO: Actually implement CREATE VIEW
-        return Result(statement_type, path=self.path)
+        result = Result('CREATE_VIEW', path=self.path)
+        materialized = 'MATERIALIZED' in self.create_type
+        create_type = self.create_type.replace('MATERIALIZED_', '')
+        already_exists = table_context.contains(self.path)
+        if already_exists and create_type == 'CREATE_VIEW':
+            raise ValueError('Already Exists')
+        if already_exists and create_type == 'CREATE_VIEW_IF_NOT_EXISTS':
+            return result
+        view = View(self.query_expression, table_references(self.query_expression), materialized)
+        if isinstance(table_context, DatasetTableContext):
+            project_id, dataset_id, table_id = self.path
+            cycle = table_context.dependency_chain(view.dependencies,
+                                                   (project_id, dataset_id, table_id))
+            if cycle is not None:
+                raise ValueError('View {} would depend on itself: {}'.format(
+                        '.'.join(self.path),
+                        ' -> '.join('.'.join(path) for path in [tuple(self.path)] + cycle)))
+        table_context.set(tuple(self.path), view)
+        return result
@@ -3,7 +3,7 @@
 # Use of this source code is governed by a BSD-style
 # license that can be found in the LICENSE file.
 import unittest
-from typing import List  # noqa: F401
+from typing import Any, List  # noqa: F401
 
 import pandas as pd
 from ddt import data, ddt, unpack
@@ -116,6 +116,118 @@ class StatementTest(unittest.TestCase):
         with self.assertRaisesRegexp(ValueError, error):
             node.execute(table_context)
 
+    def _execute(self, statement, table_context):
+        # type: (str, DatasetTableContext) -> None
+        node, leftover = apply_rule(statement_rule, tokenize(statement))
+        self.assertFalse(leftover)
+        assert isinstance(node, Statement)
+        node.execute(table_context)
+
+    @data(
+        dict(statement='CREATE VIEW project.dataset.view AS (SELECT a + 1 AS b FROM table)',
+             already_exists=False, expected=[[2], [3]]),
+        dict(statement='CREATE VIEW IF NOT EXISTS project.dataset.view AS (SELECT 5 AS b)',
+             already_exists=True, expected=[[1], [2]]),
+        dict(statement='CREATE OR REPLACE VIEW project.dataset.view AS (SELECT 5 AS b)',
+             already_exists=True, expected=[[5]]),
+        dict(statement=('CREATE MATERIALIZED VIEW project.dataset.view AS '
+                        '(SELECT a + 1 AS b FROM table)'),
+             already_exists=False, expected=[[2], [3]]),
+    )
+    @unpack
+    def test_create_view(self, statement, already_exists, expected):
+        # type: (str, bool, List[List[int]]) -> None
+        table_context = DatasetTableContext({'project': {'dataset': {}}})
+        table_context.set(('project', 'dataset', 'table'),
+                          TypedDataFrame(pd.DataFrame([[1], [2]], columns=['a']),
+                                         [BQScalarType.INTEGER]))
+        if already_exists:
+            self._execute('CREATE VIEW project.dataset.view AS (SELECT a AS b FROM table)',
+                          table_context)
+        self._execute(statement, table_context)
+        view, unused_name = table_context.lookup(('project', 'dataset', 'view'))
+        self.assertEqual(view.to_list_of_lists(), expected)
+
+    def test_create_view_already_exists(self):
+        # type: () -> None
+        table_context = DatasetTableContext({'project': {'dataset': {}}})
+        self._execute('CREATE VIEW project.dataset.view AS (SELECT 1 AS a)', table_context)
+        with self.assertRaisesRegexp(ValueError, 'Already Exists'):
+            self._execute('CREATE VIEW project.dataset.view AS (SELECT 2 AS a)', table_context)
+
+    def test_create_view_referencing_itself(self):
+        # type: () -> None
+        table_context = DatasetTableContext({'project': {'dataset': {}}})
+        with self.assertRaisesRegexp(ValueError, 'would depend on itself'):
+            self._execute('CREATE VIEW project.dataset.view AS '
+                          '(SELECT 1 AS a FROM project.dataset.view)', table_context)
+        self.assertNotIn('view', table_context.datasets['project']['dataset'])
+
+    def test_replace_view_creating_cycle(self):
+        # type: () -> None
+        table_context = DatasetTableContext({'project': {'dataset': {}}})
+        self._execute('CREATE VIEW project.dataset.v1 AS (SELECT 1 AS a)', table_context)
+        self._execute('CREATE VIEW project.dataset.v2 AS (SELECT a FROM project.dataset.v1)',
+                      table_context)
+        with self.assertRaisesRegexp(
+                ValueError, 'project.dataset.v1 -> project.dataset.v2 -> project.dataset.v1'):
+            self._execute('CREATE OR REPLACE VIEW project.dataset.v1 AS '
+                          '(SELECT a FROM project.dataset.v2)', table_context)
+        # The original definition of v1 is kept, so v2 still evaluates.
+        view, unused_name = table_context.lookup(('project', 'dataset', 'v2'))
+        self.assertEqual(view.to_list_of_lists(), [[1]])
+
+    def test_view_dependencies_listed_once(self):
+        # type: () -> None
+        table_context = DatasetTableContext({'project': {'dataset': {}}})
+        table_context.set(('project', 'dataset', 'table'),
+                          TypedDataFrame(pd.DataFrame([[1]], columns=['a']),
+                                         [BQScalarType.INTEGER]))
+        # lhs and rhs both read table, and top reads both of them.
+        self._execute('CREATE VIEW project.dataset.lhs AS (SELECT a FROM table)', table_context)
+        self._execute('CREATE VIEW project.dataset.rhs AS (SELECT a FROM table)', table_context)
+        self._execute('CREATE VIEW project.dataset.top AS '
+                      '(SELECT l.a FROM lhs AS l JOIN rhs AS r ON l.a = r.a)', table_context)
+        self.assertEqual(table_context.dependencies([('top',)]),
+                         [('project', 'dataset', 'top'), ('project', 'dataset', 'lhs'),
+                          ('project', 'dataset', 'table'), ('project', 'dataset', 'rhs')])
+
+    @data(
+        dict(materialized='', expected_evaluations=3),
+        dict(materialized='MATERIALIZED', expected_evaluations=2),
+    )
+    @unpack
+    def test_view_reevaluated_when_base_table_changes(self, materialized, expected_evaluations):
+        # type: (str, int) -> None
+        table_context = DatasetTableContext({'project': {'dataset': {}}})
+        table_context.set(('project', 'dataset', 'table'),
+                          TypedDataFrame(pd.DataFrame([[1], [2]], columns=['a']),
+                                         [BQScalarType.INTEGER]))
+        self._execute('CREATE {} VIEW project.dataset.inner_view AS '
+                      '(SELECT SUM(a) AS total FROM table)'.format(materialized), table_context)
+        # A view stacked on the first one depends on the same base table.
+        self._execute('CREATE {} VIEW project.dataset.outer_view AS '
+                      '(SELECT total * 10 AS total FROM inner_view)'.format(materialized),
+                      table_context)
+        inner_view = table_context.datasets['project']['dataset']['inner_view']
+        original_get_dataframe = inner_view.query.get_dataframe
+        evaluations = []
+
+        def counting_get_dataframe(*args, **kwargs):
+            # type: (*Any, **Any) -> Any
+            evaluations.append(1)
+            return original_get_dataframe(*args, **kwargs)
+        inner_view.query.get_dataframe = counting_get_dataframe
+
+        outer_view = ('project', 'dataset', 'outer_view')
+        self.assertEqual(table_context.lookup(outer_view)[0].to_list_of_lists(), [[30]])
+        self.assertEqual(table_context.lookup(outer_view)[0].to_list_of_lists(), [[30]])
+        table_context.set(('project', 'dataset', 'table'),
+                          TypedDataFrame(pd.DataFrame([[5]], columns=['a']),
+                                         [BQScalarType.INTEGER]))
+        self.assertEqual(table_context.lookup(outer_view)[0].to_list_of_lists(), [[50]])
+        self.assertEqual(len(evaluations), expected_evaluations)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -24,6 +24,16 @@ class TableContext(object):
     Contrast with EvaluationContext, whose purpose is to resolve a name to a column (TypedSeries).
     '''
 
+    # The QueryPlan (see query_plan.py) on which to record the stages of executing a query, if any.
+    plan = None  # type: Any
+
+    # The limits on the size of joins (see join.JoinLimits), or None for the default limits.
+    join_limits = None  # type: Any
+
+    # The statistics measured on the operands of a query's filters, by expression (see
+    # filter_evaluation.py), or None to measure them anew for each filter.
+    filter_statistics = None  # type: Optional[Dict[Any, Any]]
+
     def lookup(self, path):
         # type: (Sequence[str]) -> Tuple[TypedDataFrame, Optional[str]]
         '''Look up a path to a table in this context.
@@ -37,35 +47,101 @@ class TableContext(object):
         '''
         raise KeyError("Cannot resolve table `{}`".format('.'.join(path)))
 
+    def lookup_first_rows(self, path, num_rows):
+        # type: (Sequence[str], int) -> Tuple[TypedDataFrame, Optional[str]]
+        '''Look up only the first rows of a table in this context.
+
+        Args:
+            path: A sequence of strings representing a period-separated path to a table.
+            num_rows: The number of rows needed.
+
+        Returns:
+            The first num_rows rows of the table found (fewer if it is shorter), and its name.
+        '''
+        table, name = self.lookup(path)
+        return TypedDataFrame(table.dataframe.iloc[:num_rows], table.types), name
+
     def set(self, path, table):
-        # type: (Tuple[str, ...], TypedDataFrame) -> None
+        # type: (Tuple[str, ...], Union[TypedDataFrame, View]) -> None
         '''Sets a path to refer to a table.
 
         Args:
             path: A tuple of strings representing a period-separated path to a table, like
                 projectname.datasetname.tablename, or just tablename
-            table: The table to add
+            table: The table (or view) to add
         '''
         raise NotImplementedError("Abstract method, not implemented")
 
+    def contains(self, path):
+        # type: (Sequence[str]) -> bool
+        '''Returns whether a path refers to a table (or view) in this context.
+
+        Unlike lookup, this does not evaluate a view the path refers to.
+
+        Args:
+            path: A sequence of strings representing a period-separated path to a table.
+        '''
+        try:
+            self.lookup(path)
+        except KeyError:
+            return False
+        return True
+
+
+class View(object):
+    '''A view: a query stored in place of a table, and evaluated whenever it is referenced.
+
+    A materialized view keeps the result of its last evaluation, and reuses it for as long as
+    none of the tables and views it depends on (through any number of other views) has changed.
+    Tables are never modified in place - changing a table replaces the TypedDataFrame stored
+    for it - so the stored objects serve as the versions of the dependencies.
+    '''
+
+    def __init__(self, query, dependencies, materialized=False):
+        # type: (Any, Sequence[Tuple[str, ...]], bool) -> None
+        '''Constructs the view.
+
+        Args:
+            query: The QueryExpression defining the view.
+            dependencies: The paths of the tables (and views) the query refers to.
+            materialized: Whether to keep the result of evaluating the view.
+        '''
+        self.query = query
+        self.dependencies = dependencies
+        self.materialized = materialized
+        # The versions of the dependencies, and the result computed from them.
+        self.cache = None  # type: Optional[Tuple[List[Any], TypedDataFrame]]
+
 
 class DatasetTableContext(TableContext):
     '''A TableContext containing a set of datasets.'''
 
-    def __init__(self, datasets):
-        # type: (DatasetType) -> None
+    def __init__(self, datasets, plan=None, join_limits=None):
+        # type: (DatasetType, Any, Any) -> None
         '''Construct the TableContext.
 
         Args:
             datasets: A series of nested dictionaries mapping to a TypedDataFrame.
             For example, {'my_project': {'my_dataset': {'table1': t1, 'table2': t2}}},
             where t1 and t2 are two-dimensional TypeDataFrames representing a table.
+            plan: If not None, the QueryPlan on which to record the stages of executing queries.
+            join_limits: If not None, the limits on the size of joins (see join.JoinLimits).
         '''
         self.datasets = datasets
+        self.plan = plan
+        self.join_limits = join_limits
+        self.filter_statistics = {}
 
-    def lookup(self, path):
-        # type: (Sequence[str]) -> Tuple[TypedDataFrame, Optional[str]]
-        '''See TableContext.lookup for docstring.'''
+    def _resolve(self, path):
+        # type: (Sequence[str]) -> Tuple[str, str, str]
+        '''Fully qualifies a path to a table.
+
+        Args:
+            path: A sequence of strings representing a period-separated path to a table, like
+                projectname.datasetname.tablename, or just tablename
+        Returns:
+            The project, dataset and table name of the table.
+        '''
         if not self.datasets:
             raise ValueError("Attempt to look up path {} with no projects/datasets/tables given."
                              .format(path))
@@ -91,20 +167,139 @@ class DatasetTableContext(TableContext):
         if len(path) > 3:
             raise ValueError("Invalid path has more than three parts: {}".format(path))
         project_id, dataset_id, table_id = path
+        return project_id, dataset_id, table_id
+
+    def lookup(self, path):
+        # type: (Sequence[str]) -> Tuple[TypedDataFrame, Optional[str]]
+        '''See TableContext.lookup for docstring.'''
+        project_id, dataset_id, table_id = self._resolve(path)
+        table = self.datasets[project_id][dataset_id][table_id]
+        if isinstance(table, View):
+            return self._evaluate_view(table), table_id
+        return table, table_id
+
+    def lookup_first_rows(self, path, num_rows):
+        # type: (Sequence[str], int) -> Tuple[TypedDataFrame, Optional[str]]
+        '''See TableContext.lookup_first_rows for docstring.'''
+        project_id, dataset_id, table_id = self._resolve(path)
+        table = self.datasets[project_id][dataset_id][table_id]
+        if isinstance(table, View) and not table.materialized:
+            view_table, _ = table.query.get_first_rows(self, num_rows)
+            return view_table, table_id
+        return super(DatasetTableContext, self).lookup_first_rows(path, num_rows)
+
+    def contains(self, path):
+        # type: (Sequence[str]) -> bool
+        '''See TableContext.contains for docstring.'''
+        project_id, dataset_id, table_id = self._resolve(path)
+        return table_id in self.datasets.get(project_id, {}).get(dataset_id, {})
+
+    def _resolve_dependency(self, path):
+        # type: (Sequence[str]) -> Tuple[Optional[Tuple[str, str, str]], Any]
+        '''Resolves a path a view or query refers to, returning None if it can't be resolved.
+
+        Returns:
+            The fully qualified path, and the table or view stored there (None if there is none).
+        '''
+        try:
+            project_id, dataset_id, table_id = self._resolve(path)
+        except ValueError:
+            return None, None
+        return ((project_id, dataset_id, table_id),
+                self.datasets.get(project_id, {}).get(dataset_id, {}).get(table_id))
+
+    def dependencies(self, paths):
+        # type: (Sequence[Sequence[str]]) -> List[Optional[Tuple[str, str, str]]]
+        '''Finds the tables and views some paths refer to, and those the views depend on in turn.
 
-        return self.datasets[project_id][dataset_id][table_id], table_id
+        Args:
+            paths: Paths to tables or views.
+        Returns:
+            The fully qualified paths found, each once, in a fixed order, with None for each path
+            that can't be resolved (e.g. an unqualified name of a WITH clause, with several
+            datasets).
+        '''
+        dependencies = []  # type: List[Optional[Tuple[str, str, str]]]
+        visited = set()  # type: Set[Tuple[str, str, str]]
+        pending = list(reversed(paths))
+        while pending:
+            resolved, table = self._resolve_dependency(pending.pop())
+            if resolved is None:
+                dependencies.append(None)
+                continue
+            if resolved in visited:
+                continue
+            visited.add(resolved)
+            dependencies.append(resolved)
+            if isinstance(table, View):
+                pending.extend(reversed(table.dependencies))
+        return dependencies
+
+    def dependency_chain(self, paths, target):
+        # type: (Sequence[Sequence[str]], Tuple[str, str, str]) -> Optional[List[Tuple[str, str, str]]]  # noqa: E501
+        '''Finds how some paths depend on a table or view, through any number of views.
+
+        Args:
+            paths: Paths to tables or views.
+            target: The fully qualified path of a table or view.
+        Returns:
+            The paths of the views through which one of paths refers to target, ending with
+            target, or None if none of them depends on it.
+        '''
+        visited = set()  # type: Set[Tuple[str, str, str]]
+        # The paths to visit, each with the chain of views leading to it.
+        pending = []  # type: List[Tuple[Sequence[str], List[Tuple[str, str, str]]]]
+        pending.extend((path, []) for path in reversed(paths))
+        while pending:
+            path, chain = pending.pop()
+            resolved, table = self._resolve_dependency(path)
+            if resolved is None or resolved in visited:
+                continue
+            if resolved == target:
+                return chain + [resolved]
+            visited.add(resolved)
+            if isinstance(table, View):
+                pending.extend((dependency, chain + [resolved])
+                               for dependency in reversed(table.dependencies))
+        return None
+
+    def _evaluate_view(self, view):
+        # type: (View) -> TypedDataFrame
+        '''Evaluates a view, reusing its last result if it is materialized and still current.
+
+        Args:
+            view: The view to evaluate.
+        Returns:
+            The table of data the view's query results in.
+        '''
+        if not view.materialized:
+            table, _ = view.query.get_dataframe(self)
+            return table
+        versions = [None if path is None
+                    else self.datasets.get(path[0], {}).get(path[1], {}).get(path[2])
+                    for path in self.dependencies(view.dependencies)]
+        if view.cache is not None:
+            cached_versions, cached_table = view.cache
+            if (len(cached_versions) == len(versions) and
+                    all(cached is current for cached, current in zip(cached_versions, versions))):
+                return cached_table
+        table, _ = view.query.get_dataframe(self)
+        view.cache = (versions, table)
+        return table
 
     def set(self, path, table):
-        # type: (Tuple[str, ...], TypedDataFrame) -> None
+        # type: (Tuple[str, ...], Union[TypedDataFrame, View]) -> None
         '''Sets a path to refer to a table.
 
         Args:
             path: A tuple of strings representing a period-separated path to a table, like
                 projectname.datasetname.tablename
-            table: The table to add
+            table: The table (or view) to add
          '''
         project_id, dataset_id, table_id = path
         if project_id not in self.datasets:
             raise ValueError("Attempting to create {!r} but project {!r} not created"
                              .format(path, project_id))
-        self.datasets[project_id].setdefault(dataset_id, {})[table_id] = table
+        # Views are stored alongside the tables.
+        tables = self.datasets[project_id].setdefault(dataset_id, {})  # type: Dict[str, Any]
+        tables[table_id] = table
@@ -33,12 +33,20 @@ for version in 2 3.6 3.7 3.5; do
   python$version -m purplequery.bq_operator_test
   python$version -m purplequery.bq_types_test
   python$version -m purplequery.client_test
+  python$version -m purplequery.constant_folding_test
   python$version -m purplequery.dataframe_node_test
+  python$version -m purplequery.dry_run_test
   python$version -m purplequery.evaluatable_node_test
+  python$version -m purplequery.filter_evaluation_test
+  python$version -m purplequery.fused_arithmetic_test
   python$version -m purplequery.grammar_test
+  python$version -m purplequery.instrumentation_test
+  python$version -m purplequery.join_order_test
   python$version -m purplequery.join_test
   python$version -m purplequery.query_helper_test
+  python$version -m purplequery.query_plan_test
   python$version -m purplequery.query_test
+  python$version -m purplequery.semi_join_test
   python$version -m purplequery.statement_grammar_test
   python$version -m purplequery.statements_test
   python$version -m purplequery.terminals_test